@@ -1,5 +1,7 @@
 import contextlib
 import json
+import re
+from array import array
 
 import cv2
 import pandas as pd
@@ -281,8 +283,16 @@ def convert_ath_json(json_dir):  # dir contains json annotations and images
 
 
 def convert_coco_json(
-    json_dir="../coco/annotations/", use_segments=False, cls91to80=False
+    json_dir="../coco/annotations/",
+    use_segments=False,
+    cls91to80=False,
+    streaming=False,
 ):
+    # streaming=True parses the annotations incrementally and converts the boxes in one vectorized
+    # pass (see convert_coco_json_streaming), the labels are the same
+    assert not (
+        streaming and use_segments
+    ), "Segments are not supported in streaming mode"
     save_dir = make_dirs()  # output directory
     coco80 = coco91_to_coco80_class()
 
@@ -292,6 +302,9 @@ def convert_coco_json(
             Path(save_dir) / "labels" / json_file.stem.replace("instances_", "")
         )  # folder name
         fn.mkdir()
+        if streaming:
+            convert_coco_json_streaming(json_file, fn, cls91to80)
+            continue
         with open(json_file) as f:
             data = json.load(f)
 
@@ -359,6 +372,144 @@ def convert_coco_json(
                     file.write(("%g " * len(line)).rstrip() % line + "\n")
 
 
+WHITESPACE = re.compile(r"\s*")
+
+
+def iter_json_arrays(file, keys, chunk_size=1 << 20):
+    # Yield (key, element) for the elements of the top-level arrays `keys` of a JSON object read in chunks,
+    # other values are decoded and dropped. Memory is bounded by the chunk and the largest element
+    decoder = json.JSONDecoder()
+    buf, pos, eof = "", 0, False
+
+    def read():
+        nonlocal buf, pos, eof
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buf, pos = buf[pos:] + chunk, 0
+
+    def peek():  # skip whitespace, return the next character
+        nonlocal pos
+        while True:
+            pos = WHITESPACE.match(buf, pos).end()
+            if pos < len(buf):
+                return buf[pos]
+            if eof:
+                raise ValueError(f"Unexpected end of {file.name}")
+            read()
+
+    def decode():
+        nonlocal pos
+        while True:
+            try:
+                value, end = decoder.raw_decode(buf, pos)
+                # a number at the end of the buffer may be cut, decode it with the next chunk
+                if end < len(buf) or eof:
+                    pos = end
+                    return value
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+            read()
+
+    assert peek() == "{", f"{file.name} is not a JSON object"
+    pos += 1
+    while peek() != "}":
+        key = decode()
+        assert peek() == ":"
+        pos += 1
+        if peek() == "[" and key in keys:
+            pos += 1
+            while peek() != "]":
+                yield key, decode()
+                if peek() == ",":
+                    pos += 1
+            pos += 1
+        else:
+            decode()
+        if peek() == ",":
+            pos += 1
+
+
+def coco_json_labels(json_file, cls91to80=False):
+    # Yield (label file name, YOLO labels) of every annotated image in a COCO json, the labels are the same as
+    # in convert_coco_json. The annotations are parsed incrementally into flat arrays, all boxes are normalized
+    # at once, grouped by label file with a stable sort and deduplicated per image with hashing
+    image_ids, sizes, names = array("q"), array("d"), []  # id, (width, height), name
+    ann_image_ids, categories, crowd = array("q"), array("q"), array("b")
+    boxes = array("d")
+    with open(json_file) as f:
+        for key, x in tqdm(
+            iter_json_arrays(f, ("images", "annotations")), desc=f"Parsing {json_file}"
+        ):
+            if key == "images":
+                image_ids.append(x["id"])
+                sizes.extend((x["width"], x["height"]))
+                names.append(x["file_name"].split("/")[1])
+            else:
+                ann_image_ids.append(x["image_id"])
+                categories.append(x["category_id"])
+                crowd.append(x["iscrowd"])
+                boxes.extend(x["bbox"])
+    if not ann_image_ids:
+        return
+
+    # Image of every annotation
+    image_ids = np.frombuffer(image_ids, dtype=np.int64)
+    ann_image_ids = np.frombuffer(ann_image_ids, dtype=np.int64)
+    order = np.argsort(image_ids)
+    idx = order[
+        np.searchsorted(image_ids, ann_image_ids, sorter=order).clip(
+            max=len(image_ids) - 1
+        )
+    ]
+    assert (image_ids[idx] == ann_image_ids).all(), "Annotations of unknown images"
+
+    # The COCO box format is [top left x, top left y, width, height]
+    box = np.frombuffer(boxes, dtype=np.float64).reshape(-1, 4).copy()
+    box[:, :2] += box[:, 2:] / 2  # xy top-left corner to center
+    wh = np.frombuffer(sizes, dtype=np.float64).reshape(-1, 2)[idx]
+    box /= np.tile(wh, 2)  # normalize x, w by width and y, h by height
+    cls = np.frombuffer(categories, dtype=np.int64) - 1
+    if cls91to80:
+        coco80 = np.array([-1 if c is None else c for c in coco91_to_coco80_class()])
+        cls = coco80[cls]
+    keep = (
+        (np.frombuffer(crowd, dtype=np.int8) == 0)
+        & (box[:, 2] > 0)
+        & (box[:, 3] > 0)
+        & (cls >= 0)
+    )
+    rows = np.column_stack([cls, box])
+    keep[keep] = (
+        ~pd.DataFrame(rows[keep]).assign(image=idx[keep]).duplicated().to_numpy()
+    )
+
+    # Images with annotations but no boxes get empty labels as in convert_coco_json. Images with the same
+    # file name in different folders share a label file, convert_coco_json appends to it: their labels
+    # follow each other in the order of the first annotation of every image
+    label_names, name_ids = np.unique(
+        [str(Path(name).with_suffix(".txt")) for name in names], return_inverse=True
+    )
+    first_ann = np.full(len(names), len(idx))
+    np.minimum.at(first_ann, idx, np.arange(len(idx)))
+    order = np.lexsort((first_ann[idx], name_ids[idx]))
+    bounds = np.flatnonzero(np.diff(name_ids[idx][order])) + 1
+    for group in np.split(order, bounds):
+        lines = rows[group[keep[group]]]
+        labels = ("%g %g %g %g %g\n" * len(lines)) % tuple(lines.ravel().tolist())
+        yield str(label_names[name_ids[idx[group[0]]]]), labels
+
+
+def convert_coco_json_streaming(json_file, fn, cls91to80=False):
+    # Same labels as convert_coco_json (see coco_json_labels), every label file is written once, the labels of
+    # images with the same file name in different folders are merged by coco_json_labels
+    for label_name, labels in tqdm(
+        coco_json_labels(json_file, cls91to80), desc=f"Writing {json_file}"
+    ):
+        with open(fn / label_name, "w") as file:
+            file.write(labels)
+
+
 def min_index(arr1, arr2):
     """Find a pair of indexes with the shortest distance.
     Args:
@@ -0,0 +1,275 @@
+"""
+Processes many videos with a pool of worker processes, each holding one loaded model.
+Finished videos are recorded in a progress manifest, so an interrupted run resumes where it stopped.
+
+Usage (from the `experiments` directory):
+    python batch_runner.py videos/ --output-dir annotated/ --workers 4 --checkpoint best.pt
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+VIDEO_EXTENSIONS = {".mov", ".avi", ".mp4", ".mpg", ".mpeg", ".m4v", ".wmv", ".mkv"}
+
+_detector = None  # one detector per worker process
+
+
+def list_videos(source: str) -> List[str]:
+    """
+    Lists videos to process
+    :param source: Directory with videos or a manifest file with one video path per line
+    :return: Sorted list of video paths
+    """
+    if os.path.isdir(source):
+        return sorted(
+            os.path.join(source, fname)
+            for fname in os.listdir(source)
+            if os.path.splitext(fname)[1].lower() in VIDEO_EXTENSIONS
+        )
+    with open(source) as f:
+        return sorted(line.strip() for line in f if line.strip())
+
+
+def output_names(videos: List[str]) -> Dict[str, str]:
+    """
+    Names the outputs by the video paths relative to the common directory of the videos, so videos
+    with the same file name in different directories don't overwrite each other's outputs
+    :param videos: Video paths
+    :return: Output names without extension by video path
+    """
+    if not videos:
+        return {}
+    root = os.path.commonpath(
+        [os.path.dirname(os.path.abspath(video)) for video in videos]
+    )
+    return {
+        video: os.path.splitext(os.path.relpath(os.path.abspath(video), root))[0]
+        for video in videos
+    }
+
+
+def load_progress(manifest_path: str) -> Dict[str, Dict[str, Any]]:
+    """
+    Reads the progress manifest
+    :param manifest_path: Path to the jsonl manifest
+    :return: Records of finished videos by video path
+    """
+    done = {}
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            for line in f:
+                # the last line may be cut by an interruption
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                if record.get("status") == "done":
+                    done[record["video"]] = record
+    return done
+
+
+def _init_worker(
+    threads: int,
+    checkpoint_path: str,
+    signs_path: str,
+    labels_path: str,
+    compiled_path: str,
+):
+    """
+    Loads the model and the mapping once per worker process
+    """
+    global _detector
+    import cv2
+    import torch
+    from startup import load_detector
+
+    # every worker gets its share of the cores instead of all of them
+    torch.set_num_threads(threads)
+    cv2.setNumThreads(threads)
+    _detector, _ = load_detector(
+        checkpoint_path, signs_path, labels_path, compiled_path, cache=True
+    )
+
+
+def _process(video_path: str, name: str, output_dir: str, options: Dict[str, Any]):
+    """
+    Processes one video in a worker process
+    :param name: Output name of the video (see `output_names`)
+    :return: Progress record of the video
+    """
+    path = os.path.join(output_dir, name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    output = options.get("output", "video")
+    if output == "video":
+        options = dict(options, saving_path=f"{path}.mp4")
+    elif output == "clips":
+        options = dict(options, saving_path=path)
+    else:
+        suffix = ".jsonl" if output == "jsonl" else ""
+        options = dict(options, detections_path=f"{path}{suffix}")
+    stats = _detector.process_video(video_path, **options)
+    return {
+        "video": video_path,
+        "output": name,
+        "status": "done",
+        "frames": stats["frames"],
+        "seconds": stats["seconds"],
+        "worker": os.getpid(),
+    }
+
+
+def run(
+    videos: List[str],
+    output_dir: str,
+    manifest_path: str,
+    workers: int,
+    threads_per_worker: int,
+    checkpoint_path: str,
+    signs_path: str,
+    labels_path: str,
+    compiled_path: str = None,
+    options: Dict[str, Any] = None,
+) -> Dict[str, Any]:
+    """
+    Processes the videos which are not marked as done in the manifest
+    :param videos: Video paths
+    :param output_dir: Directory for the annotated videos or detections
+    :param manifest_path: Path to the jsonl progress manifest
+    :param workers: Number of worker processes
+    :param threads_per_worker: Torch threads in each worker
+    :param checkpoint_path: Path to the model checkpoint
+    :param signs_path: Path to the csv table with sign codes and names
+    :param labels_path: Path to the file containing labels
+    :param compiled_path: Path of the compiled mapping artifact
+    :param options: Keyword arguments of `Detector.process_video`
+    :return: Summary of the run
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    done = load_progress(manifest_path)
+    # named among all the videos, not only the remaining ones, so a resumed run keeps the names
+    names = output_names(videos)
+    todo = [video for video in videos if video not in done]
+    logging.info(
+        f"{len(videos)} videos, {len(done)} already done, {len(todo)} to process"
+    )
+    frames = 0
+    failed = 0
+    worker_frames = {}
+    start = time.perf_counter()
+    with open(manifest_path, "a") as manifest, ProcessPoolExecutor(
+        max_workers=workers,
+        initializer=_init_worker,
+        initargs=(
+            threads_per_worker,
+            checkpoint_path,
+            signs_path,
+            labels_path,
+            compiled_path,
+        ),
+    ) as pool:
+        futures = {
+            pool.submit(_process, video, names[video], output_dir, options or {}): video
+            for video in todo
+        }
+        for future in as_completed(futures):
+            try:
+                record = future.result()
+            except Exception as e:
+                logging.exception(f"Failed to process {futures[future]}")
+                record = {"video": futures[future], "status": "failed", "error": str(e)}
+                failed += 1
+            else:
+                frames += record["frames"]
+                worker_frames[record["worker"]] = (
+                    worker_frames.get(record["worker"], 0) + record["frames"]
+                )
+            manifest.write(json.dumps(record) + "\n")
+            manifest.flush()
+    elapsed = time.perf_counter() - start
+    summary = {
+        "workers": workers,
+        "threads_per_worker": threads_per_worker,
+        "videos": len(todo) - failed,
+        "failed": failed,
+        "frames": frames,
+        "seconds": elapsed,
+        "fps": frames / elapsed if elapsed > 0 else 0.0,
+        "fps_per_worker": frames / elapsed / workers if elapsed > 0 else 0.0,
+        "frames_by_worker": worker_frames,
+    }
+    logging.info(
+        f"{summary['videos']} videos, {frames} frames in {elapsed:.1f}s: {summary['fps']:.2f} frames/s with {workers} workers"
+    )
+    return summary
+
+
+def save_summary(summary: Dict[str, Any], summary_path: str):
+    """
+    Adds the run summary to a json file which keeps one entry per worker count
+    """
+    summaries = {}
+    if os.path.exists(summary_path):
+        with open(summary_path) as f:
+            summaries = json.load(f)
+    summaries[str(summary["workers"])] = summary
+    with open(summary_path, "w") as f:
+        json.dump(summaries, f, indent=2)
+    logging.info(f"Summary saved to {summary_path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("source", help="Directory with videos or a file listing them")
+    parser.add_argument("--output-dir", default="annotated")
+    parser.add_argument(
+        "--manifest", help="Progress manifest, <output-dir>/progress.jsonl by default"
+    )
+    parser.add_argument(
+        "--summary", help="Summary file, <output-dir>/summary.json by default"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--threads-per-worker", type=int)
+    parser.add_argument("--checkpoint", default="yolov8m.pt")
+    parser.add_argument("--signs", default="traffic_signs.csv")
+    parser.add_argument("--labels", default=os.path.join("rtsd-dataset", "labels.txt"))
+    parser.add_argument("--compiled-mapping", default="mapping.compiled.json")
+    parser.add_argument(
+        "--output", choices=["video", "jsonl", "npz", "clips"], default="video"
+    )
+    parser.add_argument("--batch-size", type=int, default=1)
+    parser.add_argument("--conf", type=float, default=0.5)
+    args = parser.parse_args()
+
+    threads = args.threads_per_worker or max(1, os.cpu_count() // args.workers)
+    summary = run(
+        list_videos(args.source),
+        args.output_dir,
+        args.manifest or os.path.join(args.output_dir, "progress.jsonl"),
+        args.workers,
+        threads,
+        args.checkpoint,
+        args.signs,
+        args.labels,
+        args.compiled_mapping,
+        options={
+            "output": args.output,
+            "batch_size": args.batch_size,
+            "conf": args.conf,
+        },
+    )
+    if summary["videos"]:
+        save_summary(
+            summary, args.summary or os.path.join(args.output_dir, "summary.json")
+        )
+
+
+if __name__ == "__main__":
+    main()
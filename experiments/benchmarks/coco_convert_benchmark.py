@@ -0,0 +1,139 @@
+"""
+Compares `convert_coco_json` with its streaming mode on an RTSD-sized synthetic `train_anno.json`
+(about 54k frames with 2 signs each by default). Every mode runs in its own process and reports the
+wall time and the peak resident memory above the memory after the imports. The label files of the
+modes are compared byte by byte.
+
+Usage (from the `experiments` directory):
+    python benchmarks/coco_convert_benchmark.py --images 54000 --anns-per-image 2
+"""
+
+import argparse
+import hashlib
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+JSON2YOLO_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(BENCHMARKS_DIR)), "JSON2YOLO"
+)
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MODES = {"load": False, "streaming": True}
+
+
+def _peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def run_mode(args: argparse.Namespace):
+    """
+    Converts the annotations in the current process and prints the measurements as json
+    """
+    sys.path.insert(0, JSON2YOLO_DIR)
+    import general_json2yolo
+
+    # tqdm output of the converter is not interesting here
+    general_json2yolo.tqdm = lambda iterable, **kwargs: iterable
+    os.chdir(args.workdir)
+    baseline = _peak_rss_mb()
+    start = time.perf_counter()
+    general_json2yolo.convert_coco_json(args.json_dir, streaming=MODES[args.mode])
+    elapsed = time.perf_counter() - start
+    print(
+        json.dumps(
+            {
+                "seconds": elapsed,
+                "peak_rss_mb": _peak_rss_mb(),
+                "peak_rss_above_imports_mb": _peak_rss_mb() - baseline,
+            }
+        )
+    )
+
+
+def labels_digest(labels_dir: str) -> str:
+    """
+    :return: Hash of the names and contents of all label files
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for root, _, fnames in sorted(os.walk(labels_dir)):
+        for fname in sorted(fnames):
+            digest.update(fname.encode())
+            with open(os.path.join(root, fname), "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--images", type=int, default=54000)
+    parser.add_argument("--anns-per-image", type=int, default=2)
+    parser.add_argument("--output", help="Path to save the report as json")
+    parser.add_argument("--mode", choices=list(MODES), help=argparse.SUPPRESS)
+    parser.add_argument("--json-dir", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args)
+        return
+
+    sys.path.append(BENCHMARKS_DIR)
+    from run_benchmarks import _labels
+    from synthetic import coco_json
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        json_dir = os.path.join(tmp_dir, "annotations")
+        os.makedirs(json_dir)
+        json_path = os.path.join(json_dir, "train_anno.json")
+        coco_json(json_path, _labels(), args.images, args.anns_per_image)
+        logging.info(
+            f"{args.images} images, {args.images * args.anns_per_image} annotations, "
+            f"{os.path.getsize(json_path) / 2**20:.1f} MB of json"
+        )
+        for mode in MODES:
+            workdir = os.path.join(tmp_dir, mode)
+            os.makedirs(workdir)
+            output = subprocess.run(
+                [
+                    sys.executable,
+                    os.path.abspath(__file__),
+                    "--mode",
+                    mode,
+                    "--json-dir",
+                    json_dir,
+                    "--workdir",
+                    workdir,
+                ],
+                capture_output=True,
+                text=True,
+                check=True,
+            ).stdout
+            report[mode] = json.loads(output.strip().splitlines()[-1])
+            report[mode]["labels"] = labels_digest(
+                os.path.join(workdir, "new_dir", "labels")
+            )
+            logging.info(
+                f"{mode}: {report[mode]['seconds']:.2f} s, "
+                f"peak RSS {report[mode]['peak_rss_mb']:.0f} MB "
+                f"(+{report[mode]['peak_rss_above_imports_mb']:.0f} MB over the imports)"
+            )
+    same = len({result["labels"] for result in report.values()}) == 1
+    logging.info(f"Labels are {'identical' if same else 'DIFFERENT'}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,153 @@
+"""
+Compares the allocator churn of the decode → annotate → encode loop with and without the frame pool
+on a synthetic 1080p video. The model is left out: detections are synthetic, so the numbers show only
+the cost of the frames themselves. Every mode runs in its own process and reports frames per second,
+minor page faults per frame (every fresh 1080p array is a new mmap, so this counts the allocations),
+garbage collections and peak / final resident memory.
+
+Usage (from the `experiments` directory):
+    python benchmarks/frame_pool_benchmark.py --frames 300
+"""
+
+import argparse
+import gc
+import json
+import logging
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from frame_pool import FramePool, memory_stats
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# (frame pool, renderer)
+MODES = {
+    "read+plot": (False, False),
+    "read+renderer": (False, True),
+    "pool+plot": (True, False),
+    "pool+renderer": (True, True),
+}
+
+
+def run_mode(args: argparse.Namespace) -> dict:
+    import torch
+    from renderer import OverlayRenderer
+    from renderer_benchmark import synthetic_boxes
+    from ultralytics.engine.results import Results
+
+    pooled, use_renderer = MODES[args.mode]
+    with open(args.mapping) as f:
+        names = list(json.load(f).values())
+    names_dict = dict(enumerate(names))
+    renderer = OverlayRenderer()
+    rng = np.random.default_rng(0)
+    boxes = [
+        synthetic_boxes(rng, args.boxes, args.width, args.height, len(names))
+        for _ in range(32)
+    ]
+
+    cap = cv2.VideoCapture(args.video)
+    writer = cv2.VideoWriter(
+        os.path.join(os.path.dirname(args.result), "out.mp4"),
+        cv2.VideoWriter_fourcc(*"mp4v"),
+        30,
+        (args.width, args.height),
+    )
+    pool = FramePool.for_capture(cap, 2) if pooled else None
+    torch.set_num_threads(1)
+    gc.collect()
+    collections = sum(stats["collections"] for stats in gc.get_stats())
+    faults = resource.getrusage(resource.RUSAGE_SELF).ru_minflt
+    frames = 0
+    start = time.perf_counter()
+    while True:
+        if pool is not None:
+            frame = pool.read(cap)
+        else:
+            success, frame = cap.read()
+            frame = frame if success else None
+        if frame is None:
+            break
+        frame_boxes = boxes[frames % len(boxes)]
+        if use_renderer:
+            annotated = renderer.render(frame, frame_boxes, names)
+        else:
+            annotated = Results(
+                orig_img=frame, path="", names=names_dict, boxes=frame_boxes
+            ).plot()
+        writer.write(annotated)
+        if pool is not None:
+            pool.release(frame)
+        frames += 1
+    elapsed = time.perf_counter() - start
+    cap.release()
+    writer.release()
+    return {
+        "frames": frames,
+        "fps": frames / elapsed,
+        "page_faults_per_frame": (
+            resource.getrusage(resource.RUSAGE_SELF).ru_minflt - faults
+        )
+        / frames,
+        "gc_collections": sum(stats["collections"] for stats in gc.get_stats())
+        - collections,
+        **memory_stats(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mapping", default=os.path.join("utils", "mapping.json"))
+    parser.add_argument("--frames", type=int, default=300)
+    parser.add_argument("--boxes", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--output", help="Path to save the report as json")
+    # internal: run a single mode and save its result
+    parser.add_argument("--mode", help=argparse.SUPPRESS)
+    parser.add_argument("--video", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.mode:
+        with open(args.result, "w") as f:
+            json.dump(run_mode(args), f)
+        return
+
+    from synthetic import write_video
+
+    report = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        video = write_video(
+            os.path.join(workdir, "video.mp4"), args.frames, args.width, args.height
+        )
+        for mode in MODES:
+            result_path = os.path.join(workdir, "result.json")
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__)]
+                + ["--mapping", os.path.abspath(args.mapping)]
+                + ["--boxes", str(args.boxes)]
+                + ["--width", str(args.width), "--height", str(args.height)]
+                + ["--mode", mode, "--video", video, "--result", result_path],
+                check=True,
+            )
+            with open(result_path) as f:
+                report[mode] = json.load(f)
+            logging.info(f"{mode}: {report[mode]}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Measures the images/s of the ultralytics data loader on a synthetic split of dash-cam-like frames
+read from loose files, from their pack and from the letterbox cache at the training size
+(see `utils/packed_dataset.py`):
+
+- train: mosaic and the other training augmentations, as in `model.train`;
+- val: no augmentation, square batches, as in `model.val`;
+- val_rect: no augmentation, rectangular batches, as in the validation during `model.train`
+  (`PackedDetectionTrainer`). Loose and packed 16:9 frames form imgsz x 0.6 imgsz batches,
+  the letterboxed ones stay imgsz x imgsz, so the model gets more pixels per image.
+
+Every loader does one pass over the split, the first batch (worker start-up) is not timed.
+Besides images/s the report has the mean model input pixels per image of every loader.
+
+Usage (from the `experiments` directory):
+    python benchmarks/letterbox_cache_benchmark.py --images 1000 --imgsz 640 --workers 4
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Dict, Tuple
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCHMARKS_DIR)
+sys.path.append(os.path.join(os.path.dirname(BENCHMARKS_DIR), "utils"))
+from packed_dataset import build_packed_dataset, letterbox_split, pack_split
+from synthetic import yolo_split
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def loader_rate(loader) -> Tuple[float, float]:
+    """
+    :return: Images per second of one pass without the first batch, mean input pixels per image
+    """
+    batches = iter(loader)
+    next(batches)
+    images, pixels, start = 0, 0, time.perf_counter()
+    for batch in batches:
+        images += len(batch["im_file"])
+        pixels += batch["img"].shape[0] * batch["img"].shape[2] * batch["img"].shape[3]
+    return images / (time.perf_counter() - start), pixels / images
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--images", type=int, default=1000)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch", type=int, default=16)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--output", help="Path to save the report as json")
+    args = parser.parse_args()
+
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import build_dataloader, build_yolo_dataset
+
+    num_classes = 156
+    data = {"names": {i: str(i) for i in range(num_classes)}}
+    cfg = get_cfg(overrides={"imgsz": args.imgsz})
+    report: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        split_dir = os.path.join(tmp_dir, "split")
+        yolo_split(split_dir, args.images, num_classes, args.width, args.height)
+        pack_split(split_dir, f"{split_dir}.pack", num_classes)
+        start = time.perf_counter()
+        letterbox_split(
+            f"{split_dir}.pack", f"{split_dir}.letterbox", args.imgsz, num_classes
+        )
+        report["letterbox"] = {
+            "seconds": time.perf_counter() - start,
+            "mb": os.path.getsize(os.path.join(f"{split_dir}.letterbox", "images.npy"))
+            / 2**20,
+        }
+        sources = {
+            "loose": (build_yolo_dataset, split_dir),
+            "pack": (build_packed_dataset, f"{split_dir}.pack"),
+            "letterbox": (build_packed_dataset, f"{split_dir}.letterbox"),
+        }
+        # mode: (dataset mode, rectangular batches)
+        modes = {
+            "train": ("train", False),
+            "val": ("val", False),
+            "val_rect": ("val", True),
+        }
+        for mode, (split_mode, rect) in modes.items():
+            report[mode], report[f"{mode}_pixels"] = {}, {}
+            for name, (build, path) in sources.items():
+                dataset = build(cfg, path, args.batch, data, mode=split_mode, rect=rect)
+                loader = build_dataloader(
+                    dataset, args.batch, args.workers, shuffle=split_mode == "train"
+                )
+                report[mode][name], report[f"{mode}_pixels"][name] = loader_rate(loader)
+    logging.info(
+        f"Letterbox cache: {report['letterbox']['seconds']:.1f} s, {report['letterbox']['mb']:.0f} MB"
+    )
+    for mode in modes:
+        logging.info(
+            f"{mode}: "
+            + ", ".join(
+                f"{name} {rate:.0f} images/s ({report[f'{mode}_pixels'][name] / 1000:.0f}k pixels)"
+                for name, rate in report[mode].items()
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+"""
+Load generator for `server.py`: sends /detect requests from a number of concurrent keep-alive clients
+and reports throughput and latency percentiles for every concurrency level. Pass several servers
+to compare them, e.g. the one-request-one-forward baseline and micro-batching:
+
+    python server.py --port 8081 --max-batch-size 1
+    python server.py --port 8082 --max-batch-size 8 --max-wait-ms 5
+    python benchmarks/load_generator.py --servers baseline=http://127.0.0.1:8081 batched=http://127.0.0.1:8082 \
+        --concurrency 1 4 16 32 --requests 200
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List, Tuple
+from urllib.parse import urlsplit
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+async def _client(
+    host: str,
+    port: int,
+    image: bytes,
+    counter: List[int],
+    latencies: List[float],
+):
+    """
+    Sends requests over one keep-alive connection until `counter` reaches zero
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    request = (
+        f"POST /detect HTTP/1.1\r\nHost: {host}\r\n"
+        f"Content-Type: application/octet-stream\r\nContent-Length: {len(image)}\r\n\r\n"
+    ).encode() + image
+    try:
+        while counter[0] > 0:
+            counter[0] -= 1
+            start = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            assert b" 200 " in status, status
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_level(
+    url: str, image: bytes, concurrency: int, requests: int
+) -> Dict[str, Any]:
+    """
+    :param url: Server url
+    :param image: Encoded image sent with every request
+    :param concurrency: Number of concurrent clients
+    :param requests: Total number of requests
+    :return: Throughput and latency percentiles in milliseconds
+    """
+    address = urlsplit(url)
+    counter = [requests]
+    latencies: List[float] = []
+    start = time.perf_counter()
+    await asyncio.gather(
+        *[
+            _client(address.hostname, address.port, image, counter, latencies)
+            for _ in range(concurrency)
+        ]
+    )
+    elapsed = time.perf_counter() - start
+    p50, p90, p99 = np.percentile(np.array(latencies) * 1000, [50, 90, 99])
+    return {
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "throughput": len(latencies) / elapsed,
+        "p50_ms": p50,
+        "p90_ms": p90,
+        "p99_ms": p99,
+    }
+
+
+def _parse_servers(servers: List[str]) -> List[Tuple[str, str]]:
+    parsed = []
+    for server in servers:
+        name, _, url = server.rpartition("=")
+        parsed.append((name or url, url))
+    return parsed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument(
+        "--servers",
+        nargs="+",
+        default=["http://127.0.0.1:8080"],
+        help="Server urls, optionally named: name=url",
+    )
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 32])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument(
+        "--image", help="Image sent with the requests, a synthetic frame by default"
+    )
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--output", help="Path to save the report as json")
+    args = parser.parse_args()
+
+    if args.image:
+        with open(args.image, "rb") as f:
+            image = f.read()
+    else:
+        sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+        from synthetic import dashcam_frame
+
+        frame = dashcam_frame(np.random.default_rng(0), args.width, args.height)
+        image = cv2.imencode(".jpg", frame)[1].tobytes()
+
+    report = {}
+    for name, url in _parse_servers(args.servers):
+        report[name] = []
+        # warm-up requests are not measured
+        asyncio.run(run_level(url, image, 1, 3))
+        for concurrency in args.concurrency:
+            level = asyncio.run(
+                run_level(url, image, concurrency, max(args.requests, concurrency))
+            )
+            report[name].append(level)
+            logging.info(
+                f"{name} c={concurrency}: {level['throughput']:.1f} req/s, p50 {level['p50_ms']:.1f} ms, p99 {level['p99_ms']:.1f} ms"
+            )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""
+Compares FP32 PyTorch, FP32 ONNX Runtime and INT8 ONNX Runtime on CPU latency, batched throughput
+(`--batch-size` images per call) and mAP.
+
+Usage (from the `experiments` directory, after `DataPreprocessor.preprocess`):
+    python benchmarks/onnx_benchmark.py --checkpoint runs/detect/yolov8m/weights/best.pt --data trafic_signs.yaml
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from utils.onnx_backend import IMAGE_EXTENSIONS
+from utils.project_utils import get_model
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--checkpoint", required=True)
+    parser.add_argument("--data", default="trafic_signs.yaml")
+    parser.add_argument(
+        "--images", default=os.path.join("datasets", "val_annotation", "images")
+    )
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--latency-images", type=int, default=100)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--calibration-images", type=int, default=200)
+    parser.add_argument("--skip-map", action="store_true", help="Measure latency only")
+    parser.add_argument("--output", help="Path to save the report as json")
+    args = parser.parse_args()
+
+    backends = {
+        "torch-fp32": dict(backend="torch"),
+        "ort-fp32": dict(backend="onnx", imgsz=args.imgsz),
+        "ort-int8": dict(
+            backend="onnx",
+            imgsz=args.imgsz,
+            int8=True,
+            calibration_dir=args.images,
+            num_calibration_images=args.calibration_images,
+        ),
+    }
+    fnames = sorted(
+        fname
+        for fname in os.listdir(args.images)
+        if os.path.splitext(fname)[1].lower() in IMAGE_EXTENSIONS
+    )[: args.latency_images]
+    images = [cv2.imread(os.path.join(args.images, fname)) for fname in fnames]
+
+    report = {}
+    for name, kwargs in backends.items():
+        model = get_model(checkpoint_path=args.checkpoint, **kwargs)
+        model(images[0], verbose=False, imgsz=args.imgsz, device="cpu")  # warm-up
+        latencies = []
+        for image in images:
+            start = time.perf_counter()
+            model(image, verbose=False, imgsz=args.imgsz, device="cpu")
+            latencies.append(1000 * (time.perf_counter() - start))
+        report[name] = {
+            "latency_ms_mean": float(np.mean(latencies)),
+            "latency_ms_p50": float(np.percentile(latencies, 50)),
+            "latency_ms_p99": float(np.percentile(latencies, 99)),
+        }
+        start = time.perf_counter()
+        for i in range(0, len(images), args.batch_size):
+            model(
+                images[i : i + args.batch_size],
+                verbose=False,
+                imgsz=args.imgsz,
+                device="cpu",
+            )
+        report[name][f"batch{args.batch_size}_images_per_s"] = len(images) / (
+            time.perf_counter() - start
+        )
+        if not args.skip_map:
+            metrics = model.val(
+                data=args.data, imgsz=args.imgsz, batch=1, device="cpu", plots=False
+            )
+            report[name]["map50"] = float(metrics.box.map50)
+            report[name]["map50_95"] = float(metrics.box.map)
+        logging.info(f"{name}: {report[name]}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,179 @@
+"""
+Compares the loose-file layout of a split (one jpg and one txt per image) with its pack
+(see `utils/packed_dataset.py`) on a synthetic split of dash-cam-like frames:
+
+- scan: building the ultralytics dataset, i.e. checking the images and reading the labels
+  (`YOLODataset` without and with its `.cache` file vs `PackedYOLODataset`);
+- read: reading the encoded images and the labels of the whole split;
+- load: `dataset[i]` over the whole split without augmentation (decode, resize, letterbox, format).
+
+With `--drop-cache` the files are evicted from the page cache before every read pass
+(posix_fadvise, so the numbers are closer to a cold disk or a network filesystem).
+
+Usage (from the `experiments` directory):
+    python benchmarks/packed_dataset_benchmark.py --images 2000
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import tempfile
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.append(BENCHMARKS_DIR)
+sys.path.append(os.path.join(os.path.dirname(BENCHMARKS_DIR), "utils"))
+from packed_dataset import PackedDataset, PackedYOLODataset, pack_split
+from synthetic import yolo_split
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def drop_cache(paths: List[str]):
+    """
+    Evicts the files from the page cache
+    """
+    for path in paths:
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def _rate(fn: Callable[[], int], repeats: int) -> float:
+    """
+    :param fn: Processes the split, returns the number of images
+    :return: Best images per second over the repeats
+    """
+    best = 0.0
+    for _ in range(repeats):
+        start = time.perf_counter()
+        images = fn()
+        best = max(best, images / (time.perf_counter() - start))
+    return best
+
+
+def read_loose(split_dir: str) -> int:
+    images_dir = os.path.join(split_dir, "images")
+    fnames = sorted(os.listdir(images_dir))
+    for fname in fnames:
+        with open(os.path.join(images_dir, fname), "rb") as f:
+            f.read()
+        label_path = os.path.join(split_dir, "labels", os.path.splitext(fname)[0])
+        with open(f"{label_path}.txt") as f:
+            np.array(f.read().split(), dtype=np.float32).reshape(-1, 5)
+    return len(fnames)
+
+
+def read_pack(pack_dir: str) -> int:
+    pack = PackedDataset(pack_dir)
+    for i in range(len(pack)):
+        np.array(pack.image_bytes(i))
+        np.array(pack.boxes(i))
+    return len(pack)
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--images", type=int, default=2000)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--drop-cache", action="store_true")
+    parser.add_argument("--output", help="Path to save the report as json")
+    args = parser.parse_args()
+
+    from ultralytics.cfg import get_cfg
+    from ultralytics.data import YOLODataset
+
+    num_classes = 156
+    data = {"names": {i: str(i) for i in range(num_classes)}}
+    cfg = get_cfg(overrides={"imgsz": args.imgsz})
+    report: Dict[str, Dict[str, float]] = {}
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        split_dir = os.path.join(tmp_dir, "split")
+        pack_dir = f"{split_dir}.pack"
+        yolo_split(split_dir, args.images, num_classes, args.width, args.height)
+        start = time.perf_counter()
+        meta = pack_split(split_dir, pack_dir, num_classes)
+        report["pack"] = {"seconds": time.perf_counter() - start, **meta}
+        loose_files = [
+            os.path.join(root, fname)
+            for root, _, fnames in os.walk(split_dir)
+            for fname in fnames
+        ]
+        pack_files = [os.path.join(pack_dir, fname) for fname in os.listdir(pack_dir)]
+
+        def dataset(cls, path):
+            return cls(
+                img_path=path, imgsz=args.imgsz, augment=False, hyp=cfg, data=data
+            )
+
+        def timed(fn: Callable[[], int], files: List[str]) -> float:
+            def run() -> int:
+                if args.drop_cache:
+                    drop_cache(files)
+                return fn()
+
+            return _rate(run, args.repeats)
+
+        cache_path = os.path.join(split_dir, "labels.cache")
+
+        def scan_loose() -> int:
+            if os.path.exists(cache_path):
+                os.remove(cache_path)
+            return len(dataset(YOLODataset, split_dir))
+
+        report["scan"] = {
+            "loose": timed(scan_loose, loose_files),
+            "loose_cached": timed(
+                lambda: len(dataset(YOLODataset, split_dir)), loose_files
+            ),
+            "pack": timed(
+                lambda: len(dataset(PackedYOLODataset, pack_dir)), pack_files
+            ),
+        }
+        report["read"] = {
+            "loose": timed(lambda: read_loose(split_dir), loose_files),
+            "pack": timed(lambda: read_pack(pack_dir), pack_files),
+        }
+
+        def load(path, cls) -> Callable[[], int]:
+            def run() -> int:
+                ds = dataset(cls, path)
+                for i in range(len(ds)):
+                    ds[i]
+                return len(ds)
+
+            return run
+
+        report["load"] = {
+            "loose": timed(load(split_dir, YOLODataset), loose_files),
+            "pack": timed(load(pack_dir, PackedYOLODataset), pack_files),
+        }
+    for stage in ["scan", "read", "load"]:
+        logging.info(
+            f"{stage}: "
+            + ", ".join(
+                f"{layout} {rate:.0f} images/s"
+                for layout, rate in report[stage].items()
+            )
+        )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
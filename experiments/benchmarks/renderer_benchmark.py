@@ -0,0 +1,85 @@
+"""
+Compares the sprite-cached OverlayRenderer with ultralytics `Results.plot()` on synthetic detections.
+
+Usage (from the `experiments` directory):
+    python benchmarks/renderer_benchmark.py --boxes 10 --frames 200
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from renderer import OverlayRenderer
+from ultralytics.engine.results import Results
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def synthetic_boxes(
+    rng: np.random.Generator, n: int, width: int, height: int, nc: int
+) -> torch.Tensor:
+    """
+    Random detections of shape (n, 6) with rows (x1, y1, x2, y2, conf, cls)
+    """
+    xy = rng.uniform([0, 0], [width - 100, height - 100], size=(n, 2))
+    wh = rng.uniform(20, 100, size=(n, 2))
+    conf = rng.uniform(0.5, 1, size=(n, 1))
+    cls = rng.integers(0, nc, size=(n, 1))
+    return torch.from_numpy(np.hstack([xy, xy + wh, conf, cls]).astype(np.float32))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mapping", default=os.path.join("utils", "mapping.json"))
+    parser.add_argument("--frames", type=int, default=200)
+    parser.add_argument("--boxes", type=int, default=10)
+    parser.add_argument("--width", type=int, default=1920)
+    parser.add_argument("--height", type=int, default=1080)
+    parser.add_argument("--output", help="Path to save the report as json")
+    args = parser.parse_args()
+
+    with open(args.mapping) as f:
+        names = list(json.load(f).values())
+    names_dict = dict(enumerate(names))
+    rng = np.random.default_rng(0)
+    frame = rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8)
+    boxes = [
+        synthetic_boxes(rng, args.boxes, args.width, args.height, len(names))
+        for _ in range(args.frames)
+    ]
+
+    start = time.perf_counter()
+    for frame_boxes in boxes:
+        Results(orig_img=frame, path="", names=names_dict, boxes=frame_boxes).plot()
+    plot_ms = 1000 * (time.perf_counter() - start) / args.frames
+
+    renderer = OverlayRenderer()
+    start = time.perf_counter()
+    for frame_boxes in boxes:
+        renderer.render(frame, frame_boxes, names)
+    renderer_ms = 1000 * (time.perf_counter() - start) / args.frames
+
+    report = {
+        "plot_ms_per_frame": plot_ms,
+        "renderer_ms_per_frame": renderer_ms,
+        "speedup": plot_ms / renderer_ms,
+        "sprite_hits": renderer.hits,
+        "sprite_misses": renderer.misses,
+    }
+    logging.info(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
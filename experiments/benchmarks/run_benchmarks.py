@@ -0,0 +1,365 @@
+"""
+Offline CPU benchmarks of the inference and data-preparation hot paths.
+
+Every case runs in its own process on synthetic data (see `synthetic.py`), so peak RSS is per case.
+Results (throughput, p50/p99 latency, peak RSS) are saved as json to compare commits.
+
+Usage (from the `experiments` directory):
+    python benchmarks/run_benchmarks.py
+    python benchmarks/run_benchmarks.py --cases process_frame process_video --compare benchmarks/results/abc1234.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Any, Callable, Dict, List
+
+import numpy as np
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+EXPERIMENTS_DIR = os.path.dirname(BENCHMARKS_DIR)
+REPO_DIR = os.path.dirname(EXPERIMENTS_DIR)
+JSON2YOLO_DIR = os.path.join(REPO_DIR, "JSON2YOLO")
+SIGNS_PATH = os.path.join(EXPERIMENTS_DIR, "utils", "traffic_signs.csv")
+MAPPING_PATH = os.path.join(EXPERIMENTS_DIR, "utils", "mapping.json")
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def _labels() -> List[str]:
+    # RTSD labels: the saved mapping misses the first one (`Mapper.get_mapping` skips it)
+    with open(MAPPING_PATH) as f:
+        return sorted(["1_1", *json.load(f)])
+
+
+def _timed(fn: Callable, iterations: int, setup: Callable = None) -> List[float]:
+    """
+    Runs `fn` once to warm up, then `iterations` times
+    :param fn: Function to measure, gets the value returned by `setup`
+    :param setup: Called before every run, not measured
+    :return: Latencies in seconds
+    """
+    fn(setup() if setup else None)
+    latencies = []
+    for _ in range(iterations):
+        value = setup() if setup else None
+        start = time.perf_counter()
+        fn(value)
+        latencies.append(time.perf_counter() - start)
+    return latencies
+
+
+def _detector(args: argparse.Namespace):
+    import pandas as pd
+    from inference import Detector
+    from label2name import Mapper
+    from synthetic import tiny_model
+
+    labels = _labels()
+    labels_path = os.path.join(args.workdir, "labels.txt")
+    with open(labels_path, "w") as f:
+        f.write("\n".join(labels))
+    mapper = Mapper(pd.read_csv(SIGNS_PATH), labels_path, saving_path=os.devnull)
+    mapper.create(save=False)
+    model = tiny_model(labels)
+    model.overrides["imgsz"] = args.imgsz
+    return Detector(model, mapper)
+
+
+def bench_process_frame(args: argparse.Namespace) -> Dict[str, Any]:
+    from synthetic import dashcam_frame
+
+    detector = _detector(args)
+    frame = dashcam_frame(np.random.default_rng(0), args.width, args.height)
+    latencies = _timed(
+        lambda _: detector.process_frame(frame.copy(), conf=args.conf), args.iterations
+    )
+    return {"unit": "frames", "items_per_iteration": 1, "latencies": latencies}
+
+
+def bench_process_video(args: argparse.Namespace) -> Dict[str, Any]:
+    from synthetic import write_video
+
+    detector = _detector(args)
+    video_path = write_video(
+        os.path.join(args.workdir, "video.mp4"), args.frames, args.width, args.height
+    )
+    saving_path = os.path.join(args.workdir, "video_annotated.mp4")
+    latencies = _timed(
+        lambda _: detector.process_video(video_path, saving_path, conf=args.conf),
+        max(1, args.iterations // 10),
+    )
+    return {
+        "unit": "frames",
+        "items_per_iteration": args.frames,
+        "latencies": latencies,
+    }
+
+
+def bench_mapper_create(args: argparse.Namespace) -> Dict[str, Any]:
+    import pandas as pd
+    from label2name import Mapper
+
+    labels = _labels()
+    labels_path = os.path.join(args.workdir, "labels.txt")
+    with open(labels_path, "w") as f:
+        f.write("\n".join(labels))
+    signs = pd.read_csv(SIGNS_PATH)
+    latencies = _timed(
+        lambda _: Mapper(signs, labels_path).create(save=False), args.iterations
+    )
+    return {
+        "unit": "labels",
+        "items_per_iteration": len(labels),
+        "latencies": latencies,
+    }
+
+
+def bench_replace_names(args: argparse.Namespace) -> Dict[str, Any]:
+    from ultralytics.engine.results import Results
+
+    detector = _detector(args)
+    labels = dict(enumerate(_labels()))
+    result = Results(np.zeros((8, 8, 3), dtype=np.uint8), "", labels)
+
+    def setup():
+        result.names = dict(labels)
+        return result
+
+    latencies = _timed(
+        detector.mapper.replace_names, args.iterations * 100, setup=setup
+    )
+    return {"unit": "frames", "items_per_iteration": 1, "latencies": latencies}
+
+
+def bench_convert_coco_json(args: argparse.Namespace) -> Dict[str, Any]:
+    from general_json2yolo import convert_coco_json
+    from synthetic import coco_json
+
+    json_dir = os.path.join(args.workdir, "annotations")
+    os.makedirs(json_dir)
+    coco_json(
+        os.path.join(json_dir, "train_anno.json"),
+        _labels(),
+        args.images,
+        args.anns_per_image,
+    )
+    os.chdir(args.workdir)
+    latencies = _timed(
+        lambda _: convert_coco_json(json_dir), max(1, args.iterations // 10)
+    )
+    return {
+        "unit": "annotations",
+        "items_per_iteration": args.images * args.anns_per_image,
+        "latencies": latencies,
+    }
+
+
+def bench_preprocess(args: argparse.Namespace) -> Dict[str, Any]:
+    from data_preprocessing import DataPreprocessor
+    from synthetic import IMAGES_DIR, rtsd_dataset
+
+    runs = iter(range(1 << 30))
+
+    def setup():
+        # preprocessing moves the files, so every run gets a fresh dataset
+        run_dir = os.path.join(args.workdir, f"run{next(runs)}")
+        os.makedirs(run_dir)
+        os.chdir(run_dir)
+        rtsd_dataset("rtsd-dataset", _labels(), args.images, args.images // 4)
+        return DataPreprocessor(
+            "rtsd-dataset",
+            IMAGES_DIR,
+            workers=args.preprocess_workers,
+            images_mode=args.images_mode,
+        )
+
+    latencies = _timed(
+        lambda preprocessor: preprocessor.preprocess(),
+        max(1, args.iterations // 10),
+        setup=setup,
+    )
+    return {
+        "unit": "images",
+        "items_per_iteration": args.images + args.images // 4,
+        "latencies": latencies,
+    }
+
+
+CASES = {
+    "process_frame": (bench_process_frame, [EXPERIMENTS_DIR]),
+    "process_video": (bench_process_video, [EXPERIMENTS_DIR]),
+    "mapper_create": (bench_mapper_create, [EXPERIMENTS_DIR]),
+    "replace_names": (bench_replace_names, [EXPERIMENTS_DIR]),
+    "convert_coco_json": (bench_convert_coco_json, [JSON2YOLO_DIR]),
+    # `data_preprocessing` imports `JSON2YOLO.general_json2yolo` and `project_utils`
+    "preprocess": (
+        bench_preprocess,
+        [REPO_DIR, JSON2YOLO_DIR, os.path.join(EXPERIMENTS_DIR, "utils")],
+    ),
+}
+
+
+# arguments passed from the orchestrator to the case processes
+SIZE_ARGS = [
+    "iterations",
+    "threads",
+    "width",
+    "height",
+    "imgsz",
+    "conf",
+    "frames",
+    "images",
+    "anns_per_image",
+    "preprocess_workers",
+    "images_mode",
+]
+
+
+def run_case(args: argparse.Namespace) -> Dict[str, Any]:
+    """
+    Runs one case in the current process
+    :return: Throughput, latency percentiles and peak RSS of the case
+    """
+    fn, paths = CASES[args.case]
+    sys.path[:0] = [BENCHMARKS_DIR] + paths
+    import torch
+
+    torch.set_num_threads(args.threads)
+    logging.getLogger().setLevel(logging.WARNING)
+    measured = fn(args)
+    latencies = np.array(measured["latencies"])
+    return {
+        "unit": measured["unit"],
+        "iterations": len(latencies),
+        "throughput": measured["items_per_iteration"]
+        * len(latencies)
+        / latencies.sum(),
+        "latency_ms_p50": float(np.percentile(latencies, 50) * 1000),
+        "latency_ms_p99": float(np.percentile(latencies, 99) * 1000),
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def metadata(args: argparse.Namespace) -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR,
+            capture_output=True,
+            text=True,
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return {
+        "commit": commit or "unknown",
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "threads": args.threads,
+    }
+
+
+def compare(results: Dict[str, Any], baseline_path: str, tolerance: float):
+    """
+    Logs the change of every case against a previous run and flags regressions
+    """
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+    for case, current in results["results"].items():
+        previous = baseline["results"].get(case)
+        if previous is None or "throughput" not in current:
+            continue
+        throughput = current["throughput"] / previous["throughput"]
+        p99 = current["latency_ms_p99"] / previous["latency_ms_p99"]
+        flag = "REGRESSION" if throughput < 1 - tolerance else "ok"
+        logging.info(
+            f"{case}: throughput x{throughput:.2f}, p99 x{p99:.2f} vs {baseline['meta']['commit']} [{flag}]"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--cases", nargs="+", default=list(CASES), choices=list(CASES))
+    parser.add_argument("--iterations", type=int, default=20)
+    parser.add_argument("--threads", type=int, default=1)
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--frames", type=int, default=60, help="Frames of the video")
+    parser.add_argument("--images", type=int, default=2000, help="Images in COCO json")
+    parser.add_argument("--anns-per-image", type=int, default=3)
+    parser.add_argument(
+        "--preprocess-workers",
+        type=int,
+        default=1,
+        help="File operation threads of preprocessing",
+    )
+    parser.add_argument(
+        "--images-mode",
+        choices=["move", "copy", "hardlink", "symlink"],
+        default="move",
+        help="How preprocessing puts images to the splits",
+    )
+    parser.add_argument(
+        "--output", help="Json report, benchmarks/results/<commit>.json by default"
+    )
+    parser.add_argument("--compare", help="Previous json report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.1)
+    # internal: run a single case and save its result
+    parser.add_argument("--case", help=argparse.SUPPRESS)
+    parser.add_argument("--workdir", help=argparse.SUPPRESS)
+    parser.add_argument("--result", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.case:
+        with open(args.result, "w") as f:
+            json.dump(run_case(args), f)
+        return
+
+    results = {"meta": metadata(args), "results": {}}
+    case_args = []
+    for name in SIZE_ARGS:
+        case_args += [f"--{name.replace('_', '-')}", str(getattr(args, name))]
+    for case in args.cases:
+        with tempfile.TemporaryDirectory() as workdir:
+            result_path = os.path.join(workdir, "result.json")
+            process = subprocess.run(
+                [sys.executable, os.path.abspath(__file__)]
+                + case_args
+                + ["--case", case, "--workdir", workdir, "--result", result_path],
+                cwd=workdir,
+                capture_output=True,
+                text=True,
+            )
+            if process.returncode:
+                logging.error(f"{case} failed:\n{process.stderr[-2000:]}")
+                results["results"][case] = {"error": process.stderr[-2000:]}
+                continue
+            with open(result_path) as f:
+                results["results"][case] = json.load(f)
+        logging.info(f"{case}: {results['results'][case]}")
+
+    output = args.output or os.path.join(
+        BENCHMARKS_DIR, "results", f"{results['meta']['commit']}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w") as f:
+        json.dump(results, f, indent=2)
+    logging.info(f"Results saved to {output}")
+    if args.compare:
+        compare(results, args.compare, args.tolerance)
+
+
+if __name__ == "__main__":
+    main()
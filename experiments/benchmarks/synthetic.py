@@ -0,0 +1,181 @@
+"""
+Synthetic inputs for the benchmarks: a tiny randomly initialised YOLO model, dash-cam-like
+frames and videos, COCO annotations, an RTSD-like dataset layout and YOLO splits. Nothing is
+downloaded.
+"""
+
+import json
+import os
+from typing import List
+
+import cv2
+import numpy as np
+
+IMAGES_DIR = os.path.join("rtsd-frames", "rtsd-frames")
+
+
+def tiny_model(labels: List[str], cfg: str = "yolov8n.yaml"):
+    """
+    Builds a randomly initialised YOLO model with one class per label
+    :param labels: Class names
+    :param cfg: Model config shipped with ultralytics
+    :return: YOLO model
+    """
+    from ultralytics import YOLO
+    from ultralytics.nn.tasks import DetectionModel
+
+    model = YOLO(cfg)
+    model.model = DetectionModel(cfg, nc=len(labels), verbose=False)
+    model.model.names = dict(enumerate(labels))
+    return model
+
+
+def dashcam_frame(rng: np.random.Generator, width: int, height: int) -> np.ndarray:
+    """
+    Frame with a sky, a road and a few sign-like circles
+    """
+    frame = np.empty((height, width, 3), dtype=np.uint8)
+    frame[: height // 2] = (200, 170, 140)
+    frame[height // 2 :] = (80, 80, 80)
+    frame += rng.integers(0, 20, size=frame.shape, dtype=np.uint8)
+    for _ in range(3):
+        center = (
+            int(rng.integers(width // 2, width)),
+            int(rng.integers(0, height // 2)),
+        )
+        radius = int(rng.integers(8, 40))
+        cv2.circle(frame, center, radius, (0, 0, 220), -1)
+        cv2.circle(frame, center, int(radius * 0.7), (255, 255, 255), -1)
+    return frame
+
+
+def write_video(
+    path: str, frames: int, width: int, height: int, fps: int = 30, seed: int = 0
+) -> str:
+    """
+    Writes a synthetic dash-cam video
+    :return: Path to the video
+    """
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(
+        path, cv2.VideoWriter_fourcc(*"mp4v"), fps, (width, height)
+    )
+    base = dashcam_frame(rng, width, height)
+    for i in range(frames):
+        writer.write(np.roll(base, -4 * i, axis=1))
+    writer.release()
+    return path
+
+
+def coco_json(
+    path: str,
+    labels: List[str],
+    images: int,
+    anns_per_image: int = 3,
+    width: int = 1280,
+    height: int = 720,
+    prefix: str = "rtsd-frames",
+    first_id: int = 0,
+    seed: int = 0,
+) -> List[str]:
+    """
+    Writes a COCO annotation file in the RTSD layout (`file_name` is `rtsd-frames/<name>.jpg`)
+    :return: Image file names
+    """
+    rng = np.random.default_rng(seed)
+    image_records, annotations, fnames = [], [], []
+    for i in range(first_id, first_id + images):
+        fname = f"{i:06d}.jpg"
+        fnames.append(fname)
+        image_records.append(
+            {
+                "id": i,
+                "file_name": f"{prefix}/{fname}",
+                "width": width,
+                "height": height,
+            }
+        )
+        for _ in range(anns_per_image):
+            w, h = rng.uniform(10, 80, size=2)
+            x, y = rng.uniform(0, width - w), rng.uniform(0, height - h)
+            annotations.append(
+                {
+                    "id": len(annotations),
+                    "image_id": i,
+                    "category_id": int(rng.integers(1, len(labels) + 1)),
+                    "bbox": [round(x, 1), round(y, 1), round(w, 1), round(h, 1)],
+                    "area": round(w * h, 1),
+                    "iscrowd": 0,
+                }
+            )
+    categories = [{"id": i + 1, "name": label} for i, label in enumerate(labels)]
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "images": image_records,
+                "annotations": annotations,
+                "categories": categories,
+            },
+            f,
+        )
+    return fnames
+
+
+def rtsd_dataset(
+    root: str, labels: List[str], train_images: int, val_images: int
+) -> str:
+    """
+    Creates an RTSD-like dataset directory: train/val annotations, labels.txt and tiny images
+    :param root: Dataset directory
+    :return: Dataset directory
+    """
+    os.makedirs(os.path.join(root, IMAGES_DIR), exist_ok=True)
+    with open(os.path.join(root, "labels.txt"), "w") as f:
+        f.write("\n".join(labels))
+    train = coco_json(os.path.join(root, "train_anno.json"), labels, train_images)
+    val = coco_json(
+        os.path.join(root, "val_anno.json"),
+        labels,
+        val_images,
+        first_id=train_images,
+        seed=1,
+    )
+    image = cv2.imencode(".jpg", np.zeros((72, 128, 3), dtype=np.uint8))[1].tobytes()
+    for fname in train + val:
+        with open(os.path.join(root, IMAGES_DIR, fname), "wb") as f:
+            f.write(image)
+    return root
+
+
+def yolo_split(
+    root: str,
+    images: int,
+    num_classes: int,
+    width: int = 1280,
+    height: int = 720,
+    boxes_per_image: int = 2,
+    seed: int = 0,
+) -> str:
+    """
+    Creates a split in the YOLO layout (`images/*.jpg`, `labels/*.txt`) with dash-cam-like frames.
+    Frames are encoded once per 16 images and reused to keep the generation fast
+    :param root: Split directory
+    :return: Split directory
+    """
+    rng = np.random.default_rng(seed)
+    for folder in ["images", "labels"]:
+        os.makedirs(os.path.join(root, folder), exist_ok=True)
+    encoded = [
+        cv2.imencode(".jpg", dashcam_frame(rng, width, height))[1].tobytes()
+        for _ in range(min(images, 16))
+    ]
+    for i in range(images):
+        with open(os.path.join(root, "images", f"{i:06d}.jpg"), "wb") as f:
+            f.write(encoded[i % len(encoded)])
+        wh = rng.uniform(0.01, 0.06, size=(boxes_per_image, 2))
+        xy = rng.uniform(wh / 2, 1 - wh / 2)
+        cls = rng.integers(0, num_classes, size=boxes_per_image)
+        with open(os.path.join(root, "labels", f"{i:06d}.txt"), "w") as f:
+            for c, (x, y), (w, h) in zip(cls, xy, wh):
+                f.write(f"{c} {x:.6f} {y:.6f} {w:.6f} {h:.6f}\n")
+    return root
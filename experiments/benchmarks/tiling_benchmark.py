@@ -0,0 +1,129 @@
+"""
+Compares tile layouts on CPU cost and on how many of the full-resolution detections they keep.
+
+Usage (from the `experiments` directory):
+    python benchmarks/tiling_benchmark.py --checkpoint best.pt --source test_video.mp4
+"""
+
+import argparse
+import json
+import logging
+import os
+import sys
+import time
+from typing import Any, Dict, List
+
+import cv2
+import numpy as np
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tiling import UPPER_RIGHT, TiledPredictor
+from tracking import match_boxes
+from ultralytics import YOLO
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+LAYOUTS = {
+    "full@640": None,
+    "full@1280": None,
+    "tiles640": TiledPredictor(tile_size=640, overlap=0.2),
+    "tiles640@416": TiledPredictor(tile_size=640, overlap=0.2, imgsz=416),
+    "tiles640-upper-right": TiledPredictor(
+        tile_size=640, overlap=0.2, regions=UPPER_RIGHT
+    ),
+    "tiles960@640": TiledPredictor(tile_size=960, overlap=0.2, imgsz=640),
+}
+
+
+def read_frames(source: str, max_frames: int) -> List[np.ndarray]:
+    """
+    Reads frames from a video or a directory of images
+    :param source: Path to the video or to the directory
+    :param max_frames: Maximum number of frames
+    :return: List of frames
+    """
+    if os.path.isdir(source):
+        fnames = sorted(os.listdir(source))[:max_frames]
+        return [cv2.imread(os.path.join(source, fname)) for fname in fnames]
+    frames = []
+    cap = cv2.VideoCapture(source)
+    while cap.isOpened() and len(frames) < max_frames:
+        success, frame = cap.read()
+        if not success:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def run_layout(
+    model: YOLO, frames: List[np.ndarray], layout: str, conf: float
+) -> Dict[str, Any]:
+    """
+    Runs the model over the frames with one layout
+    :return: Per-frame boxes, milliseconds per frame and model inputs per frame
+    """
+    tiler = LAYOUTS[layout]
+    height, width = frames[0].shape[:2]
+    start = time.perf_counter()
+    if tiler is None:
+        imgsz = int(layout.split("@")[1])
+        results = [model(f, verbose=False, conf=conf, imgsz=imgsz)[0] for f in frames]
+        inputs = 1
+    else:
+        results = [tiler(model, f, verbose=False, conf=conf)[0] for f in frames]
+        inputs = tiler.tiles_per_frame(width, height)
+    elapsed = time.perf_counter() - start
+    return {
+        "boxes": [r.boxes.data.cpu().numpy() for r in results],
+        "ms_per_frame": 1000 * elapsed / len(frames),
+        "inputs_per_frame": inputs,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--checkpoint", default="yolov8m.pt")
+    parser.add_argument("--source", required=True, help="Video or image directory")
+    parser.add_argument("--frames", type=int, default=50)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument("--layouts", nargs="+", default=list(LAYOUTS))
+    parser.add_argument("--output", help="Path to save the report as json")
+    args = parser.parse_args()
+
+    model = YOLO(args.checkpoint)
+    frames = read_frames(args.source, args.frames)
+    height, width = frames[0].shape[:2]
+    # detections at the native resolution are the reference for all layouts
+    native = int(np.ceil(max(width, height) / 32) * 32)
+    reference = [
+        model(f, verbose=False, conf=args.conf, imgsz=native)[0]
+        .boxes.data.cpu()
+        .numpy()
+        for f in frames
+    ]
+    reference_count = sum(len(boxes) for boxes in reference)
+
+    report = {}
+    for layout in args.layouts:
+        run = run_layout(model, frames, layout, args.conf)
+        matched = sum(
+            len(match_boxes(boxes, ref, iou_threshold=0.5))
+            for boxes, ref in zip(run["boxes"], reference)
+        )
+        report[layout] = {
+            "ms_per_frame": run["ms_per_frame"],
+            "inputs_per_frame": run["inputs_per_frame"],
+            "boxes_per_frame": sum(len(b) for b in run["boxes"]) / len(frames),
+            "recall_vs_native": matched / reference_count if reference_count else 1.0,
+        }
+        logging.info(f"{layout}: {report[layout]}")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,129 @@
+import collections
+import json
+import logging
+import os
+from typing import Any, Dict, List, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class ClipExtractor:
+    def __init__(
+        self,
+        saving_dir: str,
+        fps: float,
+        frame_size: Tuple[int, int],
+        pre_roll: float = 1.0,
+        post_roll: float = 2.0,
+        fourcc: str = "mp4v",
+    ):
+        """
+        Writes short clips around detection events instead of the whole video. A clip starts
+        `pre_roll` seconds before the first frame with detections and ends `post_roll` seconds
+        after the last one, so events closer than `post_roll` end up in the same clip.
+        Frames outside the clips are never encoded. `index.json` in `saving_dir` lists the
+        clip boundaries and the signs seen in every clip.
+
+        :param saving_dir: Directory for the clips and the index
+        :param fps: Frame rate of the input video, the clips keep it
+        :param frame_size: Frame width and height
+        :param pre_roll: Seconds of video kept before an event
+        :param post_roll: Seconds of video kept after an event
+        :param fourcc: Codec of the clips
+        """
+        assert pre_roll >= 0 and post_roll >= 0, "Rolls can't be negative"
+        self.saving_dir = saving_dir
+        self.fps = fps
+        self.frame_size = frame_size
+        self.pre_roll_frames = round(pre_roll * fps)
+        self.post_roll_frames = round(post_roll * fps)
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.clips: List[Dict[str, Any]] = []
+        self.frames = 0
+        self.encoded_frames = 0
+        self._pre = collections.deque(maxlen=self.pre_roll_frames)
+        self._writer = None
+        self._clip = None
+        self._since_detection = 0
+        os.makedirs(saving_dir, exist_ok=True)
+
+    def add(self, frame: np.ndarray, names: List[str]):
+        """
+        Adds the next frame of the video.
+
+        :param frame: Annotated frame if there are detections, otherwise the decoded one
+        :param names: Sign names detected on the frame
+        """
+        frame_idx = self.frames
+        self.frames += 1
+        if names:
+            if self._writer is None:
+                self._open(frame_idx - len(self._pre))
+                for pre_frame in self._pre:
+                    self._write(pre_frame)
+                self._pre.clear()
+            self._since_detection = 0
+            self._clip["signs"].update(set(names))
+            self._write(frame)
+        elif self._writer is not None:
+            self._since_detection += 1
+            if self._since_detection > self.post_roll_frames:
+                self._close()
+                self._pre.append(frame)
+            else:
+                self._write(frame)
+        else:
+            self._pre.append(frame)
+
+    def close(self, video_path: str = None) -> Dict[str, Any]:
+        """
+        Finishes the last clip and saves the index.
+
+        :param video_path: Source video, saved in the index
+        :return: Index: source video, frame rate, number of frames and clips
+        """
+        if self._writer is not None:
+            self._close()
+        self._pre.clear()
+        index = {
+            "video": video_path,
+            "fps": self.fps,
+            "frames": self.frames,
+            "encoded_frames": self.encoded_frames,
+            "clips": self.clips,
+        }
+        with open(os.path.join(self.saving_dir, "index.json"), "w") as f:
+            json.dump(index, f, indent=2)
+        return index
+
+    def _open(self, start_frame: int):
+        path = os.path.join(self.saving_dir, f"clip_{len(self.clips):05d}.mp4")
+        self._writer = cv2.VideoWriter(path, self.fourcc, self.fps, self.frame_size)
+        self._clip = {
+            "path": os.path.basename(path),
+            "start_frame": start_frame,
+            "frames": 0,
+            "signs": collections.Counter(),
+        }
+
+    def _write(self, frame: np.ndarray):
+        self._writer.write(frame)
+        self._clip["frames"] += 1
+        self.encoded_frames += 1
+
+    def _close(self):
+        self._writer.release()
+        self._writer = None
+        clip = self._clip
+        end_frame = clip["start_frame"] + clip["frames"] - 1
+        clip["end_frame"] = end_frame
+        clip["start_time"] = round(clip["start_frame"] / self.fps, 3)
+        clip["end_time"] = round((end_frame + 1) / self.fps, 3)
+        # number of frames every sign was detected on
+        clip["signs"] = dict(clip["signs"].most_common())
+        self.clips.append(clip)
+        self._clip = None
@@ -0,0 +1,219 @@
+import json
+import logging
+import os
+from typing import Dict, Iterator, List, Sequence
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+DETECTION_DTYPE = np.dtype(
+    [
+        ("frame", np.int64),
+        ("timestamp", np.float64),
+        ("cls", np.int32),
+        ("conf", np.float32),
+        ("xyxy", np.float32, (4,)),
+    ]
+)
+
+
+class DetectionWriter:
+    def __init__(
+        self,
+        path: str,
+        names: Sequence[str],
+        output_format: str = "jsonl",
+        chunk_size: int = 10000,
+    ):
+        """
+        Streams detections to disk without keeping them in memory.
+        `jsonl` writes one json record per detection into the `path` file,
+        `npz` writes columnar chunks of `chunk_size` detections into the `path` directory
+        together with `names.json`, which maps class ids to sign names.
+
+        :param path: Output file (jsonl) or directory (npz)
+        :param names: Sign names indexed by class id
+        :param output_format: `jsonl` or `npz`
+        :param chunk_size: Maximum number of detections kept in memory before a chunk is flushed (npz)
+        """
+        assert output_format in ["jsonl", "npz"], f"Unknown format {output_format}"
+        self.path = path
+        self.names = list(names)
+        self.output_format = output_format
+        self.chunk_size = chunk_size
+        self.detections = 0
+        self._chunks = 0
+        self._buffer = np.empty(chunk_size, dtype=DETECTION_DTYPE)
+        self._buffered = 0
+        if output_format == "jsonl":
+            self._file = open(path, "w")
+        else:
+            os.makedirs(path, exist_ok=True)
+            with open(os.path.join(path, "names.json"), "w") as f:
+                json.dump(self.names, f, ensure_ascii=False)
+
+    def write(self, frame_idx: int, timestamp: float, boxes: np.ndarray):
+        """
+        :param frame_idx: Index of the frame in the video
+        :param timestamp: Time of the frame in seconds
+        :param boxes: Array of shape (N, 6) with rows (x1, y1, x2, y2, conf, cls)
+        """
+        self.detections += len(boxes)
+        if self.output_format == "jsonl":
+            for x1, y1, x2, y2, conf, cls in boxes[:, :6].tolist():
+                record = {
+                    "frame": frame_idx,
+                    "timestamp": round(timestamp, 3),
+                    "cls": int(cls),
+                    "name": self._name(int(cls)),
+                    "conf": round(conf, 4),
+                    "xyxy": [round(x1, 1), round(y1, 1), round(x2, 1), round(y2, 1)],
+                }
+                self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            return
+        while len(boxes):
+            n = min(len(boxes), self.chunk_size - self._buffered)
+            rows = boxes[:n]
+            chunk = self._buffer[self._buffered : self._buffered + n]
+            chunk["frame"] = frame_idx
+            chunk["timestamp"] = timestamp
+            chunk["cls"] = rows[:, 5]
+            chunk["conf"] = rows[:, 4]
+            chunk["xyxy"] = rows[:, :4]
+            self._buffered += n
+            if self._buffered == self.chunk_size:
+                self._flush()
+            boxes = boxes[n:]
+
+    def _name(self, cls: int) -> str:
+        return self.names[cls] if cls < len(self.names) else str(cls)
+
+    def _flush(self):
+        if not self._buffered:
+            return
+        chunk = self._buffer[: self._buffered]
+        np.savez(
+            os.path.join(self.path, f"part-{self._chunks:05d}.npz"),
+            **{field: chunk[field] for field in DETECTION_DTYPE.names},
+        )
+        self._chunks += 1
+        self._buffered = 0
+
+    def close(self):
+        if self.output_format == "jsonl":
+            self._file.close()
+        else:
+            self._flush()
+        logging.info(f"{self.detections} detections saved to {self.path}")
+
+    def __enter__(self) -> "DetectionWriter":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def read_detections(path: str) -> Iterator[Dict[str, np.ndarray]]:
+    """
+    Reads detections saved by `DetectionWriter` chunk by chunk
+    :param path: jsonl file or directory with npz chunks
+    :return: Iterator over dicts of columns: frame, timestamp, cls, conf, xyxy
+    """
+    if os.path.isdir(path):
+        for fname in sorted(os.listdir(path)):
+            if fname.endswith(".npz"):
+                with np.load(os.path.join(path, fname)) as chunk:
+                    yield {field: chunk[field] for field in DETECTION_DTYPE.names}
+        return
+    records = []
+    with open(path) as f:
+        for line in f:
+            records.append(json.loads(line))
+            if len(records) == 10000:
+                yield _records_to_columns(records)
+                records = []
+    if records:
+        yield _records_to_columns(records)
+
+
+def _records_to_columns(records: List[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Converts jsonl records to the same columns as the npz chunks
+    """
+    return {
+        "frame": np.array([r["frame"] for r in records], dtype=np.int64),
+        "timestamp": np.array([r["timestamp"] for r in records], dtype=np.float64),
+        "cls": np.array([r["cls"] for r in records], dtype=np.int32),
+        "conf": np.array([r["conf"] for r in records], dtype=np.float32),
+        "xyxy": np.array([r["xyxy"] for r in records], dtype=np.float32).reshape(-1, 4),
+    }
+
+
+def read_names(path: str) -> Sequence[str]:
+    """
+    Reads sign names indexed by class id saved next to the detections
+    :param path: jsonl file or directory with npz chunks
+    :return: Sign names indexed by class id
+    """
+    if os.path.isdir(path):
+        with open(os.path.join(path, "names.json")) as f:
+            return json.load(f)
+    names = {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            names[record["cls"]] = record["name"]
+    return [names.get(i, str(i)) for i in range(max(names, default=-1) + 1)]
+
+
+def render_detections(
+    video_path: str, detections_path: str, saving_path: str, renderer=None
+):
+    """
+    Renders the overlay from saved detections without running the model
+    :param video_path: Path to the source video
+    :param detections_path: Detections saved by `DetectionWriter`
+    :param saving_path: Path where the annotated video will be saved
+    :param renderer: Renderer with a `render(frame, boxes, names)` method. `OverlayRenderer` if not provided
+    """
+    if renderer is None:
+        from renderer import OverlayRenderer
+
+        renderer = OverlayRenderer()
+    names = read_names(detections_path)
+    cap = cv2.VideoCapture(video_path)
+    frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
+    video_writer = cv2.VideoWriter(saving_path, fourcc, 30, (frame_width, frame_height))
+
+    chunks = read_detections(detections_path)
+    pending = np.empty((0, 6), dtype=np.float32)
+    pending_frames = np.empty(0, dtype=np.int64)
+    frame_idx = 0
+    while cap.isOpened():
+        success, frame = cap.read()
+        if not success:
+            break
+        # detections are sorted by frame, so only a chunk ahead has to be kept in memory
+        while not len(pending_frames) or pending_frames[-1] <= frame_idx:
+            chunk = next(chunks, None)
+            if chunk is None:
+                break
+            rows = np.hstack(
+                [chunk["xyxy"], chunk["conf"][:, None], chunk["cls"][:, None]]
+            )
+            pending = np.vstack([pending, rows])
+            pending_frames = np.concatenate([pending_frames, chunk["frame"]])
+        current = pending_frames == frame_idx
+        renderer.render(frame, pending[current], names)
+        keep = pending_frames > frame_idx
+        pending, pending_frames = pending[keep], pending_frames[keep]
+        video_writer.write(frame)
+        frame_idx += 1
+    cap.release()
+    video_writer.release()
+    logging.info(f"Annotated video saved to {saving_path}")
@@ -0,0 +1,124 @@
+import logging
+import queue
+import resource
+import threading
+from typing import Dict, Optional, Tuple
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class FramePool:
+    def __init__(self, shape: Tuple[int, ...], size: int, dtype=np.uint8):
+        """
+        Ring of preallocated frame buffers. Frames are decoded straight into a free buffer
+        (`cap.read(image=buffer)`), annotated in place and returned to the pool once written,
+        so a video of any length allocates `size` frames in total.
+        `acquire` blocks while every buffer is in use, which also bounds the frames in flight.
+
+        :param shape: Frame shape (height, width, channels)
+        :param size: Number of buffers
+        :param dtype: Frame dtype
+        """
+        assert size >= 1, "`size` must be a positive integer"
+        self.shape = tuple(shape)
+        self.buffers = [np.empty(shape, dtype=dtype) for _ in range(size)]
+        self._ids = {id(buffer) for buffer in self.buffers}
+        self._free = queue.SimpleQueue()
+        for buffer in self.buffers:
+            self._free.put(buffer)
+        self._lock = threading.Lock()
+        self.reads = 0
+        # frames OpenCV had to allocate (e.g. the size changed mid-stream)
+        self.fallbacks = 0
+
+    @classmethod
+    def for_capture(cls, cap: cv2.VideoCapture, size: int) -> "FramePool":
+        """
+        Creates a pool for the frames of an opened capture
+        :param cap: Opened video capture
+        :param size: Number of buffers
+        :return: Frame pool
+        """
+        width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+        height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+        return cls((height, width, 3), size)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(buffer.nbytes for buffer in self.buffers)
+
+    def acquire(self, timeout: float = None) -> Optional[np.ndarray]:
+        """
+        :param timeout: Seconds to wait for a free buffer, forever if not provided
+        :return: Free buffer or None on timeout
+        """
+        try:
+            return self._free.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def release(self, frame: np.ndarray):
+        """
+        Returns a buffer to the pool. Arrays which don't belong to the pool are ignored.
+        """
+        if id(frame) in self._ids:
+            self._free.put(frame)
+
+    def read_into(
+        self, cap: cv2.VideoCapture, buffer: np.ndarray
+    ) -> Optional[np.ndarray]:
+        """
+        Decodes the next frame into an acquired buffer. The buffer is released if the
+        video is exhausted or OpenCV couldn't reuse it.
+
+        :param cap: Opened video capture
+        :param buffer: Buffer from `acquire`
+        :return: Decoded frame (normally `buffer` itself) or None at the end of the video
+        """
+        success, frame = cap.read(image=buffer)
+        if not success:
+            self.release(buffer)
+            return None
+        with self._lock:
+            self.reads += 1
+            if frame is not buffer:
+                self.fallbacks += 1
+        if frame is not buffer:
+            self.release(buffer)
+        return frame
+
+    def read(self, cap: cv2.VideoCapture) -> Optional[np.ndarray]:
+        """
+        Acquires a buffer and decodes the next frame into it
+        :param cap: Opened video capture
+        :return: Decoded frame or None at the end of the video
+        """
+        return self.read_into(cap, self.acquire())
+
+    def stats(self) -> Dict[str, float]:
+        """
+        :return: Pool size, its memory and the number of reads which had to allocate
+        """
+        return {
+            "buffers": len(self.buffers),
+            "pool_mb": self.nbytes / 2**20,
+            "reads": self.reads,
+            "fallbacks": self.fallbacks,
+        }
+
+
+def memory_stats() -> Dict[str, float]:
+    """
+    :return: Current (steady-state) and peak resident memory of the process in megabytes
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    try:
+        with open("/proc/self/statm") as f:
+            rss = int(f.read().split()[1]) * resource.getpagesize() / 2**20
+    except OSError:
+        rss = peak
+    return {"rss_mb": rss, "peak_rss_mb": peak}
@@ -1,23 +1,135 @@
+from __future__ import annotations
+
+import hashlib
 import logging
+import os
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
 import cv2
 import numpy as np
+from clips import ClipExtractor
+from detections_io import DetectionWriter
+from frame_pool import FramePool, memory_stats
 from label2name import Mapper
-from ultralytics import YOLO
+from metrics import NULL_METRICS, Metrics
+from pipeline import VideoPipeline
+from prediction_cache import PredictionCache
+from quality_controller import AdaptiveQualityController
+from sources import FrameSource, LatencyTracker, LatestFrameSource
+from utils.hashing import file_hash
+
+# torch and ultralytics are imported only when needed, so importing the module stays cheap
+if TYPE_CHECKING:
+    from renderer import OverlayRenderer
+    from tiling import TiledPredictor
+    from ultralytics import YOLO
+    from ultralytics.engine.results import Results
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
 class Detector:
-    def __init__(self, model: YOLO, mapper: Mapper):
+    def __init__(
+        self,
+        model: YOLO,
+        mapper: Mapper,
+        tiler: TiledPredictor = None,
+        renderer: OverlayRenderer = None,
+        metrics: Metrics = None,
+        cache: PredictionCache = None,
+    ):
         """
         Initialize the Detector.
 
         :param model: The YOLO model
         :param mapper: Initialized mapper object, which maps labels to names
+        :param tiler: Runs the model on overlapping tiles instead of whole frames, if provided
+        :param renderer: Draws the detections in place with cached label sprites instead of `result.plot()`, if provided
+        :param metrics: Collects per-stage timings (decode, preprocess, inference, postprocess, names,
+            render, encode), disabled if not provided
+        :param cache: Stores raw low-threshold predictions of whole videos, so later runs
+            at a higher threshold or re-renders don't run the model, if provided
         """
         self.model = model
         self.mapper = mapper
+        self.tiler = tiler
+        self.renderer = renderer
+        self.metrics = metrics or NULL_METRICS
+        self.cache = cache
+
+    @property
+    def model(self) -> YOLO:
+        return self._model
+
+    @model.setter
+    def model(self, model: YOLO):
+        self._model = model
+        self._names_key = None
+        self._weights_hash = None
+
+    @property
+    def mapper(self) -> Mapper:
+        return self._mapper
+
+    @mapper.setter
+    def mapper(self, mapper: Mapper):
+        self._mapper = mapper
+        self._names_key = None
+
+    @property
+    def names(self) -> Dict[int, str]:
+        """
+        Sign names by class id. Built once and rebuilt only when the model, the mapper
+        or its mapping changes.
+        """
+        self._compile_names()
+        return self._names
+
+    @property
+    def name_table(self) -> Tuple[str, ...]:
+        """
+        Sign names indexed by class id
+        """
+        self._compile_names()
+        return self._name_table
+
+    def _compile_names(self):
+        model_names = self._model.names
+        if (
+            self._names_key is not None
+            and self._names_key[0] is model_names
+            and self._names_key[1] == self._mapper.version
+        ):
+            return
+        self._names = self._mapper.compile_names(model_names)
+        self._name_table = tuple(
+            self._names.get(i, "") for i in range(max(self._names, default=-1) + 1)
+        )
+        self._names_key = (model_names, self._mapper.version)
+
+    def warmup(
+        self,
+        frame_shape: Tuple[int, int, int] = (720, 1280, 3),
+        batch_size: int = 1,
+        imgsz: int = None,
+    ) -> float:
+        """
+        Runs a dummy forward pass, so the first real frame doesn't pay for the lazy setup
+        of the predictor (model fusing, letterbox and NMS initialization, thread pools).
+
+        :param frame_shape: Shape of the frames which will be processed
+        :param batch_size: Number of frames in the dummy batch
+        :param imgsz: Inference resolution, the configured one if not provided
+        :return: Warm-up time in seconds
+        """
+        start = time.perf_counter()
+        frames = [np.zeros(frame_shape, dtype=np.uint8)] * batch_size
+        self._predict(frames, verbose=False, conf=0.5, imgsz=imgsz)
+        elapsed = time.perf_counter() - start
+        logging.info(f"Model warmed up in {elapsed:.2f}s")
+        return elapsed
 
     def process_frame(
         self, frame, verbose: bool = False, conf: float = 0.5
@@ -30,36 +142,637 @@ class Detector:
         :param conf: Confidence threshold
         :return: Annotated image
         """
-        results = self.model(frame, verbose=verbose, conf=conf)
-        result = self.mapper.replace_names(results[0])
-        annotated_frame = result.plot()
-        return annotated_frame
+        results = self.predict(frame, verbose=verbose, conf=conf)
+        return self.annotate(results[0])
+
+    def process_frames(
+        self, frames: List[np.ndarray], verbose: bool = False, conf: float = 0.5
+    ) -> List[np.ndarray]:
+        """
+        Detects traffic signs on a batch of images with a single forward pass.
 
-    def process_video(self, video_path: str, saving_path: str = None, **kwargs):
+        :param frames: Frames from a video
+        :param verbose: Verbose predictions
+        :param conf: Confidence threshold
+        :return: Annotated images in the same order as `frames`
+        """
+        results = self.predict(frames, verbose=verbose, conf=conf)
+        return [self.annotate(result) for result in results]
+
+    def predict(
+        self, frames, verbose: bool = False, conf: float = 0.5, imgsz: int = None
+    ) -> List[Results]:
+        """
+        Runs the model on one or several images without annotating them.
+
+        :param frames: Frame, path to the image or a list of them
+        :param verbose: Verbose predictions
+        :param conf: Confidence threshold
+        :param imgsz: Inference resolution, the model default if not provided (ignored when tiling)
+        :return: Model predictions, one per image
+        """
+        if not self.metrics.enabled:
+            return self._predict(frames, verbose, conf, imgsz)
+        start = time.perf_counter()
+        results = self._predict(frames, verbose, conf, imgsz)
+        self._observe_predict(results, start, time.perf_counter() - start)
+        return results
+
+    def _predict(
+        self, frames, verbose: bool, conf: float, imgsz: int = None
+    ) -> List[Results]:
+        if self.tiler is not None:
+            return self.tiler(self.model, frames, verbose=verbose, conf=conf)
+        if imgsz is not None:
+            return self.model(frames, verbose=verbose, conf=conf, imgsz=imgsz)
+        return self.model(frames, verbose=verbose, conf=conf)
+
+    def _observe_predict(self, results: List[Results], start: float, elapsed: float):
+        """
+        Records a model call and splits it into letterboxing, forward pass and NMS
+        using the timings ultralytics keeps in `Results.speed` (per image, in milliseconds).
+        The sub-stage spans are laid out back from the end of the call for the trace.
+        """
+        self.metrics.observe("predict", elapsed, start=start)
+        self.metrics.count("frames", len(results))
+        speed = results[0].speed if results and self.tiler is None else {}
+        if speed.get("inference") is None:
+            return
+        seconds = [
+            speed[stage] * len(results) / 1000
+            for stage in ("preprocess", "inference", "postprocess")
+        ]
+        offset = start + elapsed - sum(seconds)
+        for stage, duration in zip(("preprocess", "inference", "postprocess"), seconds):
+            self.metrics.observe(stage, duration, start=offset)
+            offset += duration
+
+    def annotate(self, result: Results) -> np.ndarray:
+        """
+        Replaces label names with sign names and draws the detections.
+
+        :param result: Model prediction for one image
+        :return: Annotated image
+        """
+        if self.renderer is not None:
+            with self.metrics.time("names"):
+                name_table = self.name_table
+            with self.metrics.time("render"):
+                return self.renderer.render(
+                    result.orig_img, result.boxes.data, name_table
+                )
+        with self.metrics.time("names"):
+            result.names = self.names
+        with self.metrics.time("render"):
+            return result.plot()
+
+    def process_video(
+        self,
+        video_path: str,
+        saving_path: str = None,
+        batch_size: int = 1,
+        pipelined: bool = False,
+        queue_size: int = 8,
+        keyframe_interval: int = 1,
+        output: str = "video",
+        detections_path: str = None,
+        frame_pool: bool = False,
+        pre_roll: float = 1.0,
+        post_roll: float = 2.0,
+        **kwargs,
+    ) -> Dict[str, Any]:
         """
         Detects traffic signs on a video.
 
         :param video_path: Path to the video
         :param saving_path: Path where the annotated video will be saved
+        :param batch_size: Number of frames passed to the model at once (1 keeps the per-frame path)
+        :param pipelined: Run decoding, inference, rendering and encoding as concurrent stages
+        :param queue_size: Maximum number of items waiting between two pipeline stages
+        :param keyframe_interval: Run the model only on every `keyframe_interval`-th frame
+            (or when a track is lost) and track the boxes in between
+        :param output: `video` saves the annotated video, `jsonl` or `npz` skip rendering and encoding
+            and stream the detections to `detections_path` (see `detections_io.DetectionWriter`),
+            `clips` saves only annotated clips around detections to the `saving_path` directory
+            (see `clips.ClipExtractor`)
+        :param detections_path: Path where the detections will be saved
+        :param frame_pool: Decode into a ring of preallocated buffers which are reused once
+            the frame is written (see `frame_pool.FramePool`). Annotation is in place only
+            with a `renderer`, `result.plot()` still draws on a copy
+        :param pre_roll: Seconds of video kept before a detection in the `clips` mode
+        :param post_roll: Seconds of video kept after a detection in the `clips` mode
+        :return: Throughput stats: number of frames, elapsed seconds and frames per second
+            (with a frame pool also the pool stats and the resident memory)
+        """
+        assert (
+            keyframe_interval == 1 or not pipelined
+        ), "Keyframe tracking processes frames sequentially and can't be pipelined"
+        assert (
+            output == "video" or not frame_pool
+        ), "The frame pool is used only for annotated videos"
+        if output == "clips":
+            return self._extract_clips(
+                video_path,
+                saving_path,
+                pre_roll,
+                post_roll,
+                batch_size=batch_size,
+                keyframe_interval=keyframe_interval,
+                **kwargs,
+            )
+        if output != "video":
+            return self._detect_video(
+                video_path,
+                detections_path,
+                output,
+                batch_size=batch_size,
+                keyframe_interval=keyframe_interval,
+                **kwargs,
+            )
+        cap, video_writer, saving_path = self._open_video(video_path, saving_path)
+        pool = None
+        if frame_pool:
+            # buffers in flight: a batch, every pipeline queue and one item per stage
+            size = batch_size + (3 * queue_size + 3 if pipelined else 0)
+            pool = FramePool.for_capture(cap, size)
+        if keyframe_interval > 1:
+            from tracking import KeyframeRunner
+
+            runner = KeyframeRunner(self, keyframe_interval=keyframe_interval, **kwargs)
+            frame_counter = 0
+            start = time.perf_counter()
+            frames = self._read_frames(cap, pool)
+            for result in runner(frames):
+                annotated_frame = self.annotate(result)
+                with self.metrics.time("encode"):
+                    video_writer.write(annotated_frame)
+                frame_counter += 1
+            cap.release()
+            video_writer.release()
+            stats = self._throughput(frame_counter, time.perf_counter() - start)
+            stats["model_calls"] = runner.model_calls
+            self._pool_stats(stats, pool)
+            self.metrics.export()
+            logging.info(
+                f"Annotated video saved to {saving_path} ({stats['frames']} frames, {stats['fps']:.2f} frames/s, {runner.model_calls} model calls)"
+            )
+            return stats
+        if pipelined:
+            pipeline = VideoPipeline(
+                self, batch_size=batch_size, queue_size=queue_size, pool=pool, **kwargs
+            )
+            stats = pipeline.run(cap, video_writer)
+            self._pool_stats(stats, pool)
+            self.metrics.export()
+            logging.info(
+                f"Annotated video saved to {saving_path} ({stats['frames']} frames, {stats['fps']:.2f} frames/s, bottleneck stage: {stats['bottleneck']})"
+            )
+            return stats
+        frame_counter = 0
+        start = time.perf_counter()
+        if self._cache_key(video_path, **kwargs) is not None:
+            for result in self._iter_results(
+                cap, batch_size, video_path=video_path, pool=pool, **kwargs
+            ):
+                annotated_frame = self.annotate(result)
+                with self.metrics.time("encode"):
+                    video_writer.write(annotated_frame)
+                frame_counter += 1
+            cap.release()
+            video_writer.release()
+            stats = self._throughput(frame_counter, time.perf_counter() - start)
+            stats["cache"] = self.cache.stats()
+            self._pool_stats(stats, pool)
+            self.metrics.export()
+            logging.info(
+                f"Annotated video saved to {saving_path} ({stats['frames']} frames, {stats['fps']:.2f} frames/s, cache {stats['cache']})"
+            )
+            return stats
+        for frames in self._read_batches(cap, batch_size, pool):
+            if batch_size == 1:
+                annotated_frames = [
+                    self.process_frame(frames[0], verbose=False, **kwargs)
+                ]
+            else:
+                annotated_frames = self.process_frames(frames, verbose=False, **kwargs)
+            for annotated_frame in annotated_frames:
+                with self.metrics.time("encode"):
+                    video_writer.write(annotated_frame)
+            frame_counter += len(frames)
+            if pool is not None:
+                for frame in frames:
+                    pool.release(frame)
+        cap.release()
+        video_writer.release()
+        stats = self._throughput(frame_counter, time.perf_counter() - start)
+        self._pool_stats(stats, pool)
+        self.metrics.export()
+        logging.info(
+            f"Annotated video saved to {saving_path} ({stats['frames']} frames, {stats['fps']:.2f} frames/s, batch size {batch_size})"
+        )
+        return stats
+
+    def process_stream(
+        self,
+        source: FrameSource,
+        callback: Callable[[int, Results, List[str]], None] = None,
+        realtime: bool = True,
+        buffer_size: int = 1,
+        max_frames: int = None,
+        controller: AdaptiveQualityController = None,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Detects traffic signs on a live stream and notifies about them.
+
+        :param source: Frame source (camera, pipe, stream url, see `sources`)
+        :param callback: Called for every processed frame with the frame index, the prediction
+            and the sign names detected on the frame
+        :param realtime: Keep only the freshest `buffer_size` frames and drop the stale ones
+            instead of processing every frame
+        :param buffer_size: Number of freshest frames kept in the real-time mode
+        :param max_frames: Stop after this number of processed frames
+        :param controller: Adapts inference resolution, frame skipping and confidence threshold
+            to hold its target fps, if provided
+        :return: Stats: processed, dropped and skipped frames, frames per second and
+            capture → notification latency percentiles in milliseconds
+        """
+        if controller is not None:
+            from utils.onnx_backend import fixed_input
+
+            controller.check_imgsz(fixed_input(self.model)[1])
+        if realtime:
+            source = LatestFrameSource(source, buffer_size)
+        latency = LatencyTracker()
+        frame_counter = 0
+        skipped = 0
+        start = time.perf_counter()
+        try:
+            for frame_idx, (frame, captured_at) in enumerate(source):
+                if controller is not None:
+                    if not controller.should_process(frame_idx):
+                        skipped += 1
+                        continue
+                    level = controller.level
+                    kwargs = dict(kwargs, imgsz=level.imgsz, conf=level.conf)
+                processing_start = time.monotonic()
+                result = self.predict(frame, **kwargs)[0]
+                names = [self.name_table[int(cls)] for cls in result.boxes.cls.tolist()]
+                if callback is not None:
+                    with self.metrics.time("callback"):
+                        callback(frame_idx, result, names)
+                finished_at = time.monotonic()
+                latency.record(finished_at - captured_at)
+                if controller is not None:
+                    controller.record(frame_idx, finished_at - processing_start)
+                frame_counter += 1
+                if max_frames is not None and frame_counter >= max_frames:
+                    break
+        finally:
+            source.close()
+        stats = self._throughput(frame_counter, time.perf_counter() - start)
+        stats["dropped"] = source.dropped if realtime else 0
+        stats["skipped"] = skipped
+        stats["latency_ms"] = latency.percentiles()
+        self.metrics.export()
+        logging.info(
+            f"Stream processed: {stats['frames']} frames, {stats['dropped']} dropped, {stats['fps']:.2f} frames/s, latency {stats['latency_ms']}"
+        )
+        return stats
+
+    def _detect_video(
+        self,
+        video_path: str,
+        detections_path: str,
+        output_format: str,
+        batch_size: int = 1,
+        keyframe_interval: int = 1,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Detects traffic signs on a video and saves only the detections.
+
+        :param video_path: Path to the video
+        :param detections_path: Path where the detections will be saved
+        :param output_format: `jsonl` or `npz`
+        :param batch_size: Number of frames passed to the model at once
+        :param keyframe_interval: Run the model only on every `keyframe_interval`-th frame
+        :return: Throughput stats: number of frames, elapsed seconds and frames per second
+        """
+        if not detections_path:
+            name = video_path.rsplit(".", 1)[0]
+            suffix = ".jsonl" if output_format == "jsonl" else ""
+            detections_path = f"{name}_detections{suffix}"
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        frame_counter = 0
+        start = time.perf_counter()
+        key = self._cache_key(video_path, keyframe_interval, **kwargs)
+        cached = self.cache.get(key) if key is not None and key in self.cache else None
+        if cached is not None:
+            # the detections come straight from the cache, the video isn't even decoded
+            cap.release()
+            conf = kwargs.get("conf", 0.5)
+            boxes_iter = (cached.frame(i, conf) for i in range(len(cached)))
+        else:
+            boxes_iter = (
+                result.boxes.data.cpu().numpy()
+                for result in self._iter_results(
+                    cap, batch_size, keyframe_interval, video_path, **kwargs
+                )
+            )
+        with DetectionWriter(detections_path, self.name_table, output_format) as writer:
+            for boxes in boxes_iter:
+                with self.metrics.time("write"):
+                    writer.write(frame_counter, frame_counter / fps, boxes)
+                frame_counter += 1
+        cap.release()
+        stats = self._throughput(frame_counter, time.perf_counter() - start)
+        self.metrics.export()
+        logging.info(
+            f"Detections saved to {detections_path} ({stats['frames']} frames, {stats['fps']:.2f} frames/s)"
+        )
+        return stats
+
+    def _extract_clips(
+        self,
+        video_path: str,
+        saving_dir: str = None,
+        pre_roll: float = 1.0,
+        post_roll: float = 2.0,
+        batch_size: int = 1,
+        keyframe_interval: int = 1,
+        **kwargs,
+    ) -> Dict[str, Any]:
+        """
+        Detects traffic signs on a video and saves only annotated clips around the detections.
+        Frames without detections are not rendered, and the ones outside the clips are not encoded.
+
+        :param video_path: Path to the video
+        :param saving_dir: Directory for the clips and their index
+        :param pre_roll: Seconds of video kept before a detection
+        :param post_roll: Seconds of video kept after a detection
+        :param batch_size: Number of frames passed to the model at once
+        :param keyframe_interval: Run the model only on every `keyframe_interval`-th frame
+        :return: Throughput stats with the number of clips and encoded frames
+        """
+        if not saving_dir:
+            saving_dir = f"{video_path.rsplit('.', 1)[0]}_clips"
+        cap = cv2.VideoCapture(video_path)
+        fps = cap.get(cv2.CAP_PROP_FPS) or 30
+        frame_size = (
+            int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)),
+            int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        )
+        extractor = ClipExtractor(saving_dir, fps, frame_size, pre_roll, post_roll)
+        frame_counter = 0
+        start = time.perf_counter()
+        for result in self._iter_results(
+            cap, batch_size, keyframe_interval, video_path, **kwargs
+        ):
+            names = [self.name_table[int(cls)] for cls in result.boxes.cls.tolist()]
+            frame = self.annotate(result) if names else result.orig_img
+            with self.metrics.time("encode"):
+                extractor.add(frame, names)
+            frame_counter += 1
+        cap.release()
+        index = extractor.close(video_path)
+        stats = self._throughput(frame_counter, time.perf_counter() - start)
+        stats["clips"] = len(index["clips"])
+        stats["encoded_frames"] = index["encoded_frames"]
+        self.metrics.export()
+        logging.info(
+            f"{stats['clips']} clips saved to {saving_dir} ({stats['frames']} frames, {stats['encoded_frames']} encoded, {stats['fps']:.2f} frames/s)"
+        )
+        return stats
+
+    def _iter_results(
+        self,
+        cap: cv2.VideoCapture,
+        batch_size: int = 1,
+        keyframe_interval: int = 1,
+        video_path: str = None,
+        pool: FramePool = None,
+        **kwargs,
+    ) -> Iterator[Results]:
+        """
+        Runs the model over a video or reads its predictions from the cache.
+
+        :param cap: Opened video capture
+        :param batch_size: Number of frames passed to the model at once
+        :param keyframe_interval: Run the model only on every `keyframe_interval`-th frame
+        :param video_path: Path to the video, the cache is used only if provided
+        :param pool: Decode into its buffers, a frame is released once the predictions
+            of its batch are consumed
+        :return: Iterator over predictions, one per frame
+        """
+        key = self._cache_key(video_path, keyframe_interval, **kwargs)
+        if key is not None:
+            yield from self._cached_results(key, cap, batch_size, pool=pool, **kwargs)
+            return
+        if keyframe_interval > 1:
+            from tracking import KeyframeRunner
+
+            runner = KeyframeRunner(self, keyframe_interval=keyframe_interval, **kwargs)
+            yield from runner(self._read_frames(cap, pool))
+            return
+        for frames in self._read_batches(cap, batch_size, pool):
+            yield from self.predict(frames, **kwargs)
+            if pool is not None:
+                for frame in frames:
+                    pool.release(frame)
+
+    def _cache_key(
+        self,
+        video_path: str = None,
+        keyframe_interval: int = 1,
+        conf: float = 0.5,
+        imgsz: int = None,
+        **kwargs,
+    ) -> Optional[str]:
+        """
+        :return: Cache key of the video predictions or None if they can't be cached
+            (no cache, keyframe tracking, a threshold below the cached one, a custom resolution
+            or other prediction arguments, which the key doesn't cover)
+        """
+        if (
+            self.cache is None
+            or video_path is None
+            or keyframe_interval > 1
+            or imgsz is not None
+            or conf < self.cache.base_conf
+            or set(kwargs) - {"verbose"}
+        ):
+            return None
+        return self.cache.key(video_path, self._predictions_hash())
+
+    def _predictions_hash(self) -> str:
+        """
+        Hash of the model weights and of the settings the raw predictions depend on
+        """
+        if self._weights_hash is None:
+            checkpoint = getattr(self._model, "ckpt_path", None) or self._model.model
+            if isinstance(checkpoint, str) and os.path.isfile(checkpoint):
+                self._weights_hash = file_hash(checkpoint)
+            else:
+                digest = hashlib.blake2b(digest_size=16)
+                for name, tensor in self._model.model.state_dict().items():
+                    digest.update(name.encode())
+                    digest.update(tensor.detach().cpu().numpy().tobytes())
+                self._weights_hash = digest.hexdigest()
+        overrides = self._model.overrides
+        settings = [
+            overrides.get(name)
+            for name in ["imgsz", "iou", "max_det", "classes", "agnostic_nms", "half"]
+        ]
+        tiler = sorted(vars(self.tiler).items()) if self.tiler is not None else None
+        digest = hashlib.blake2b(digest_size=8)
+        digest.update(
+            repr((self._weights_hash, settings, tiler, self.cache.base_conf)).encode()
+        )
+        return digest.hexdigest()
+
+    def _cached_results(
+        self,
+        key: str,
+        cap: cv2.VideoCapture,
+        batch_size: int = 1,
+        verbose: bool = False,
+        conf: float = 0.5,
+        pool: FramePool = None,
+    ) -> Iterator[Results]:
+        """
+        Yields predictions of a video from the cache. On a miss runs the model at the cache
+        threshold, yields the predictions filtered at `conf` and caches the raw ones once the
+        whole video is processed. Filtering after NMS keeps the same boxes as running at `conf`,
+        since a box can be suppressed only by a box with a higher confidence.
+
+        :param key: Cache key of the video
+        :param cap: Opened video capture
+        :param batch_size: Number of frames passed to the model at once
+        :param verbose: Verbose predictions
+        :param conf: Confidence threshold
+        :param pool: Decode into its buffers, a frame is released once the predictions
+            of its batch are consumed
+        :return: Iterator over predictions, one per frame
+        """
+        cached = self.cache.get(key)
+        if cached is not None:
+            import torch
+            from ultralytics.engine.results import Results
+
+            empty = np.empty((0, 6), dtype=np.float32)
+            for frame_idx, frame in enumerate(self._read_frames(cap, pool)):
+                boxes = (
+                    cached.frame(frame_idx, conf) if frame_idx < len(cached) else empty
+                )
+                yield Results(
+                    orig_img=frame,
+                    path="",
+                    names=self._model.names,
+                    boxes=torch.from_numpy(boxes),
+                )
+            return
+        raw_boxes = []
+        for frames in self._read_batches(cap, batch_size, pool):
+            results = self.predict(frames, verbose=verbose, conf=self.cache.base_conf)
+            for result in results:
+                boxes = result.boxes.data
+                raw_boxes.append(boxes.cpu().numpy())
+                result.update(boxes=boxes[boxes[:, 4] >= conf])
+                yield result
+            if pool is not None:
+                for frame in frames:
+                    pool.release(frame)
+        self.cache.put(key, raw_boxes)
+
+    @staticmethod
+    def _open_video(
+        video_path: str, saving_path: str = None
+    ) -> Tuple[cv2.VideoCapture, cv2.VideoWriter, str]:
+        """
+        Opens the input video and creates a writer for the annotated one.
+
+        :param video_path: Path to the video
+        :param saving_path: Path where the annotated video will be saved
+        :return: Video capture, video writer and the resolved saving path
         """
         if not saving_path:
             name, extension = video_path.split(".")
             saving_path = f"{name}_annotated.{extension}"
         cap = cv2.VideoCapture(video_path)
-        frame_num = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
         frame_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         frame_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fourcc = cv2.VideoWriter_fourcc(*"mp4v")
         video_writer = cv2.VideoWriter(
             saving_path, fourcc, 30, (frame_width, frame_height)
         )
+        return cap, video_writer, saving_path
 
+    def _read_batches(
+        self, cap: cv2.VideoCapture, batch_size: int, pool: FramePool = None
+    ) -> Iterator[List[np.ndarray]]:
+        """
+        Reads decoded frames from a video in batches. The last batch may be shorter.
+
+        :param cap: Opened video capture
+        :param batch_size: Number of frames in a batch
+        :param pool: Decode into its buffers, the caller releases them
+        :return: Iterator over lists of frames
+        """
+        assert batch_size >= 1, "`batch_size` must be a positive integer"
+        frames = []
         while cap.isOpened():
-            success, frame = cap.read()
-            if success:
-                annotated_frame = self.process_frame(frame, verbose=False, **kwargs)
-                video_writer.write(annotated_frame)
-            else:
+            with self.metrics.time("decode"):
+                if pool is not None:
+                    frame = pool.read(cap)
+                    success = frame is not None
+                else:
+                    success, frame = cap.read()
+            if not success:
                 break
-        cap.release()
-        logging.info(f"Annotated video saved to {saving_path}")
+            frames.append(frame)
+            if len(frames) == batch_size:
+                yield frames
+                frames = []
+        if frames:
+            yield frames
+
+    def _read_frames(
+        self, cap: cv2.VideoCapture, pool: FramePool = None
+    ) -> Iterator[np.ndarray]:
+        """
+        Reads decoded frames one by one. A pooled frame is released when the next one
+        is requested, so the consumer must be done with it by then.
+
+        :param cap: Opened video capture
+        :param pool: Decode into its buffers
+        :return: Iterator over frames
+        """
+        for frames in self._read_batches(cap, 1, pool):
+            yield frames[0]
+            if pool is not None:
+                pool.release(frames[0])
+
+    @staticmethod
+    def _pool_stats(stats: Dict[str, Any], pool: FramePool = None):
+        """
+        Adds the frame pool stats and the resident memory to the run stats
+        """
+        if pool is None:
+            return
+        stats["frame_pool"] = pool.stats()
+        stats["memory"] = memory_stats()
+        logging.info(f"Frame pool: {stats['frame_pool']}, memory: {stats['memory']}")
+
+    @staticmethod
+    def _throughput(frame_counter: int, elapsed: float) -> Dict[str, float]:
+        """
+        Builds throughput stats of a processing run.
+
+        :param frame_counter: Number of processed frames
+        :param elapsed: Elapsed wall time in seconds
+        :return: Dict with number of frames, elapsed seconds and frames per second
+        """
+        fps = frame_counter / elapsed if elapsed > 0 else 0.0
+        return {"frames": frame_counter, "seconds": elapsed, "fps": fps}
@@ -1,30 +1,118 @@
+import hashlib
 import json
 import logging
+import os
 import re
-from typing import List
+from typing import TYPE_CHECKING, Dict, Iterable, List, Tuple
 
-import pandas as pd
-from ultralytics.engine.results import Boxes
 from utils.project_utils import get_labels
 
+if TYPE_CHECKING:
+    import pandas as pd
+    from ultralytics.engine.results import Boxes
+
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
+def _labels_hash(labels: List[str]) -> str:
+    return hashlib.sha256("\n".join(labels).encode()).hexdigest()
+
+
+class SignIndex:
+    def __init__(self, signs: Iterable[Tuple[str, str]]):
+        """
+        Index over sign codes: a dict for exact lookups and a prefix trie over the dotted
+        code components (e.g. 5 -> 2 -> 1 for 5.2.1) for the subclass and parent fallbacks
+        :param signs: Pairs of sign code (e.g. 1.2, 5.2.1 etc) and sign name
+        """
+        self.names = {}
+        self.trie = {"children": {}, "name": ""}
+        for code, name in signs:
+            code = str(code)
+            if code in self.names:  # the first row wins, as with the dataframe lookup
+                continue
+            self.names[code] = str(name)
+            node = self.trie
+            for part in code.split("."):
+                node = node["children"].setdefault(part, {"children": {}, "name": ""})
+            node["name"] = str(name)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def get(self, code: str) -> str:
+        """
+        Gets a sign name by its code
+        :param code: Sign code with dots (e.g. 1.2, 5.2.1 etc)
+        :return: Sign name or empty string
+        """
+        return self.names.get(code, "")
+
+    def resolve(self, parts: List[str]) -> str:
+        """
+        Gets a sign name by the code itself, then by its first subclass (`_1` suffix),
+        then by its parent code, walking the trie once
+        :param parts: Sign code components (e.g. ['5', '2', '1'])
+        :return: Sign name or empty string
+        """
+        parent = self.trie
+        for part in parts[:-1]:
+            parent = parent["children"].get(part)
+            if parent is None:
+                return ""
+        for leaf in [parts[-1], parts[-1] + "_1"]:
+            node = parent["children"].get(leaf)
+            if node is not None and node["name"]:
+                return node["name"]
+        return parent["name"]
+
+    def content_hash(self) -> str:
+        """
+        :return: Hash of the indexed codes and names
+        """
+        content = json.dumps(sorted(self.names.items()), ensure_ascii=False)
+        return hashlib.sha256(content.encode()).hexdigest()
+
+
 class Mapper:
     def __init__(
-        self, signs: pd.DataFrame, labels_path: str, saving_path: str = "mapping.json"
+        self,
+        signs: "pd.DataFrame",
+        labels_path: str,
+        saving_path: str = "mapping.json",
+        compiled_path: str = None,
     ):
         """
+        :param signs: Pandas dataframe containing traffic sign codes (e.g. 1.2, 5.2.1 etc) and their names.
+            May be None if the mapping is loaded from a compiled artifact
         :param labels_path: Path to the file containing labels
-        :param table_path: Path where the parsed table will be saved
-        :param dict_path: Path where the final mapping dict will be saved
+        :param saving_path: Path where the final mapping dict will be saved
+        :param compiled_path: Path of the compiled mapping artifact. If it exists and matches
+            the signs and the labels, `create` loads it instead of deriving the mapping
         """
         self.signs = signs
         self.labels_path = labels_path
         self.saving_path = saving_path
+        self.compiled_path = compiled_path
+        self.index = (
+            SignIndex(zip(signs["id"].tolist(), signs["name"].tolist()))
+            if signs is not None
+            else None
+        )
+        self.version = 0
         self.mapping = {}
 
+    @property
+    def mapping(self) -> Dict[str, str]:
+        return self._mapping
+
+    @mapping.setter
+    def mapping(self, mapping: Dict[str, str]):
+        # consumers caching names derived from the mapping compare versions to invalidate them
+        self._mapping = mapping
+        self.version += 1
+
     def create(self, save: bool = True):
         """
         Creates the mapping from sign label to sign name
@@ -34,11 +122,64 @@ class Mapper:
         :param save_dict: Whether to save the final mapping dict
         """
         labels = get_labels(self.labels_path)
+        content_hash = self.content_hash(labels)
+        if self.compiled_path and os.path.exists(self.compiled_path):
+            with open(self.compiled_path) as jf:
+                compiled = json.load(jf)
+            if compiled["hash"] == content_hash:
+                self.mapping = compiled["mapping"]
+                logging.info(f"Compiled mapping loaded from {self.compiled_path}")
+                return
         self.mapping = self.get_mapping(labels)
         if save:
             with open(self.saving_path, "w") as jf:
                 json.dump(self.mapping, jf, ensure_ascii=False)
             logging.info(f"Mapping saved to {self.saving_path}")
+        if self.compiled_path:
+            self.save_compiled(labels)
+
+    def content_hash(self, labels: List[str]) -> str:
+        """
+        Hash of everything the mapping is derived from: the labels and the sign table
+        :param labels: List of labels with under_scores (e.g. 1_2, 5_2_1 etc)
+        :return: Hex digest
+        """
+        labels_hash = _labels_hash(labels)
+        signs_hash = self.index.content_hash() if self.index is not None else ""
+        return hashlib.sha256(f"{labels_hash}:{signs_hash}".encode()).hexdigest()
+
+    def save_compiled(self, labels: List[str]):
+        """
+        Saves the mapping together with the hash of its inputs to `compiled_path`
+        :param labels: List of labels the mapping was created from
+        """
+        compiled = {
+            "hash": self.content_hash(labels),
+            "labels_hash": _labels_hash(labels),
+            "mapping": self.mapping,
+        }
+        with open(self.compiled_path, "w") as jf:
+            json.dump(compiled, jf, ensure_ascii=False)
+        logging.info(f"Compiled mapping saved to {self.compiled_path}")
+
+    @classmethod
+    def load_compiled(cls, compiled_path: str, labels_path: str) -> "Mapper":
+        """
+        Loads a mapper from a compiled artifact without the sign table, e.g. on a service restart
+        :param compiled_path: Path of the compiled mapping artifact
+        :param labels_path: Path to the file containing labels
+        :return: Mapper with the mapping ready to use
+        """
+        with open(compiled_path) as jf:
+            compiled = json.load(jf)
+        labels = get_labels(labels_path)
+        labels_hash = _labels_hash(labels)
+        assert (
+            compiled["labels_hash"] == labels_hash
+        ), f"{compiled_path} was compiled for other labels, please recreate it calling the `create` method"
+        mapper = cls(None, labels_path, compiled_path=compiled_path)
+        mapper.mapping = compiled["mapping"]
+        return mapper
 
     def get_name(self, label: str):
         """
@@ -46,10 +187,7 @@ class Mapper:
         :param code: Sign code with do.ts (e.g. 1.2, 5.2.1 etc)
         :return: Sign name
         """
-        row = self.signs["name"].loc[self.signs.id == label].values
-        if row.any():
-            return str(row[0])
-        return ""
+        return self.index.get(label)
 
     def get_name_by_label(self, label: str):
         """
@@ -57,17 +195,7 @@ class Mapper:
         :param label: Label with under_scores (e.g. 1_2, 5_2_1 etc)
         :return: Sign name or empty string
         """
-        full_label = label.replace("_", ".")
-        name = self.get_name(full_label)
-        if name:
-            return name
-        subclass_label = label.replace("_", ".") + "_1"
-        name = self.get_name(subclass_label)
-        if name:
-            return name
-        hyperclass_label = ".".join(label.split("_")[:-1])
-        name = self.get_name(hyperclass_label)
-        return name
+        return self.index.resolve(label.split("_"))
 
     def get_mapping(self, labels: List[str]):
         """
@@ -98,7 +226,19 @@ class Mapper:
         ), f"Please create mapping calling the `create` method"
         return self.mapping.get(label, "")
 
-    def replace_names(self, result: Boxes) -> Boxes:
+    def compile_names(self, names: Dict[int, str]) -> Dict[int, str]:
+        """
+        Maps model class names to sign names once, so they can be reused for every frame
+        (e.g. {0 : '2_1'} -> {0 : 'Главная дорога'})
+        :param names: Model class names by class id
+        :return: New dict with sign names by class id
+        """
+        return {
+            key: self.label2name(label) if re.match("(.*_.*)+", label) else label
+            for key, label in names.items()
+        }
+
+    def replace_names(self, result: "Boxes") -> "Boxes":
         """
         Replaces label names in the model (e.g. {0 : '2_1'} -> {0 : 'Главная дорога'})
         :param label: yolo model
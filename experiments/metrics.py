@@ -0,0 +1,360 @@
+import bisect
+import collections
+import contextlib
+import json
+import logging
+import os
+import threading
+import time
+from abc import ABC, abstractmethod
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Sequence
+
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# upper bounds of the latency histogram buckets in seconds
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+)
+
+
+class _Series:
+    def __init__(self, buckets: Sequence[float], window: int):
+        """
+        Observations of a single stage: count, sum, cumulative histogram and the latest values
+        for rolling percentiles.
+        """
+        self.count = 0
+        self.sum = 0.0
+        self.buckets = buckets
+        self.bucket_counts = [0] * (len(buckets) + 1)
+        self.latest = collections.deque(maxlen=window)
+
+    def observe(self, seconds: float):
+        self.count += 1
+        self.sum += seconds
+        self.bucket_counts[bisect.bisect_left(self.buckets, seconds)] += 1
+        self.latest.append(seconds)
+
+    def snapshot(self, qs: Sequence[float]) -> Dict[str, Any]:
+        if self.latest:
+            values = np.percentile(np.array(self.latest) * 1000, qs)
+        else:
+            values = [0.0] * len(qs)
+        return {
+            "count": self.count,
+            "sum_seconds": self.sum,
+            "mean_ms": self.sum / self.count * 1000 if self.count else 0.0,
+            **{f"p{q:g}_ms": float(v) for q, v in zip(qs, values)},
+        }
+
+
+class _Timer:
+    __slots__ = ("metrics", "name", "start")
+
+    def __init__(self, metrics: "Metrics", name: str):
+        self.metrics = metrics
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.metrics.observe(
+            self.name, time.perf_counter() - self.start, start=self.start
+        )
+
+
+class Metrics:
+    enabled = True
+
+    def __init__(
+        self,
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+        window: int = 1000,
+        percentiles: Sequence[float] = (50, 90, 99),
+        trace: bool = False,
+        max_trace_events: int = 1_000_000,
+        exporters: List["MetricsExporter"] = (),
+    ):
+        """
+        Per-stage timings of the detector: counts, latency histograms and rolling percentiles.
+        Thread safe, so pipeline stages running in their own threads can share it.
+
+        :param buckets: Upper bounds of the histogram buckets in seconds
+        :param window: Number of latest observations per stage the percentiles are computed on
+        :param percentiles: Percentiles reported in snapshots
+        :param trace: Keep every timed span for a Chrome trace (see `ChromeTraceExporter`)
+        :param max_trace_events: Spans kept at most, the later ones are not recorded
+        :param exporters: Called by `export` with this object
+        """
+        self.buckets = tuple(buckets)
+        self.window = window
+        self.percentiles = tuple(percentiles)
+        self.trace = trace
+        self.max_trace_events = max_trace_events
+        self.exporters = list(exporters)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.series: Dict[str, _Series] = {}
+            self.counters: Dict[str, float] = collections.defaultdict(float)
+            self.events: List[Dict[str, Any]] = []
+            self._origin = time.perf_counter()
+
+    def time(self, name: str):
+        """
+        Times the enclosed block as stage `name`:
+
+            with metrics.time("render"):
+                ...
+        """
+        return _Timer(self, name)
+
+    def observe(self, name: str, seconds: float, start: float = None):
+        """
+        Records the duration of a stage
+        :param name: Stage name
+        :param seconds: Duration in seconds
+        :param start: `time.perf_counter()` at the start of the stage, for the trace
+        """
+        with self._lock:
+            series = self.series.get(name)
+            if series is None:
+                series = self.series[name] = _Series(self.buckets, self.window)
+            series.observe(seconds)
+            if (
+                self.trace
+                and start is not None
+                and len(self.events) < self.max_trace_events
+            ):
+                self.events.append(
+                    {
+                        "name": name,
+                        "ph": "X",
+                        "ts": (start - self._origin) * 1e6,
+                        "dur": seconds * 1e6,
+                        "pid": os.getpid(),
+                        "tid": threading.get_ident(),
+                    }
+                )
+
+    def count(self, name: str, value: float = 1):
+        """
+        Increments a counter (e.g. processed frames)
+        """
+        with self._lock:
+            self.counters[name] += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        :return: Counters and per-stage count, total seconds, mean and percentiles in milliseconds
+        """
+        with self._lock:
+            return {
+                "time": time.time(),
+                "counters": dict(self.counters),
+                "stages": {
+                    name: series.snapshot(self.percentiles)
+                    for name, series in self.series.items()
+                },
+            }
+
+    def to_prometheus(self, prefix: str = "detector") -> str:
+        """
+        :param prefix: Metric name prefix
+        :return: Metrics in the Prometheus text exposition format
+        """
+        lines = []
+        with self._lock:
+            for name, value in self.counters.items():
+                lines += [
+                    f"# TYPE {prefix}_{name}_total counter",
+                    f"{prefix}_{name}_total {value:g}",
+                ]
+            metric = f"{prefix}_stage_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            for name, series in self.series.items():
+                cumulative = np.cumsum(series.bucket_counts)
+                for bound, count in zip(series.buckets, cumulative):
+                    lines.append(
+                        f'{metric}_bucket{{stage="{name}",le="{bound:g}"}} {count}'
+                    )
+                lines += [
+                    f'{metric}_bucket{{stage="{name}",le="+Inf"}} {series.count}',
+                    f'{metric}_sum{{stage="{name}"}} {series.sum:.6f}',
+                    f'{metric}_count{{stage="{name}"}} {series.count}',
+                ]
+            metric = f"{prefix}_stage_rolling_seconds"
+            lines.append(f"# TYPE {metric} summary")
+            for name, series in self.series.items():
+                if not series.latest:
+                    continue
+                values = np.percentile(np.array(series.latest), self.percentiles)
+                for q, value in zip(self.percentiles, values):
+                    lines.append(
+                        f'{metric}{{stage="{name}",quantile="{q / 100:g}"}} {value:.6f}'
+                    )
+        return "\n".join(lines) + "\n"
+
+    def export(self):
+        """
+        Passes the metrics to every exporter
+        """
+        for exporter in self.exporters:
+            exporter.export(self)
+
+
+class NullMetrics(Metrics):
+    """
+    Disabled metrics: every call is a no-op, so instrumented code pays only a method call.
+    """
+
+    enabled = False
+
+    def __init__(self):
+        super().__init__()
+
+    def time(self, name: str):
+        return _NULL_CONTEXT
+
+    def observe(self, name: str, seconds: float, start: float = None):
+        pass
+
+    def count(self, name: str, value: float = 1):
+        pass
+
+    def export(self):
+        pass
+
+
+_NULL_CONTEXT = contextlib.nullcontext()
+NULL_METRICS = NullMetrics()
+
+
+class MetricsExporter(ABC):
+    """
+    Writes metrics somewhere when `Metrics.export` is called
+    """
+
+    @abstractmethod
+    def export(self, metrics: Metrics):
+        pass
+
+
+class PrometheusFileExporter(MetricsExporter):
+    def __init__(self, path: str, prefix: str = "detector"):
+        """
+        Writes the Prometheus text format to a file, e.g. for the node exporter textfile collector.
+        The file is replaced atomically.
+
+        :param path: Path to the `.prom` file
+        :param prefix: Metric name prefix
+        """
+        self.path = path
+        self.prefix = prefix
+
+    def export(self, metrics: Metrics):
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w") as f:
+            f.write(metrics.to_prometheus(self.prefix))
+        os.replace(tmp_path, self.path)
+
+
+class JsonExporter(MetricsExporter):
+    def __init__(self, path: str, append: bool = True):
+        """
+        Saves metric snapshots as json
+        :param path: Path to the file
+        :param append: Append a snapshot per line (jsonl) instead of overwriting the file
+        """
+        self.path = path
+        self.append = append
+
+    def export(self, metrics: Metrics):
+        snapshot = metrics.snapshot()
+        if self.append:
+            with open(self.path, "a") as f:
+                f.write(json.dumps(snapshot) + "\n")
+        else:
+            with open(self.path, "w") as f:
+                json.dump(snapshot, f, indent=2)
+
+
+class ChromeTraceExporter(MetricsExporter):
+    def __init__(self, path: str):
+        """
+        Dumps the timed spans in the trace event format, which can be opened in
+        chrome://tracing or https://ui.perfetto.dev. Needs `Metrics(trace=True)`.
+
+        :param path: Path to the json trace
+        """
+        self.path = path
+
+    def export(self, metrics: Metrics):
+        if not metrics.trace:
+            logging.warning("Tracing is disabled, pass `trace=True` to `Metrics`")
+        with metrics._lock:
+            events = list(metrics.events)
+        with open(self.path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+
+
+class PrometheusServer:
+    def __init__(
+        self,
+        metrics: Metrics,
+        port: int = 9100,
+        host: str = "127.0.0.1",
+        prefix: str = "detector",
+    ):
+        """
+        Serves the metrics in the Prometheus text format on http://<host>:<port>/metrics
+        from a background thread.
+
+        :param metrics: Metrics to serve
+        :param port: Port
+        :param host: Interface to listen on
+        :param prefix: Metric name prefix
+        """
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = metrics.to_prometheus(prefix).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        logging.info(f"Serving metrics on http://{host}:{port}/metrics")
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
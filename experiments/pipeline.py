@@ -0,0 +1,276 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict
+
+import cv2
+from frame_pool import FramePool
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+_END = object()  # marks the end of the stream between stages
+
+
+class _Stage:
+    def __init__(self, name: str):
+        """
+        Bookkeeping of a single pipeline stage.
+
+        :param name: Stage name
+        """
+        self.name = name
+        self.busy = 0.0
+        self.items = 0
+
+    def stats(self, elapsed: float) -> Dict[str, float]:
+        """
+        :param elapsed: Wall time of the whole run in seconds
+        :return: Busy seconds, processed items and utilization of the stage
+        """
+        utilization = self.busy / elapsed if elapsed > 0 else 0.0
+        return {"busy": self.busy, "items": self.items, "utilization": utilization}
+
+
+class _Queue(queue.Queue):
+    def __init__(self, name: str, maxsize: int):
+        """
+        Bounded queue between two stages which samples its depth on every put.
+
+        :param name: Queue name
+        :param maxsize: Maximum number of waiting items
+        """
+        super().__init__(maxsize=maxsize)
+        self.name = name
+        self.depth_sum = 0
+        self.depth_max = 0
+        self.puts = 0
+
+    def sample(self):
+        depth = self.qsize()
+        self.depth_sum += depth
+        self.depth_max = max(self.depth_max, depth)
+        self.puts += 1
+
+    def stats(self) -> Dict[str, float]:
+        """
+        :return: Maximum and mean depth of the queue and its capacity
+        """
+        mean = self.depth_sum / self.puts if self.puts else 0.0
+        return {"max": self.depth_max, "mean": mean, "capacity": self.maxsize}
+
+
+class VideoPipeline:
+    def __init__(
+        self,
+        detector,
+        batch_size: int = 1,
+        queue_size: int = 8,
+        verbose: bool = False,
+        conf: float = 0.5,
+        pool: FramePool = None,
+    ):
+        """
+        Processes a video with concurrent decode, inference, render and encode stages.
+        Stages are joined by bounded queues, so a slow stage blocks the ones before it
+        instead of letting frames pile up in memory. Every stage has a single worker,
+        which keeps the output frames in the input order.
+
+        :param detector: Detector used for inference and rendering
+        :param batch_size: Number of frames passed to the model at once
+        :param queue_size: Maximum number of items waiting between two stages
+        :param verbose: Verbose predictions
+        :param conf: Confidence threshold
+        :param pool: Decode into its buffers and return them once the frame is encoded.
+            It needs at least `batch_size` buffers, with fewer the decode stage waits for free ones
+        """
+        assert batch_size >= 1, "`batch_size` must be a positive integer"
+        assert queue_size >= 1, "`queue_size` must be a positive integer"
+        self.detector = detector
+        self.batch_size = batch_size
+        self.queue_size = queue_size
+        self.verbose = verbose
+        self.conf = conf
+        self.pool = pool
+        self._stop = threading.Event()
+        self._errors = []
+
+    def run(
+        self, cap: cv2.VideoCapture, video_writer: cv2.VideoWriter
+    ) -> Dict[str, Any]:
+        """
+        Runs the pipeline until the video is exhausted. Releases the capture and the writer.
+
+        :param cap: Opened video capture
+        :param video_writer: Opened video writer
+        :return: Throughput stats with per-stage busy time and queue depths
+        """
+        self._stop.clear()
+        self._errors = []
+        decoded = _Queue("decoded", self.queue_size)
+        predicted = _Queue("predicted", self.queue_size)
+        rendered = _Queue("rendered", self.queue_size)
+        stages = {
+            name: _Stage(name) for name in ["decode", "infer", "render", "encode"]
+        }
+
+        workers = [
+            (self._decode, (cap, decoded, stages["decode"])),
+            (self._infer, (decoded, predicted, stages["infer"])),
+            (self._render, (predicted, rendered, stages["render"])),
+            (self._encode, (rendered, video_writer, stages["encode"])),
+        ]
+        threads = [
+            threading.Thread(
+                target=self._guard, args=(target, *args), name=f"pipeline-{name}"
+            )
+            for (target, args), name in zip(workers, stages)
+        ]
+        start = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - start
+        cap.release()
+        video_writer.release()
+        if self._errors:
+            raise self._errors[0]
+
+        frames = stages["encode"].items
+        stage_stats = {name: stage.stats(elapsed) for name, stage in stages.items()}
+        return {
+            "frames": frames,
+            "seconds": elapsed,
+            "fps": frames / elapsed if elapsed > 0 else 0.0,
+            "stages": stage_stats,
+            "queues": {q.name: q.stats() for q in [decoded, predicted, rendered]},
+            "bottleneck": max(stage_stats, key=lambda name: stage_stats[name]["busy"]),
+        }
+
+    def _guard(self, target: Callable, *args):
+        """
+        Runs a stage and stops the whole pipeline if it fails.
+        """
+        try:
+            target(*args)
+        except Exception as e:
+            logging.exception(
+                f"Pipeline stage {threading.current_thread().name} failed"
+            )
+            self._errors.append(e)
+            self._stop.set()
+
+    def _put(self, q: _Queue, item: Any):
+        """
+        Blocks until there is room in the queue (backpressure) or the pipeline is stopped.
+        """
+        while not self._stop.is_set():
+            try:
+                q.put(item, timeout=0.1)
+                q.sample()
+                return
+            except queue.Full:
+                continue
+
+    def _get(self, q: _Queue) -> Any:
+        """
+        Blocks until an item is available or the pipeline is stopped.
+        """
+        while not self._stop.is_set():
+            try:
+                return q.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return _END
+
+    def _acquire(self):
+        """
+        Blocks until a pool buffer is free or the pipeline is stopped.
+        """
+        while not self._stop.is_set():
+            buffer = self.pool.acquire(timeout=0.1)
+            if buffer is not None:
+                return buffer
+        return None
+
+    def _decode(self, cap: cv2.VideoCapture, out: _Queue, stage: _Stage):
+        try:
+            while cap.isOpened() and not self._stop.is_set():
+                if self.pool is not None:
+                    buffer = self._acquire()
+                    if buffer is None:
+                        break
+                    start = time.perf_counter()
+                    frame = self.pool.read_into(cap, buffer)
+                    success = frame is not None
+                else:
+                    start = time.perf_counter()
+                    success, frame = cap.read()
+                elapsed = time.perf_counter() - start
+                stage.busy += elapsed
+                self.detector.metrics.observe("decode", elapsed, start=start)
+                if not success:
+                    break
+                stage.items += 1
+                self._put(out, frame)
+        finally:
+            self._put(out, _END)
+
+    def _infer(self, inp: _Queue, out: _Queue, stage: _Stage):
+        try:
+            finished = False
+            while not finished:
+                frames = []
+                while len(frames) < self.batch_size:
+                    frame = self._get(inp)
+                    if frame is _END:
+                        finished = True
+                        break
+                    frames.append(frame)
+                if not frames:
+                    break
+                start = time.perf_counter()
+                results = self.detector.predict(
+                    frames, verbose=self.verbose, conf=self.conf
+                )
+                stage.busy += time.perf_counter() - start
+                stage.items += len(results)
+                for result, frame in zip(results, frames):
+                    if self.pool is not None and result.orig_img is not frame:
+                        self.pool.release(frame)
+                    self._put(out, result)
+        finally:
+            self._put(out, _END)
+
+    def _render(self, inp: _Queue, out: _Queue, stage: _Stage):
+        try:
+            while True:
+                result = self._get(inp)
+                if result is _END:
+                    break
+                start = time.perf_counter()
+                annotated_frame = self.detector.annotate(result)
+                stage.busy += time.perf_counter() - start
+                if self.pool is not None and annotated_frame is not result.orig_img:
+                    # drawn on a copy, the decoded frame isn't needed anymore
+                    self.pool.release(result.orig_img)
+                stage.items += 1
+                self._put(out, annotated_frame)
+        finally:
+            self._put(out, _END)
+
+    def _encode(self, inp: _Queue, video_writer: cv2.VideoWriter, stage: _Stage):
+        while True:
+            annotated_frame = self._get(inp)
+            if annotated_frame is _END:
+                break
+            start = time.perf_counter()
+            video_writer.write(annotated_frame)
+            elapsed = time.perf_counter() - start
+            stage.busy += elapsed
+            self.detector.metrics.observe("encode", elapsed, start=start)
+            if self.pool is not None:
+                self.pool.release(annotated_frame)
+            stage.items += 1
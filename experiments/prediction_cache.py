@@ -0,0 +1,161 @@
+import logging
+import os
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from utils.hashing import file_hash
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class CachedPredictions:
+    def __init__(self, boxes: np.ndarray, offsets: np.ndarray):
+        """
+        Raw predictions of a whole video: rows (x1, y1, x2, y2, conf, cls) of all frames
+        concatenated, the boxes of frame `i` are `boxes[offsets[i]:offsets[i + 1]]`.
+        """
+        self.boxes = boxes
+        self.offsets = offsets
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def frame(self, frame_idx: int, conf: float = 0.0) -> np.ndarray:
+        """
+        :param frame_idx: Index of the frame
+        :param conf: Confidence threshold
+        :return: Boxes of the frame with confidence not lower than `conf`
+        """
+        boxes = self.boxes[self.offsets[frame_idx] : self.offsets[frame_idx + 1]]
+        return boxes[boxes[:, 4] >= conf]
+
+
+class PredictionCache:
+    def __init__(
+        self, cache_dir: str, max_bytes: int = 1 << 30, base_conf: float = 0.05
+    ):
+        """
+        On-disk store of raw low-threshold predictions, one `.npz` file per video and model
+        configuration. Runs at any threshold not lower than `base_conf` and re-renders are
+        served from it without running the model. Entries are evicted in least recently used
+        order once the cache outgrows `max_bytes`. Usage is tracked with file modification
+        times, so several processes can share the directory.
+
+        :param cache_dir: Cache directory
+        :param max_bytes: Maximum size of the cache
+        :param base_conf: Confidence threshold the cached predictions are made with
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.base_conf = base_conf
+        self.hits = 0
+        self.misses = 0
+        self._video_hashes: Dict[Tuple[str, int, float], str] = {}
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def video_hash(self, video_path: str) -> str:
+        """
+        Content hash of a video, remembered while its size and modification time stay the same
+        """
+        stat = os.stat(video_path)
+        memo_key = (os.path.abspath(video_path), stat.st_size, stat.st_mtime)
+        if memo_key not in self._video_hashes:
+            self._video_hashes[memo_key] = file_hash(video_path)
+        return self._video_hashes[memo_key]
+
+    def key(self, video_path: str, model_key: str) -> str:
+        """
+        :param video_path: Path to the video
+        :param model_key: Hash of the checkpoint and the prediction settings
+        :return: Cache key
+        """
+        return f"{self.video_hash(video_path)}-{model_key}"
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def __contains__(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> Optional[CachedPredictions]:
+        """
+        :param key: Cache key
+        :return: Cached predictions or None
+        """
+        path = self._path(key)
+        try:
+            with np.load(path) as data:
+                predictions = CachedPredictions(data["boxes"], data["offsets"])
+            os.utime(path)
+        except (OSError, KeyError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return predictions
+
+    def put(self, key: str, boxes: List[np.ndarray]):
+        """
+        Saves the predictions of a video and evicts the least recently used entries if needed.
+
+        :param key: Cache key
+        :param boxes: Boxes of every frame, arrays of shape (n, 6)
+        """
+        offsets = np.zeros(len(boxes) + 1, dtype=np.int64)
+        np.cumsum([len(frame_boxes) for frame_boxes in boxes], out=offsets[1:])
+        data = (
+            np.concatenate(boxes).astype(np.float32)
+            if boxes
+            else np.empty((0, 6), np.float32)
+        )
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, boxes=data, offsets=offsets)
+        os.replace(tmp_path, path)
+        logging.info(f"Cached {len(data)} predictions of {len(boxes)} frames in {path}")
+        self.evict()
+
+    def evict(self, max_bytes: int = None) -> int:
+        """
+        Removes the least recently used entries until the cache fits the limit
+        :param max_bytes: Size limit, `self.max_bytes` if not provided
+        :return: Number of removed entries
+        """
+        max_bytes = self.max_bytes if max_bytes is None else max_bytes
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+        if removed:
+            logging.info(f"Evicted {removed} cached predictions from {self.cache_dir}")
+        return removed
+
+    def size(self) -> int:
+        """
+        :return: Size of the cached predictions in bytes
+        """
+        return sum(
+            entry.stat().st_size
+            for entry in os.scandir(self.cache_dir)
+            if entry.name.endswith(".npz")
+        )
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size_mb": self.size() / 2**20,
+        }
@@ -0,0 +1,132 @@
+import collections
+import json
+import logging
+from typing import Any, Dict, List, NamedTuple, Sequence
+
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class QualityLevel(NamedTuple):
+    imgsz: int  # inference resolution
+    frame_skip: int  # process every `frame_skip`-th frame
+    conf: float  # confidence threshold
+
+
+# from the best quality to the cheapest one
+DEFAULT_LEVELS = [
+    QualityLevel(640, 1, 0.5),
+    QualityLevel(512, 1, 0.5),
+    QualityLevel(416, 1, 0.55),
+    QualityLevel(416, 2, 0.55),
+    QualityLevel(320, 2, 0.6),
+    QualityLevel(320, 3, 0.6),
+]
+
+
+class AdaptiveQualityController:
+    def __init__(
+        self,
+        target_fps: float,
+        levels: Sequence[QualityLevel] = DEFAULT_LEVELS,
+        window: int = 30,
+        degrade_ratio: float = 1.0,
+        upgrade_ratio: float = 0.6,
+        cooldown: int = 30,
+        log_path: str = None,
+    ):
+        """
+        Keeps the per-frame processing cost within the frame budget (1 / target_fps) by moving
+        along a ladder of quality levels. The cost of a processed frame is amortized over the
+        skipped ones. The controller degrades when the rolling p90 cost exceeds
+        `degrade_ratio` × budget and upgrades only when it stays below `upgrade_ratio` × budget,
+        which together with the cooldown after every change prevents oscillation.
+
+        :param target_fps: Frames per second to hold
+        :param levels: Quality levels from the best to the cheapest
+        :param window: Number of latest processed frames the decisions are based on
+        :param degrade_ratio: Fraction of the budget above which quality is lowered
+        :param upgrade_ratio: Fraction of the budget below which quality is raised
+        :param cooldown: Number of processed frames without decisions after a change
+        :param log_path: Path of a jsonl file the decisions are appended to
+        """
+        assert (
+            upgrade_ratio < degrade_ratio
+        ), "Hysteresis needs `upgrade_ratio` < `degrade_ratio`"
+        self.budget = 1 / target_fps
+        self.levels = list(levels)
+        self.window = window
+        self.degrade_ratio = degrade_ratio
+        self.upgrade_ratio = upgrade_ratio
+        self.cooldown = cooldown
+        self.log_path = log_path
+        self.index = 0
+        self.decisions: List[Dict[str, Any]] = []
+        self._costs = collections.deque(maxlen=window)
+        self._since_change = 0
+
+    @property
+    def level(self) -> QualityLevel:
+        return self.levels[self.index]
+
+    def check_imgsz(self, imgsz: int = None):
+        """
+        Rejects levels with another resolution than the only one the model accepts
+        (e.g. a statically exported ONNX model, see `utils.onnx_backend.fixed_input`)
+        :param imgsz: Fixed input size of the model, None if it isn't fixed
+        """
+        if imgsz is None:
+            return
+        other = sorted({level.imgsz for level in self.levels} - {imgsz})
+        assert (
+            not other
+        ), f"The model only accepts imgsz={imgsz}, the levels use {other}. Use levels with imgsz={imgsz} or a dynamic export"
+
+    def should_process(self, frame_idx: int) -> bool:
+        """
+        :param frame_idx: Index of the incoming frame
+        :return: Whether the frame has to be processed at the current level
+        """
+        return frame_idx % self.level.frame_skip == 0
+
+    def record(self, frame_idx: int, latency: float):
+        """
+        Records the processing latency of a frame and changes the level if needed
+        :param frame_idx: Index of the processed frame
+        :param latency: Processing latency in seconds
+        """
+        self._costs.append(latency / self.level.frame_skip)
+        self._since_change += 1
+        if self._since_change < self.cooldown or len(self._costs) < self.window:
+            return
+        cost = float(np.percentile(self._costs, 90))
+        if (
+            cost > self.budget * self.degrade_ratio
+            and self.index < len(self.levels) - 1
+        ):
+            self._change(frame_idx, self.index + 1, cost, "over budget")
+        elif cost < self.budget * self.upgrade_ratio and self.index > 0:
+            self._change(frame_idx, self.index - 1, cost, "under budget")
+
+    def _change(self, frame_idx: int, index: int, cost: float, reason: str):
+        decision = {
+            "frame": frame_idx,
+            "from": self.level._asdict(),
+            "to": self.levels[index]._asdict(),
+            "p90_cost_ms": round(cost * 1000, 2),
+            "budget_ms": round(self.budget * 1000, 2),
+            "reason": reason,
+        }
+        logging.info(
+            f"Quality level {self.index} -> {index} at frame {frame_idx} ({reason}): "
+            f"p90 cost {decision['p90_cost_ms']} ms, budget {decision['budget_ms']} ms, {self.levels[index]}"
+        )
+        self.decisions.append(decision)
+        if self.log_path:
+            with open(self.log_path, "a") as f:
+                f.write(json.dumps(decision) + "\n")
+        self.index = index
+        self._costs.clear()
+        self._since_change = 0
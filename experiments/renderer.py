@@ -0,0 +1,141 @@
+import logging
+from collections import OrderedDict
+from typing import Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+from PIL import Image, ImageDraw, ImageFont
+from ultralytics.utils.checks import check_font
+from ultralytics.utils.plotting import colors
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+class OverlayRenderer:
+    def __init__(
+        self,
+        font_path: str = None,
+        font_size: int = 18,
+        line_width: int = 2,
+        show_conf: bool = True,
+        alpha: float = 1.0,
+        max_sprites: int = 256,
+    ):
+        """
+        Draws detections directly on the frame. Sign names (Cyrillic, so they need PIL)
+        are rasterized once per class into label sprites kept in an LRU cache, boxes and
+        confidences are drawn with OpenCV.
+
+        :param font_path: Path to a TrueType font with Cyrillic glyphs. Arial Unicode is used if not provided
+        :param font_size: Font size of the labels
+        :param line_width: Box line width
+        :param show_conf: Whether to draw the confidence next to the name
+        :param alpha: Opacity of the label sprites
+        :param max_sprites: Maximum number of cached label sprites
+        """
+        try:
+            font_path = font_path or str(check_font("Arial.Unicode.ttf"))
+            self.font = ImageFont.truetype(font_path, font_size)
+        except Exception:
+            logging.warning("Unicode font is not available, using the default one")
+            self.font = ImageFont.load_default()
+        self.line_width = line_width
+        self.show_conf = show_conf
+        self.alpha = alpha
+        self.max_sprites = max_sprites
+        self.conf_scale = font_size / 30
+        self._sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def sprite(self, text: str, color: Tuple[int, int, int]) -> np.ndarray:
+        """
+        Gets the label sprite of a text, rasterizing it on the first use
+        :param text: Label text
+        :param color: BGR background color of the label
+        :return: BGR image of the label
+        """
+        key = (text, color)
+        sprite = self._sprites.get(key)
+        if sprite is not None:
+            self._sprites.move_to_end(key)
+            self.hits += 1
+            return sprite
+        self.misses += 1
+        left, top, right, bottom = self.font.getbbox(text or " ")
+        image = Image.new("RGB", (right + 2, bottom + 2), color[::-1])
+        ImageDraw.Draw(image).text((1, 1), text, fill=(255, 255, 255), font=self.font)
+        sprite = np.ascontiguousarray(np.asarray(image)[:, :, ::-1])
+        self._sprites[key] = sprite
+        if len(self._sprites) > self.max_sprites:
+            self._sprites.popitem(last=False)
+        return sprite
+
+    def render(self, frame: np.ndarray, boxes, names: Sequence[str]) -> np.ndarray:
+        """
+        Draws detections on the frame in place
+        :param frame: BGR frame, modified in place
+        :param boxes: Array or tensor of shape (N, 6) with rows (x1, y1, x2, y2, conf, cls)
+        :param names: Sign names indexed by class id
+        :return: The same frame
+        """
+        if isinstance(boxes, torch.Tensor):
+            boxes = boxes.cpu().numpy()
+        height, width = frame.shape[:2]
+        for x1, y1, x2, y2, conf, cls in boxes[:, :6]:
+            cls = int(cls)
+            color = colors(cls, True)
+            p1 = (int(x1), int(y1))
+            cv2.rectangle(frame, p1, (int(x2), int(y2)), color, self.line_width)
+            name = names[cls] if cls < len(names) else str(cls)
+            sprite = self.sprite(name, color)
+            h, w = sprite.shape[:2]
+            # put the label above the box if it fits, otherwise inside
+            top = p1[1] - h if p1[1] - h >= 0 else p1[1]
+            left = min(max(p1[0], 0), max(width - w, 0))
+            self._blend(frame, sprite, left, top)
+            if self.show_conf:
+                self._draw_conf(frame, f"{conf:.2f}", left + w, top, h, color)
+        return frame
+
+    def _blend(self, frame: np.ndarray, sprite: np.ndarray, left: int, top: int):
+        """
+        Blends the sprite into the frame region in place, clipping it at the frame borders
+        """
+        height, width = frame.shape[:2]
+        h = min(sprite.shape[0], height - top)
+        w = min(sprite.shape[1], width - left)
+        if h <= 0 or w <= 0:
+            return
+        roi = frame[top : top + h, left : left + w]
+        if self.alpha >= 1:
+            roi[...] = sprite[:h, :w]
+        else:
+            cv2.addWeighted(sprite[:h, :w], self.alpha, roi, 1 - self.alpha, 0, dst=roi)
+
+    def _draw_conf(
+        self,
+        frame: np.ndarray,
+        text: str,
+        left: int,
+        top: int,
+        height: int,
+        color: Tuple[int, int, int],
+    ):
+        """
+        Draws the confidence with OpenCV text next to the name sprite
+        """
+        (w, _), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, self.conf_scale, 1)
+        cv2.rectangle(frame, (left, top), (left + w + 4, top + height), color, -1)
+        cv2.putText(
+            frame,
+            text,
+            (left + 2, top + height - 4),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            self.conf_scale,
+            (255, 255, 255),
+            1,
+            cv2.LINE_AA,
+        )
@@ -0,0 +1,433 @@
+"""
+Asyncio HTTP inference service around `Detector`. Concurrent requests are gathered into micro-batches,
+so a single warmed model runs one forward pass for many of them.
+
+Endpoints:
+    POST /detect[?conf=0.6]        body: encoded image (jpeg, png, ...)
+    POST /detect_batch[?conf=0.6]  body: {"images": [<base64 encoded image>, ...]}
+    GET  /health                   batching stats
+    GET  /metrics                  Prometheus metrics of the detector (see `metrics.Metrics`)
+
+Detections are returned as json: {"detections": [{"cls": 3, "name": ..., "conf": 0.91, "xyxy": [...]}, ...]},
+a batch as {"results": [{"detections": [...]}, ...]}.
+
+Usage (from the `experiments` directory):
+    python server.py --checkpoint best.pt --port 8080 --max-batch-size 8 --max-wait-ms 5
+    curl --data-binary @frame.jpg http://127.0.0.1:8080/detect
+"""
+
+import argparse
+import asyncio
+import base64
+import binascii
+import json
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http import HTTPStatus
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+MAX_BODY_SIZE = 64 << 20
+
+
+class MicroBatcher:
+    def __init__(
+        self,
+        detector,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        conf: float = 0.5,
+    ):
+        """
+        Gathers frames of concurrent requests into batches. A batch is run as soon as it has
+        `max_batch_size` frames or `max_wait_ms` passed since its first request. The model runs
+        in a single worker thread, so the event loop keeps accepting requests meanwhile,
+        and they form the next batch. `max_batch_size=1` is the one-request-one-forward baseline.
+
+        :param detector: Detector shared by all requests
+        :param max_batch_size: Maximum number of frames in a batch (a larger request is run alone)
+        :param max_wait_ms: Maximum time the first request of a batch waits for others
+        :param conf: Confidence threshold of the model, requests can only raise it
+        """
+        assert max_batch_size >= 1, "`max_batch_size` must be a positive integer"
+        from utils.onnx_backend import check_input, fixed_input
+
+        check_input(detector.model, max_batch_size)
+        # a larger request is run in chunks the model accepts
+        self.model_batch_size = fixed_input(detector.model)[0]
+        self.detector = detector
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.conf = conf
+        self.batches = 0
+        self.frames = 0
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._executor = ThreadPoolExecutor(1, thread_name_prefix="inference")
+
+    def start(self):
+        """
+        Starts batching, must be called from the running event loop
+        """
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown()
+
+    def warmup(self, shape: Tuple[int, int, int] = (720, 1280, 3)):
+        """
+        Runs a full batch once, so the first requests don't pay for lazy initialization
+        """
+        frame = np.zeros(shape, dtype=np.uint8)
+        self._predict([frame] * self.max_batch_size)
+
+    async def submit(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        """
+        :param frames: Decoded frames of a request
+        :return: Boxes of every frame, arrays with rows (x1, y1, x2, y2, conf, cls)
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((frames, future))
+        return await future
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "batches": self.batches,
+            "frames": self.frames,
+            "mean_batch_size": self.frames / self.batches if self.batches else 0.0,
+            "waiting": self._queue.qsize() if self._queue is not None else 0,
+        }
+
+    def _predict(self, frames: List[np.ndarray]) -> List[np.ndarray]:
+        step = self.model_batch_size or len(frames)
+        results = [
+            result
+            for i in range(0, len(frames), step)
+            for result in self.detector.predict(
+                frames[i : i + step], verbose=False, conf=self.conf
+            )
+        ]
+        return [result.boxes.data.cpu().numpy() for result in results]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            size = len(batch[0][0])
+            deadline = loop.time() + self.max_wait
+            while size < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                batch.append(item)
+                size += len(item[0])
+            frames = [frame for request_frames, _ in batch for frame in request_frames]
+            try:
+                boxes = await loop.run_in_executor(
+                    self._executor, self._predict, frames
+                )
+            except Exception as e:
+                logging.exception("Batch inference failed")
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batches += 1
+            self.frames += len(frames)
+            offset = 0
+            for request_frames, future in batch:
+                if not future.done():
+                    future.set_result(boxes[offset : offset + len(request_frames)])
+                offset += len(request_frames)
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class InferenceServer:
+    def __init__(
+        self,
+        detector,
+        host: str = "127.0.0.1",
+        port: int = 8080,
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        conf: float = 0.5,
+    ):
+        """
+        HTTP/1.1 server with keep-alive on top of asyncio streams, see the module docstring
+        for the endpoints.
+
+        :param detector: Detector shared by all requests
+        :param host: Interface to listen on
+        :param port: Port
+        :param max_batch_size: Maximum number of frames in a batch
+        :param max_wait_ms: Maximum time a request waits for a batch to fill up
+        :param conf: Default confidence threshold
+        """
+        self.detector = detector
+        self.host = host
+        self.port = port
+        self.batcher = MicroBatcher(detector, max_batch_size, max_wait_ms, conf)
+        self._server: Optional[asyncio.AbstractServer] = None
+
+    async def start(self, warmup: bool = True):
+        if warmup:
+            start = time.perf_counter()
+            self.batcher.warmup()
+            logging.info(f"Model warmed up in {time.perf_counter() - start:.2f}s")
+        self.batcher.start()
+        self._server = await asyncio.start_server(self._handle, self.host, self.port)
+        logging.info(
+            f"Serving on http://{self.host}:{self.port} (max batch size {self.batcher.max_batch_size}, max wait {self.batcher.max_wait * 1000:g} ms)"
+        )
+
+    async def close(self):
+        self._server.close()
+        await self._server.wait_closed()
+        await self.batcher.close()
+
+    async def serve_forever(self):
+        await self.start()
+        try:
+            await self._server.serve_forever()
+        finally:
+            await self.close()
+
+    def run(self):
+        try:
+            asyncio.run(self.serve_forever())
+        except KeyboardInterrupt:
+            pass
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request = await _read_request(reader)
+                if request is None:
+                    break
+                method, target, headers, body = request
+                try:
+                    status, content_type, payload = await self._route(
+                        method, target, body
+                    )
+                except HTTPError as e:
+                    status, content_type = e.status, "application/json"
+                    payload = json.dumps({"error": str(e)}).encode()
+                except Exception as e:
+                    logging.exception(f"{method} {target} failed")
+                    status, content_type = (
+                        HTTPStatus.INTERNAL_SERVER_ERROR,
+                        "application/json",
+                    )
+                    payload = json.dumps({"error": str(e)}).encode()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                _write_response(writer, status, content_type, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except HTTPError as e:
+            payload = json.dumps({"error": str(e)}).encode()
+            _write_response(writer, e.status, "application/json", payload, False)
+        finally:
+            writer.close()
+
+    async def _route(
+        self, method: str, target: str, body: bytes
+    ) -> Tuple[HTTPStatus, str, bytes]:
+        url = urlsplit(target)
+        query = parse_qs(url.query)
+        if method == "GET" and url.path == "/health":
+            payload = {"status": "ok", **self.batcher.stats()}
+            return HTTPStatus.OK, "application/json", json.dumps(payload).encode()
+        if method == "GET" and url.path == "/metrics":
+            text = self.detector.metrics.to_prometheus()
+            return HTTPStatus.OK, "text/plain; version=0.0.4", text.encode()
+        if method == "POST" and url.path in ["/detect", "/detect_batch"]:
+            conf = _parse_conf(query, self.batcher.conf)
+            if url.path == "/detect":
+                frames = [_decode_image(body)]
+            else:
+                frames = _decode_batch(body)
+            boxes = await self.batcher.submit(frames)
+            results = [self._to_json(frame_boxes, conf) for frame_boxes in boxes]
+            payload = results[0] if url.path == "/detect" else {"results": results}
+            return (
+                HTTPStatus.OK,
+                "application/json",
+                json.dumps(payload, ensure_ascii=False).encode(),
+            )
+        raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {method} {url.path}")
+
+    def _to_json(self, boxes: np.ndarray, conf: float) -> Dict[str, Any]:
+        """
+        :param boxes: Boxes of a frame
+        :param conf: Confidence threshold of the request, filtering after NMS keeps the same boxes
+        :return: Detections of the frame
+        """
+        names = self.detector.name_table
+        detections = [
+            {
+                "cls": int(cls),
+                "name": names[int(cls)] if int(cls) < len(names) else "",
+                "conf": round(float(score), 4),
+                "xyxy": [round(float(v), 1) for v in xyxy],
+            }
+            for *xyxy, score, cls in boxes.tolist()
+            if score >= conf
+        ]
+        return {"detections": detections}
+
+
+async def _read_request(
+    reader: asyncio.StreamReader,
+) -> Optional[Tuple[str, str, Dict[str, str], bytes]]:
+    """
+    Reads one HTTP/1.1 request
+    :return: Method, target, lowercase headers and body or None if the connection was closed
+    """
+    line = await reader.readline()
+    if not line:
+        return None
+    try:
+        method, target, _ = line.decode("latin-1").split(" ", 2)
+    except ValueError:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        length = -1
+    if length < 0:
+        raise HTTPError(
+            HTTPStatus.BAD_REQUEST,
+            f"Content-Length must be a non-negative integer, got {headers['content-length']!r}",
+        )
+    if length > MAX_BODY_SIZE:
+        raise HTTPError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, "Body is too large")
+    body = await reader.readexactly(length) if length else b""
+    return method, target, headers, body
+
+
+def _write_response(
+    writer: asyncio.StreamWriter,
+    status: HTTPStatus,
+    content_type: str,
+    payload: bytes,
+    keep_alive: bool = True,
+):
+    head = (
+        f"HTTP/1.1 {status.value} {status.phrase}\r\n"
+        f"Content-Type: {content_type}\r\n"
+        f"Content-Length: {len(payload)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    writer.write(head.encode("latin-1") + payload)
+
+
+def _parse_conf(query: Dict[str, List[str]], default: float) -> float:
+    if "conf" not in query:
+        return default
+    try:
+        conf = float(query["conf"][0])
+    except ValueError:
+        conf = None
+    if conf is None or not 0 <= conf <= 1:
+        raise HTTPError(
+            HTTPStatus.BAD_REQUEST,
+            f"conf must be a number in [0, 1], got {query['conf'][0]!r}",
+        )
+    return conf
+
+
+def _decode_image(data: bytes) -> np.ndarray:
+    frame = cv2.imdecode(np.frombuffer(data, np.uint8), cv2.IMREAD_COLOR)
+    if frame is None:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "Can't decode the image")
+    return frame
+
+
+def _decode_batch(body: bytes) -> List[np.ndarray]:
+    try:
+        images = json.loads(body)["images"]
+        frames = [_decode_image(base64.b64decode(image)) for image in images]
+    except (ValueError, KeyError, TypeError, binascii.Error):
+        raise HTTPError(
+            HTTPStatus.BAD_REQUEST, 'Expected {"images": [<base64 image>, ...]}'
+        )
+    if not frames:
+        raise HTTPError(HTTPStatus.BAD_REQUEST, "No images")
+    return frames
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--checkpoint", default="yolov8m.pt")
+    parser.add_argument("--signs", default="traffic_signs.csv")
+    parser.add_argument("--labels", default=os.path.join("rtsd-dataset", "labels.txt"))
+    parser.add_argument("--compiled-mapping", default="mapping.compiled.json")
+    parser.add_argument("--max-batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--conf", type=float, default=0.5)
+    parser.add_argument(
+        "--threads", type=int, help="Torch threads, all cores by default"
+    )
+    args = parser.parse_args()
+
+    import torch
+    from startup import load_detector
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    # the server warms up with a full batch itself
+    detector, _ = load_detector(
+        args.checkpoint,
+        args.signs,
+        args.labels,
+        args.compiled_mapping,
+        warmup=False,
+        cache=True,
+    )
+    InferenceServer(
+        detector,
+        args.host,
+        args.port,
+        args.max_batch_size,
+        args.max_wait_ms,
+        args.conf,
+    ).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,195 @@
+import collections
+import logging
+import sys
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import BinaryIO, Dict, List, Optional, Tuple, Union
+
+import cv2
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# decoded frame and the monotonic time it was captured at
+Frame = Tuple[np.ndarray, float]
+
+
+class FrameSource(ABC):
+    """
+    Source of decoded frames. `read` returns None when the source is exhausted.
+    """
+
+    @abstractmethod
+    def read(self) -> Optional[Frame]:
+        pass
+
+    def close(self):
+        pass
+
+    def __iter__(self):
+        while True:
+            frame = self.read()
+            if frame is None:
+                break
+            yield frame
+
+    def __enter__(self) -> "FrameSource":
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class CaptureSource(FrameSource):
+    def __init__(self, source: Union[str, int]):
+        """
+        Frames from OpenCV: a video file, a camera device index or a stream url (e.g. http MJPEG, rtsp)
+        :param source: Path, device index or url
+        """
+        self.cap = cv2.VideoCapture(source)
+        assert self.cap.isOpened(), f"Can't open {source}"
+
+    def read(self) -> Optional[Frame]:
+        success, frame = self.cap.read()
+        if not success:
+            return None
+        return frame, time.monotonic()
+
+    def close(self):
+        self.cap.release()
+
+
+class MJPEGPipeSource(FrameSource):
+    def __init__(
+        self,
+        stream: BinaryIO = None,
+        chunk_size: int = 1 << 16,
+        max_frame_size: int = 1 << 25,
+    ):
+        """
+        Frames from concatenated JPEGs on a pipe (e.g. `ffmpeg ... -f mjpeg - | python ...`)
+        :param stream: Binary stream, stdin if not provided
+        :param chunk_size: Number of bytes read at once
+        :param max_frame_size: A frame without an end marker within this number of bytes is dropped,
+            so garbage on the pipe doesn't grow the buffer without a bound
+        """
+        self.stream = stream or sys.stdin.buffer
+        self.chunk_size = chunk_size
+        self.max_frame_size = max_frame_size
+        self._buffer = b""
+
+    def read(self) -> Optional[Frame]:
+        while True:
+            start = self._buffer.find(b"\xff\xd8")
+            end = self._buffer.find(b"\xff\xd9", start + 2) if start >= 0 else -1
+            if end >= 0:
+                jpeg = self._buffer[start : end + 2]
+                self._buffer = self._buffer[end + 2 :]
+                captured_at = time.monotonic()
+                frame = cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR)
+                if frame is not None:
+                    return frame, captured_at
+                continue
+            chunk = self.stream.read1(self.chunk_size)
+            if not chunk:
+                return None
+            if start < 0:
+                # no frame start yet: only the last byte may be the first half of its marker
+                self._buffer = self._buffer[-1:] + chunk
+            elif len(self._buffer) - start > self.max_frame_size:
+                logging.warning(
+                    f"No JPEG end marker within {self.max_frame_size} bytes, frame dropped"
+                )
+                self._buffer = self._buffer[start + 2 :] + chunk
+            else:
+                self._buffer = self._buffer[start:] + chunk
+
+
+class LatestFrameSource(FrameSource):
+    def __init__(self, source: FrameSource, max_frames: int = 1):
+        """
+        Reads the wrapped source in a background thread and keeps only the freshest frames,
+        so a slow consumer processes the current scene instead of falling behind.
+        The oldest frame is dropped when a new one arrives and the buffer is full.
+        The wrapped source is only touched by the reader thread, which also closes it.
+
+        :param source: Live source
+        :param max_frames: Number of freshest frames kept
+        """
+        self.source = source
+        self.dropped = 0
+        self.received = 0
+        self._frames = collections.deque(maxlen=max_frames)
+        self._condition = threading.Condition()
+        self._finished = False
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        try:
+            while not self._stop.is_set():
+                frame = self.source.read()
+                if frame is None:
+                    break
+                with self._condition:
+                    if len(self._frames) == self._frames.maxlen:
+                        self.dropped += 1
+                    self._frames.append(frame)
+                    self.received += 1
+                    self._condition.notify()
+        finally:
+            self.source.close()
+            with self._condition:
+                self._finished = True
+                self._condition.notify_all()
+
+    def read(self) -> Optional[Frame]:
+        with self._condition:
+            while not self._frames and not self._finished:
+                self._condition.wait()
+            if self._frames:
+                return self._frames.popleft()
+            return None
+
+    def close(self, timeout: float = 1.0):
+        """
+        Stops reading and waits for the reader thread to close the source. A thread blocked in
+        `read` of a stalled source closes it as soon as the read returns
+        :param timeout: Seconds to wait for the reader thread
+        """
+        self._stop.set()
+        self._thread.join(timeout)
+        if self._thread.is_alive():
+            logging.warning(
+                f"Source is still being read after {timeout}s, it is closed when the read returns"
+            )
+
+
+class LatencyTracker:
+    def __init__(self, window: int = 1000):
+        """
+        Keeps the latest latencies and reports their percentiles
+        :param window: Number of latest measurements kept
+        """
+        self._latencies = collections.deque(maxlen=window)
+        self.count = 0
+
+    def record(self, latency: float):
+        """
+        :param latency: Latency in seconds
+        """
+        self._latencies.append(latency)
+        self.count += 1
+
+    def percentiles(self, qs: List[float] = (50, 99)) -> Dict[str, float]:
+        """
+        :param qs: Percentiles to compute
+        :return: Percentiles in milliseconds (e.g. {'p50': 12.3, 'p99': 40.1})
+        """
+        if not self._latencies:
+            return {f"p{q:g}": 0.0 for q in qs}
+        values = np.percentile(np.array(self._latencies) * 1000, qs)
+        return {f"p{q:g}": float(v) for q, v in zip(qs, values)}
@@ -0,0 +1,122 @@
+"""
+Loads a ready-to-serve Detector and reports where the startup time goes: imports, model load,
+mapping build, warm-up and the first inference. Run it in a fresh process to see a cold start:
+
+Usage (from the `experiments` directory):
+    python startup.py --checkpoint best.pt --output startup.json
+"""
+
+import argparse
+import json
+import logging
+import os
+import time
+from typing import Any, Dict, Tuple
+
+import numpy as np
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def load_mapper(signs_path: str, labels_path: str, compiled_path: str = None):
+    """
+    Loads the compiled mapping if it exists, otherwise builds it from the signs table
+    :return: Mapper
+    """
+    from label2name import Mapper
+
+    if compiled_path and os.path.exists(compiled_path):
+        return Mapper.load_compiled(compiled_path, labels_path)
+    import pandas as pd
+
+    mapper = Mapper(pd.read_csv(signs_path), labels_path, compiled_path=compiled_path)
+    mapper.create(save=False)
+    return mapper
+
+
+def load_detector(
+    checkpoint_path: str,
+    signs_path: str,
+    labels_path: str,
+    compiled_path: str = None,
+    backend: str = "torch",
+    warmup: bool = True,
+    frame_shape: Tuple[int, int, int] = (720, 1280, 3),
+    cache: bool = False,
+    **detector_kwargs,
+) -> Tuple[Any, Dict[str, float]]:
+    """
+    Loads the model and the mapping and warms the model up, timing every step.
+
+    :param checkpoint_path: Path to the checkpoint (or the ONNX model)
+    :param signs_path: Path to the csv with sign codes and names
+    :param labels_path: Path to the file containing labels
+    :param compiled_path: Path of the compiled mapping artifact
+    :param backend: `torch` or `onnx`
+    :param warmup: Run a dummy forward pass before the first inference
+    :param frame_shape: Shape of the frames used for the warm-up and the first inference
+    :param cache: Share the model through the process-wide model cache (see `get_model`)
+    :param detector_kwargs: Passed to `Detector`
+    :return: Detector and the startup report in seconds
+    """
+    report = {}
+    start = time.perf_counter()
+    from inference import Detector
+
+    report["import_inference"] = time.perf_counter() - start
+    step = time.perf_counter()
+    import torch  # noqa: F401
+    import ultralytics  # noqa: F401
+
+    report["import_torch_ultralytics"] = time.perf_counter() - step
+    from utils.project_utils import get_model
+
+    step = time.perf_counter()
+    model = get_model(checkpoint_path=checkpoint_path, backend=backend, cache=cache)
+    report["model_load"] = time.perf_counter() - step
+    step = time.perf_counter()
+    mapper = load_mapper(signs_path, labels_path, compiled_path)
+    detector = Detector(model, mapper, **detector_kwargs)
+    detector.name_table  # compiles the names
+    report["mapping"] = time.perf_counter() - step
+    if warmup:
+        report["warmup"] = detector.warmup(frame_shape)
+    step = time.perf_counter()
+    detector.predict(np.zeros(frame_shape, dtype=np.uint8), verbose=False)
+    report["first_inference"] = time.perf_counter() - step
+    report["total"] = time.perf_counter() - start
+    logging.info(
+        "Startup: "
+        + ", ".join(f"{name} {value:.3f}s" for name, value in report.items())
+    )
+    return detector, report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--checkpoint", default="yolov8m.pt")
+    parser.add_argument("--backend", choices=["torch", "onnx"], default="torch")
+    parser.add_argument("--signs", default="traffic_signs.csv")
+    parser.add_argument("--labels", default=os.path.join("rtsd-dataset", "labels.txt"))
+    parser.add_argument("--compiled-mapping", default="mapping.compiled.json")
+    parser.add_argument("--no-warmup", action="store_true")
+    parser.add_argument("--output", help="Path to save the report as json")
+    args = parser.parse_args()
+
+    _, report = load_detector(
+        args.checkpoint,
+        args.signs,
+        args.labels,
+        args.compiled_mapping,
+        backend=args.backend,
+        warmup=not args.no_warmup,
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        logging.info(f"Report saved to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
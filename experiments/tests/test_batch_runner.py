@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import batch_runner
+
+
+class FakeDetector:
+    def __init__(self):
+        self.outputs = []
+
+    def process_video(self, video_path, saving_path=None, **kwargs):
+        self.outputs.append(saving_path)
+        return {"frames": 1, "seconds": 0.1}
+
+
+def test_same_file_name_in_different_directories(tmp_path, monkeypatch):
+    videos = [
+        os.path.join("cameras", "front", "drive.mp4"),
+        os.path.join("cameras", "rear", "drive.mp4"),
+    ]
+    names = batch_runner.output_names(videos)
+    assert names == {
+        videos[0]: os.path.join("front", "drive"),
+        videos[1]: os.path.join("rear", "drive"),
+    }
+
+    detector = FakeDetector()
+    monkeypatch.setattr(batch_runner, "_detector", detector)
+    records = [
+        batch_runner._process(video, names[video], str(tmp_path), {})
+        for video in videos
+    ]
+    assert detector.outputs == [
+        os.path.join(tmp_path, "front", "drive.mp4"),
+        os.path.join(tmp_path, "rear", "drive.mp4"),
+    ]
+    assert [record["output"] for record in records] == [
+        names[video] for video in videos
+    ]
+
+
+def test_single_video_keeps_its_name():
+    assert batch_runner.output_names(["drive.mp4"]) == {"drive.mp4": "drive"}
@@ -0,0 +1,72 @@
+import json
+import os
+import sys
+
+EXPERIMENTS_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+REPO_DIR = os.path.dirname(EXPERIMENTS_DIR)
+JSON2YOLO_DIR = os.path.join(REPO_DIR, "JSON2YOLO")
+sys.path[:0] = [REPO_DIR, JSON2YOLO_DIR, os.path.join(EXPERIMENTS_DIR, "utils")]
+from data_preprocessing import DataPreprocessor
+
+# `general_json2yolo` imports the `utils` module of JSON2YOLO, the other tests import the `utils` package
+sys.path[:] = [path for path in sys.path if os.path.abspath(path) != JSON2YOLO_DIR]
+sys.modules.pop("utils", None)
+
+IMAGES_DIR = os.path.join("frames", "frames")
+
+
+def write_annotations(path, names):
+    images = [
+        {"id": i, "file_name": f"frames/{name}.jpg", "width": 100, "height": 100}
+        for i, name in enumerate(names)
+    ]
+    annotations = [
+        {
+            "id": i,
+            "image_id": i,
+            "category_id": 1,
+            "bbox": [10, 10, 20, 20],
+            "iscrowd": 0,
+        }
+        for i in range(len(names))
+    ]
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "images": images,
+                "annotations": annotations,
+                "categories": [{"id": 1, "name": "sign"}],
+            },
+            f,
+        )
+
+
+def split_files(split, folder):
+    return sorted(os.listdir(os.path.join("datasets", f"{split}_annotation", folder)))
+
+
+def test_incremental_move_to_other_split(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    os.makedirs(os.path.join("dataset", IMAGES_DIR))
+    with open(os.path.join("dataset", "labels.txt"), "w") as f:
+        f.write("sign")
+    for name in ["a", "b", "c"]:
+        with open(os.path.join("dataset", IMAGES_DIR, f"{name}.jpg"), "wb") as f:
+            f.write(name.encode())
+    write_annotations(os.path.join("dataset", "train_anno.json"), ["a", "b"])
+    write_annotations(os.path.join("dataset", "val_anno.json"), ["c"])
+    preprocessor = DataPreprocessor("dataset", IMAGES_DIR, incremental=True)
+    preprocessor.preprocess()
+    assert os.listdir(os.path.join("dataset", IMAGES_DIR)) == []
+
+    # b is reassigned from train to val after its image was moved to train
+    write_annotations(os.path.join("dataset", "train_anno.json"), ["a"])
+    write_annotations(os.path.join("dataset", "val_anno.json"), ["b", "c"])
+    preprocessor = DataPreprocessor("dataset", IMAGES_DIR, incremental=True)
+    preprocessor.preprocess()
+    assert split_files("train", "images") == ["a.jpg"]
+    assert split_files("train", "labels") == ["a.txt"]
+    assert split_files("val", "images") == ["b.jpg", "c.jpg"]
+    assert split_files("val", "labels") == ["b.txt", "c.txt"]
+    with open(os.path.join("datasets", "val_annotation", "images", "b.jpg"), "rb") as f:
+        assert f.read() == b"b"
@@ -0,0 +1,50 @@
+import os
+import sys
+
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from tiling import TiledPredictor, make_tiles
+
+# only the top left corner: no tile of a small frame lies in it enough
+CORNER = [(0.0, 0.0, 0.33, 0.33)]
+
+
+class FakeModel:
+    names = {0: "sign"}
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, crops, **kwargs):
+        self.calls.append(len(crops))
+        return [
+            Results(
+                orig_img=crop,
+                path="",
+                names=self.names,
+                boxes=torch.tensor([[1.0, 1.0, 10.0, 10.0, 0.9, 0.0]]),
+            )
+            for crop in crops
+        ]
+
+
+def test_region_without_tiles():
+    frame = np.zeros((640, 640, 3), dtype=np.uint8)
+    assert make_tiles(640, 640, regions=CORNER) == []
+    model = FakeModel()
+    results = TiledPredictor(regions=CORNER)(model, [frame, frame])
+    assert model.calls == []
+    assert [result.boxes.data.shape for result in results] == [(0, 6), (0, 6)]
+
+
+def test_frames_with_and_without_tiles():
+    small = np.zeros((640, 640, 3), dtype=np.uint8)
+    large = np.zeros((2000, 2000, 3), dtype=np.uint8)
+    model = FakeModel()
+    results = TiledPredictor(regions=CORNER)(model, [small, large])
+    assert model.calls == [len(make_tiles(2000, 2000, regions=CORNER))]
+    assert results[0].boxes.data.shape == (0, 6)
+    assert len(results[1].boxes) == 1
@@ -0,0 +1,150 @@
+import logging
+from typing import List, Sequence, Tuple
+
+import cv2
+import numpy as np
+import torch
+from torchvision.ops import batched_nms
+from ultralytics import YOLO
+from ultralytics.engine.results import Results
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# (x1, y1, x2, y2) relative to the frame size
+Region = Tuple[float, float, float, float]
+
+# traffic signs are mostly located above the road and on its right side
+UPPER_RIGHT: List[Region] = [(0.0, 0.0, 1.0, 0.6), (0.5, 0.0, 1.0, 1.0)]
+
+
+def _starts(start: int, end: int, tile: int, stride: int) -> List[int]:
+    """
+    Start coordinates of tiles covering [start, end) along one axis
+    """
+    if end - start <= tile:
+        return [start]
+    starts = list(range(start, end - tile, stride))
+    starts.append(end - tile)
+    return starts
+
+
+def make_tiles(
+    width: int,
+    height: int,
+    tile_size: int = 640,
+    overlap: float = 0.2,
+    regions: Sequence[Region] = None,
+    min_coverage: float = 0.5,
+) -> List[Tuple[int, int, int, int]]:
+    """
+    Splits a frame into overlapping square tiles
+    :param width: Frame width
+    :param height: Frame height
+    :param tile_size: Tile side in pixels
+    :param overlap: Overlap of neighbouring tiles as a fraction of the tile side
+    :param regions: Regions of interest relative to the frame size. The whole frame if not provided
+    :param min_coverage: Minimal fraction of a tile lying inside the regions to keep the tile
+    :return: List of tiles (x1, y1, x2, y2) in pixels
+    """
+    assert 0 <= overlap < 1, "`overlap` must be in [0, 1)"
+    stride = max(1, int(tile_size * (1 - overlap)))
+    tiles = [
+        (x, y, min(x + tile_size, width), min(y + tile_size, height))
+        for y in _starts(0, height, tile_size, stride)
+        for x in _starts(0, width, tile_size, stride)
+    ]
+    if not regions:
+        return tiles
+    # coverage is measured on a coarse mask, it only has to separate tiles roughly
+    scale = 8
+    mask = np.zeros((height // scale + 1, width // scale + 1), dtype=bool)
+    for rx1, ry1, rx2, ry2 in regions:
+        mask[
+            int(ry1 * height) // scale : int(ry2 * height) // scale,
+            int(rx1 * width) // scale : int(rx2 * width) // scale,
+        ] = True
+    return [
+        (x1, y1, x2, y2)
+        for x1, y1, x2, y2 in tiles
+        if mask[y1 // scale : y2 // scale, x1 // scale : x2 // scale].mean()
+        >= min_coverage
+    ]
+
+
+class TiledPredictor:
+    def __init__(
+        self,
+        tile_size: int = 640,
+        overlap: float = 0.2,
+        regions: Sequence[Region] = None,
+        imgsz: int = None,
+        iou: float = 0.5,
+    ):
+        """
+        Runs the model on overlapping tiles of the frames instead of the downscaled frames,
+        so small distant signs keep their resolution. All tiles of all frames go through
+        the model in one batched call, then the detections are merged with class-wise NMS.
+
+        :param tile_size: Tile side in pixels
+        :param overlap: Overlap of neighbouring tiles as a fraction of the tile side
+        :param regions: Regions of interest relative to the frame size (e.g. `UPPER_RIGHT`)
+        :param imgsz: Model input size for a tile. Smaller than `tile_size` trades accuracy for speed
+        :param iou: IoU threshold of the cross-tile NMS
+        """
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.regions = regions
+        self.imgsz = imgsz or tile_size
+        self.iou = iou
+
+    def __call__(
+        self, model: YOLO, frames, verbose: bool = False, conf: float = 0.5
+    ) -> List[Results]:
+        """
+        :param model: The YOLO model
+        :param frames: Frame, path to the image or a list of them
+        :param verbose: Verbose predictions
+        :param conf: Confidence threshold
+        :return: Predictions in frame coordinates, one per frame
+        """
+        if not isinstance(frames, list):
+            frames = [frames]
+        frames = [cv2.imread(f) if isinstance(f, str) else f for f in frames]
+        crops, owners = [], []
+        for i, frame in enumerate(frames):
+            height, width = frame.shape[:2]
+            for x1, y1, x2, y2 in make_tiles(
+                width, height, self.tile_size, self.overlap, self.regions
+            ):
+                crops.append(frame[y1:y2, x1:x2])
+                owners.append((i, x1, y1))
+        # regions may leave no tiles at all
+        tile_results = (
+            model(crops, verbose=verbose, conf=conf, imgsz=self.imgsz) if crops else []
+        )
+
+        boxes = [[] for _ in frames]
+        for (i, x1, y1), result in zip(owners, tile_results):
+            data = result.boxes.data.clone()
+            data[:, [0, 2]] += x1
+            data[:, [1, 3]] += y1
+            boxes[i].append(data)
+        results = []
+        for frame, frame_boxes in zip(frames, boxes):
+            data = torch.cat(frame_boxes) if frame_boxes else torch.zeros((0, 6))
+            keep = batched_nms(data[:, :4], data[:, 4], data[:, 5].long(), self.iou)
+            results.append(
+                Results(orig_img=frame, path="", names=model.names, boxes=data[keep])
+            )
+        return results
+
+    def tiles_per_frame(self, width: int, height: int) -> int:
+        """
+        :param width: Frame width
+        :param height: Frame height
+        :return: Number of model inputs produced for one frame
+        """
+        return len(
+            make_tiles(width, height, self.tile_size, self.overlap, self.regions)
+        )
@@ -0,0 +1,270 @@
+import logging
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+import torch
+from ultralytics.engine.results import Results
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+
+def box_iou(boxes1: np.ndarray, boxes2: np.ndarray) -> np.ndarray:
+    """
+    Computes pairwise IoU of two sets of boxes
+    :param boxes1: Array of shape (N, 4) with boxes in xyxy format
+    :param boxes2: Array of shape (M, 4) with boxes in xyxy format
+    :return: Array of shape (N, M) with IoU values
+    """
+    if len(boxes1) == 0 or len(boxes2) == 0:
+        return np.zeros((len(boxes1), len(boxes2)))
+    top_left = np.maximum(boxes1[:, None, :2], boxes2[None, :, :2])
+    bottom_right = np.minimum(boxes1[:, None, 2:4], boxes2[None, :, 2:4])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area1 = (boxes1[:, 2] - boxes1[:, 0]) * (boxes1[:, 3] - boxes1[:, 1])
+    area2 = (boxes2[:, 2] - boxes2[:, 0]) * (boxes2[:, 3] - boxes2[:, 1])
+    return inter / (area1[:, None] + area2[None, :] - inter + 1e-9)
+
+
+def match_boxes(
+    boxes1: np.ndarray, boxes2: np.ndarray, iou_threshold: float
+) -> List[Tuple[int, int, float]]:
+    """
+    Greedily matches boxes of the same class by decreasing IoU
+    :param boxes1: Array of shape (N, 6) with rows (x1, y1, x2, y2, conf, cls)
+    :param boxes2: Array of shape (M, 6) with rows (x1, y1, x2, y2, conf, cls)
+    :param iou_threshold: Minimal IoU of a match
+    :return: List of (index in boxes1, index in boxes2, IoU)
+    """
+    iou = box_iou(boxes1[:, :4], boxes2[:, :4])
+    if iou.size:
+        iou[boxes1[:, 5][:, None] != boxes2[:, 5][None, :]] = 0
+    matches = []
+    while iou.size and iou.max() >= iou_threshold:
+        i, j = np.unravel_index(iou.argmax(), iou.shape)
+        matches.append((int(i), int(j), float(iou[i, j])))
+        iou[i, :] = 0
+        iou[:, j] = 0
+    return matches
+
+
+class KalmanBoxTracker:
+    # constant velocity model over (cx, cy, w, h) and their velocities
+    _F = np.eye(8) + np.eye(8, k=4)
+    _H = np.eye(4, 8)
+
+    def __init__(self, box: np.ndarray, track_id: int):
+        """
+        Tracks a single detected sign between keyframes
+        :param box: Detection row (x1, y1, x2, y2, conf, cls)
+        :param track_id: Unique id of the track
+        """
+        self.id = track_id
+        self.conf = float(box[4])
+        self.cls = float(box[5])
+        self.x = np.zeros(8)
+        self.x[:4] = self._to_cxcywh(box[:4])
+        self.P = np.diag([10.0, 10.0, 10.0, 10.0, 1e3, 1e3, 1e3, 1e3])
+        self.Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.1, 0.1, 0.1, 0.1])
+        self.R = np.diag([1.0, 1.0, 4.0, 4.0])
+
+    @staticmethod
+    def _to_cxcywh(xyxy: np.ndarray) -> np.ndarray:
+        x1, y1, x2, y2 = xyxy
+        return np.array([(x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1])
+
+    @property
+    def box(self) -> np.ndarray:
+        """
+        :return: Current detection row (x1, y1, x2, y2, conf, cls)
+        """
+        cx, cy, w, h = self.x[:4]
+        return np.array(
+            [cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2, self.conf, self.cls]
+        )
+
+    def predict(self) -> np.ndarray:
+        """
+        Propagates the box to the next frame
+        :return: Predicted detection row
+        """
+        self.x = self._F @ self.x
+        self.P = self._F @ self.P @ self._F.T + self.Q
+        return self.box
+
+    def update(self, box: np.ndarray):
+        """
+        Corrects the state with a new detection
+        :param box: Detection row (x1, y1, x2, y2, conf, cls)
+        """
+        z = self._to_cxcywh(box[:4])
+        S = self._H @ self.P @ self._H.T + self.R
+        K = self.P @ self._H.T @ np.linalg.inv(S)
+        self.x = self.x + K @ (z - self._H @ self.x)
+        self.P = (np.eye(8) - K @ self._H) @ self.P
+        self.conf = float(box[4])
+
+    def is_lost(self, width: int, height: int) -> bool:
+        """
+        :param width: Frame width
+        :param height: Frame height
+        :return: Whether the predicted box degenerated or left the frame
+        """
+        cx, cy, w, h = self.x[:4]
+        return w <= 1 or h <= 1 or not (0 <= cx < width and 0 <= cy < height)
+
+
+class KeyframeRunner:
+    def __init__(
+        self,
+        detector,
+        keyframe_interval: int = 5,
+        iou_threshold: float = 0.2,
+        search_scale: float = 2.0,
+        verbose: bool = False,
+        conf: float = 0.5,
+    ):
+        """
+        Runs the model only on keyframes and propagates the boxes in between
+        with a Kalman filter per track. A keyframe is forced earlier when a track is lost.
+
+        :param detector: Detector used for inference
+        :param keyframe_interval: Run the model on every `keyframe_interval`-th frame
+        :param iou_threshold: Minimal IoU to associate a detection with an existing track
+        :param search_scale: Boxes are enlarged by this factor around their centers before
+            association, so that fast signs still overlap their track between keyframes
+        :param verbose: Verbose predictions
+        :param conf: Confidence threshold
+        """
+        assert keyframe_interval >= 1, "`keyframe_interval` must be a positive integer"
+        self.detector = detector
+        self.keyframe_interval = keyframe_interval
+        self.iou_threshold = iou_threshold
+        self.search_scale = search_scale
+        self.verbose = verbose
+        self.conf = conf
+        self.tracks = []
+        self.model_calls = 0
+        self._next_id = 0
+
+    def __call__(self, frames: Iterable[np.ndarray]) -> Iterator[Results]:
+        """
+        :param frames: Decoded frames in order
+        :return: Iterator over predictions, one per frame
+        """
+        since_keyframe = self.keyframe_interval
+        lost = False
+        for frame in frames:
+            height, width = frame.shape[:2]
+            if since_keyframe >= self.keyframe_interval or lost:
+                result = self.detector.predict(
+                    frame, verbose=self.verbose, conf=self.conf
+                )[0]
+                self.model_calls += 1
+                self._update(result.boxes.data.cpu().numpy())
+                since_keyframe = 1
+                lost = False
+                yield result
+                continue
+            boxes = [track.predict() for track in self.tracks]
+            lost = any(track.is_lost(width, height) for track in self.tracks)
+            self.tracks = [t for t in self.tracks if not t.is_lost(width, height)]
+            boxes = np.array(boxes, dtype=np.float32).reshape(-1, 6)
+            boxes[:, [0, 2]] = boxes[:, [0, 2]].clip(0, width)
+            boxes[:, [1, 3]] = boxes[:, [1, 3]].clip(0, height)
+            since_keyframe += 1
+            yield Results(
+                orig_img=frame,
+                path="",
+                names=self.detector.model.names,
+                boxes=torch.from_numpy(boxes),
+            )
+
+    def _update(self, detections: np.ndarray):
+        """
+        Associates keyframe detections with the tracks. Unmatched tracks are dropped,
+        unmatched detections start new tracks.
+        """
+        for track in self.tracks:
+            track.predict()
+        predicted = np.array([t.box for t in self.tracks]).reshape(-1, 6)
+        matches = match_boxes(
+            self._expand(predicted), self._expand(detections), self.iou_threshold
+        )
+        tracks = []
+        for i, j, _ in matches:
+            self.tracks[i].update(detections[j])
+            tracks.append(self.tracks[i])
+        matched = {j for _, j, _ in matches}
+        for j, detection in enumerate(detections):
+            if j not in matched:
+                tracks.append(KalmanBoxTracker(detection, self._next_id))
+                self._next_id += 1
+        self.tracks = tracks
+
+    def _expand(self, boxes: np.ndarray) -> np.ndarray:
+        """
+        Enlarges boxes around their centers by `search_scale`
+        """
+        boxes = boxes.copy()
+        centers = (boxes[:, :2] + boxes[:, 2:4]) / 2
+        half_sizes = (boxes[:, 2:4] - boxes[:, :2]) / 2 * self.search_scale
+        boxes[:, :2] = centers - half_sizes
+        boxes[:, 2:4] = centers + half_sizes
+        return boxes
+
+
+def drift_report(
+    detector,
+    video_path: str,
+    keyframe_interval: int = 5,
+    iou_threshold: float = 0.5,
+    conf: float = 0.5,
+) -> Dict[str, Any]:
+    """
+    Compares keyframe tracking with running the model on every frame
+    :param detector: Detector used for inference
+    :param video_path: Path to the video
+    :param keyframe_interval: Keyframe interval of the tracking run
+    :param iou_threshold: Minimal IoU to consider two boxes the same sign
+    :param conf: Confidence threshold
+    :return: Dict with model calls of both runs, precision and recall of the tracked boxes
+        against the every-frame boxes and mean IoU of matched boxes
+    """
+
+    def read_frames():
+        cap = cv2.VideoCapture(video_path)
+        while cap.isOpened():
+            success, frame = cap.read()
+            if not success:
+                break
+            yield frame
+        cap.release()
+
+    runner = KeyframeRunner(detector, keyframe_interval=keyframe_interval, conf=conf)
+    reference_boxes = 0
+    tracked_boxes = 0
+    matched_ious = []
+    frame_counter = 0
+    for frame, tracked in zip(read_frames(), runner(read_frames())):
+        reference = detector.predict(frame, conf=conf)[0].boxes.data.cpu().numpy()
+        tracked = tracked.boxes.data.cpu().numpy()
+        matches = match_boxes(tracked, reference, iou_threshold)
+        matched_ious.extend(iou for _, _, iou in matches)
+        reference_boxes += len(reference)
+        tracked_boxes += len(tracked)
+        frame_counter += 1
+    report = {
+        "frames": frame_counter,
+        "model_calls": runner.model_calls,
+        "reference_model_calls": frame_counter,
+        "precision": len(matched_ious) / tracked_boxes if tracked_boxes else 1.0,
+        "recall": len(matched_ious) / reference_boxes if reference_boxes else 1.0,
+        "mean_iou": float(np.mean(matched_ious)) if matched_ious else 0.0,
+    }
+    logging.info(
+        f"Keyframe interval {keyframe_interval}: {report['model_calls']} model calls instead of {frame_counter}, "
+        f"precision {report['precision']:.3f}, recall {report['recall']:.3f}, mean IoU {report['mean_iou']:.3f}"
+    )
+    return report
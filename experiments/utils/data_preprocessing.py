@@ -1,19 +1,50 @@
 import logging
 import os
 import sys
-from shutil import move
-from typing import Any, Dict, List, Set, Tuple
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from shutil import copy2, move
+from typing import Any, Callable, Dict, List, Set, Tuple
 
 import yaml
 from tqdm.auto import tqdm
 
 sys.path.append("./JSON2YOLO")
-from JSON2YOLO.general_json2yolo import convert_coco_json
+from JSON2YOLO.general_json2yolo import coco_json_labels, convert_coco_json
+from hashing import content_hash, file_hash
+from manifest import Manifest
 from project_utils import get_labels
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
+TRANSFER_MODES = ("move", "copy", "hardlink", "symlink")
+
+
+def transfer(src: str, dst: str, mode: str = "move"):
+    """
+    Puts a file to the destination path
+    :param src: Source path
+    :param dst: Destination path, replaced if it exists
+    :param mode: `move`, `copy`, `hardlink` (a copy if the paths are on different filesystems) or `symlink`
+    """
+    if mode == "move":
+        move(src, dst)
+        return
+    if os.path.lexists(dst):
+        os.remove(dst)
+    if mode == "copy":
+        copy2(src, dst)
+    elif mode == "hardlink":
+        try:
+            os.link(src, dst)
+        except OSError:
+            copy2(src, dst)
+    else:
+        assert mode == "symlink", f"Unknown transfer mode {mode}"
+        os.symlink(os.path.abspath(src), dst)
+
 
 class DataPreprocessor:
     def __init__(
@@ -22,6 +53,10 @@ class DataPreprocessor:
         images_dir: str,
         labels_fname: str = "labels.txt",
         data_path: str = "trafic_signs.yaml",
+        workers: int = 1,
+        images_mode: str = "move",
+        incremental: bool = False,
+        manifest_path: str = os.path.join("datasets", "manifest.json"),
     ):
         """
 
@@ -29,29 +64,108 @@ class DataPreprocessor:
         :param images_dir: Directory where images are stored (located inside the dataset directory)
         :param labels_fname: Filename containing the list of target labels
         :param data_path: Path to yaml file that is fed to YOLO as `data` argument
+        :param workers: Number of threads for the file operations (they are IO-bound, so more threads
+            than CPUs help on network or overlay filesystems)
+        :param images_mode: How images and annotation files get from the dataset directory to the splits:
+            `move`, `copy`, `hardlink` or `symlink`. All but `move` leave the dataset directory intact
+        :param incremental: Redo only the work for new or changed annotations and images, resume interrupted
+            runs (see `preprocess`)
+        :param manifest_path: Manifest of the inputs and outputs of the incremental preprocessing
         """
+        assert images_mode in TRANSFER_MODES, f"Unknown transfer mode {images_mode}"
         self.source_dir = source_dir
         self.source_img_dir = os.path.join(source_dir, images_dir)
         self.labels_path = os.path.join(source_dir, labels_fname)
         self.data_path = data_path
+        self.workers = workers
+        self.images_mode = images_mode
+        self.incremental = incremental
+        self.manifest_path = manifest_path
+        self.manifest = None
+        self.__transferred: List[str] = []
+        self.timings: Dict[str, float] = {}
         self.__TEMP_DIR = "new_dir"
         self.__train_dir = os.path.join("datasets", "train_annotation")
         self.__val_dir = os.path.join("datasets", "val_annotation")
 
     def preprocess(self):
         """
-        Preprocesses data: converts it to YOLO fomat, splits into train and val, creates yaml file for the model
+        Preprocesses data: converts it to YOLO fomat, splits into train and val, creates yaml file for the model.
+
+        In the incremental mode the annotation files stay in the dataset directory and nothing is wiped.
+        The manifest keeps size, modification time and hash of the annotation files and the produced
+        labels and images. An unchanged annotation file isn't parsed again, a changed one is parsed, but
+        only the labels with a different content are written. Only new or changed images are transferred,
+        labels and images that aren't in the annotations anymore are removed. Every file is recorded
+        right after it is produced, so an interrupted run resumes where it stopped.
         """
-        train_labels = self.__covert_labels(train=True)
-        val_labels = self.__covert_labels(train=False)
-        train_counter, val_counter = self.__split_images(train_labels, val_labels)
+        self.timings = {}
+        if self.incremental:
+            with self.__step("load_manifest"):
+                self.manifest = Manifest(self.manifest_path)
+            try:
+                train_labels = self.__update_labels(train=True)
+                val_labels = self.__update_labels(train=False)
+                train_counter, val_counter = self.__update_images(
+                    train_labels, val_labels
+                )
+            finally:
+                with self.__step("save_manifest"):
+                    self.manifest.save()
+        else:
+            train_labels = self.__covert_labels(train=True)
+            val_labels = self.__covert_labels(train=False)
+            train_counter, val_counter = self.__split_images(train_labels, val_labels)
         logging.info(
             f"Data was successfully converted to YOLO format. The dataset contains {train_counter} train images and {val_counter} val images"
         )
-        self.save_data()
+        with self.__step("save_data"):
+            self.save_data()
         logging.info(
             f"{self.data_path} file created. Use it as `data` parameter to train the model."
         )
+        logging.info(
+            "Preprocessing steps: "
+            + ", ".join(
+                f"{step} {seconds:.2f}s" for step, seconds in self.timings.items()
+            )
+        )
+
+    @contextmanager
+    def __step(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = time.perf_counter() - start
+
+    def __run(
+        self,
+        fn: Callable,
+        jobs: List[Tuple[str, str]],
+        desc: str = None,
+        chunk_size: int = 256,
+    ):
+        """
+        Runs `fn(src, dst)` for every job, in a thread pool if there are several workers.
+        The jobs are submitted in chunks to keep the per-file overhead of the pool low
+        """
+        if self.workers <= 1:
+            for src, dst in tqdm(jobs, desc=desc):
+                fn(src, dst)
+            return
+
+        def run_chunk(chunk: List[Tuple[str, str]]) -> int:
+            for src, dst in chunk:
+                fn(src, dst)
+            return len(chunk)
+
+        chunks = [jobs[i : i + chunk_size] for i in range(0, len(jobs), chunk_size)]
+        with ThreadPoolExecutor(self.workers) as pool, tqdm(
+            total=len(jobs), desc=desc
+        ) as progress:
+            for done in pool.map(run_chunk, chunks):
+                progress.update(done)
 
     def __covert_labels(self, train: bool) -> Set[str]:
         """
@@ -62,29 +176,32 @@ class DataPreprocessor:
         split = "train" if train else "val"
         target_dir = os.path.join("datasets", f"{split}_annotation")
         json_fname = f"{split}_anno.json"
-        temp_labels_dir = f"{split}_anno"
+        temp_labels_dir = os.path.join(self.__TEMP_DIR, "labels", f"{split}_anno")
         os.makedirs(target_dir, exist_ok=True)
-        move(
+        transfer(
             os.path.join(self.source_dir, json_fname),
             os.path.join(target_dir, json_fname),
+            self.images_mode,
         )
         for folder in ["labels", "images"]:
             os.makedirs(os.path.join(target_dir, folder), exist_ok=True)
-        convert_coco_json(target_dir)
-        for fname in tqdm(
-            os.listdir(os.path.join(self.__TEMP_DIR, "labels", temp_labels_dir))
-        ):
-            move(
-                os.path.join(self.__TEMP_DIR, "labels", temp_labels_dir, fname),
-                os.path.join(target_dir, "labels", fname),
+        with self.__step(f"convert_{split}"):
+            convert_coco_json(target_dir, streaming=True)
+        with self.__step(f"move_{split}_labels"):
+            # the converted labels are temporary, so they are always moved
+            fnames = os.listdir(temp_labels_dir)
+            self.__run(
+                move,
+                [
+                    (
+                        os.path.join(temp_labels_dir, fname),
+                        os.path.join(target_dir, "labels", fname),
+                    )
+                    for fname in fnames
+                ],
+                desc=f"Moving {split} labels",
             )
-        labels = set(
-            [
-                label.split(".")[0]
-                for label in os.listdir(os.path.join(target_dir, "labels"))
-            ]
-        )
-        return labels
+        return set(fname.split(".")[0] for fname in fnames)
 
     def __split_images(
         self, train_labels: Set[str], val_labels: Set[str]
@@ -95,24 +212,222 @@ class DataPreprocessor:
         :param val_labels: Labels of test images
         :return: Numbers of train and val images
         """
+        with self.__step("scan_images"):
+            img_fnames = os.listdir(self.source_img_dir)
+        jobs = []
         train_counter = 0
         val_counter = 0
-        for img_fname in os.listdir(self.source_img_dir):
+        for img_fname in img_fnames:
             name = img_fname.split(".")[0]
             if name in train_labels:
-                move(
-                    os.path.join(self.source_img_dir, img_fname),
-                    os.path.join(self.__train_dir, "images", img_fname),
+                jobs.append(
+                    (
+                        os.path.join(self.source_img_dir, img_fname),
+                        os.path.join(self.__train_dir, "images", img_fname),
+                    )
                 )
                 train_counter += 1
             if name in val_labels:
-                move(
-                    os.path.join(self.source_img_dir, img_fname),
-                    os.path.join(self.__val_dir, "images", img_fname),
+                jobs.append(
+                    (
+                        os.path.join(self.source_img_dir, img_fname),
+                        os.path.join(self.__val_dir, "images", img_fname),
+                    )
                 )
                 val_counter += 1
+        with self.__step("split_images"):
+            self.__run(
+                lambda src, dst: transfer(src, dst, self.images_mode),
+                jobs,
+                desc="Splitting images",
+            )
         return train_counter, val_counter
 
+    def __input_changed(self, path: str) -> bool:
+        """
+        :return: Whether the content of the input differs from the manifest, re-saves the entry of a touched file
+        """
+        if self.manifest.is_current("inputs", path):
+            return False
+        entry = self.manifest.get("inputs", path)
+        if entry is not None and entry["hash"] == file_hash(path):
+            self.manifest.record("inputs", path, hash=entry["hash"])
+            return False
+        return True
+
+    def __write_label(self, labels: bytes, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(labels)
+        os.replace(tmp_path, path)
+        self.manifest.record("outputs", path, hash=content_hash(labels))
+
+    def __remove_stale(self, directory: str, expected: Set[str]) -> int:
+        """
+        Removes the recorded outputs in the directory that are not expected anymore
+        :return: Number of removed files
+        """
+        stale = [
+            path
+            for path in self.manifest.paths("outputs", directory)
+            if path not in expected
+        ]
+        for path in stale:
+            if os.path.lexists(path):
+                os.remove(path)
+            self.manifest.remove("outputs", path)
+        return len(stale)
+
+    def __update_labels(self, train: bool) -> Set[str]:
+        """
+        Converts new or changed labels to YOLO format
+        :param train: Whether the split is train (otherwise val)
+        :return: Labels of train/validation images
+        """
+        split = "train" if train else "val"
+        target_dir = self.__train_dir if train else self.__val_dir
+        labels_dir = os.path.join(target_dir, "labels")
+        json_path = os.path.join(self.source_dir, f"{split}_anno.json")
+        for folder in ["labels", "images"]:
+            os.makedirs(os.path.join(target_dir, folder), exist_ok=True)
+        names = self.manifest.state.get(f"{split}_labels")
+        with self.__step(f"check_{split}_annotations"):
+            changed = names is None or self.__input_changed(json_path)
+        if not changed:
+            logging.info(f"{json_path} is unchanged")
+            return set(names)
+
+        with self.__step(f"convert_{split}"):
+            jobs, expected = [], set()
+            for label_name, labels in coco_json_labels(json_path):
+                path = os.path.normpath(os.path.join(labels_dir, label_name))
+                expected.add(path)
+                data = labels.encode()
+                entry = self.manifest.get("outputs", path)
+                if (
+                    entry is None
+                    or entry["hash"] != content_hash(data)
+                    or not self.manifest.is_current("outputs", path)
+                ):
+                    jobs.append((data, path))
+        with self.__step(f"write_{split}_labels"):
+            self.__run(self.__write_label, jobs, desc=f"Writing {split} labels")
+            removed = self.__remove_stale(labels_dir, expected)
+        names = sorted(os.path.basename(path).split(".")[0] for path in expected)
+        self.manifest.state[f"{split}_labels"] = names
+        # recorded last: an interrupted conversion is redone, but skips the labels written so far
+        self.manifest.record("inputs", json_path, hash=file_hash(json_path))
+        logging.info(
+            f"{split}: {len(jobs)} labels written, {len(expected) - len(jobs)} unchanged, {removed} removed"
+        )
+        return set(names)
+
+    def __update_image(self, src: str, dst: str):
+        """
+        Transfers the image unless the source and the transferred file are unchanged
+        """
+        if self.manifest.is_current("inputs", src) and self.manifest.is_current(
+            "outputs", dst
+        ):
+            return
+        # images are compared by size and modification time: hashing them means reading the whole dataset
+        self.manifest.record("inputs", src)
+        transfer(src, dst, self.images_mode)
+        self.manifest.record("outputs", dst, source=src)
+        self.__transferred.append(dst)
+
+    def __relocate_image(self, src: str, dst: str, keep: bool = False):
+        """
+        Puts an image transferred to one split to the other one
+        :param keep: Whether the image stays in its split (copied), otherwise it is moved
+        """
+        entry = self.manifest.get("outputs", src)
+        if keep:
+            copy2(src, dst)
+        else:
+            move(src, dst)
+            self.manifest.remove("outputs", src)
+        self.manifest.record("outputs", dst, source=entry.get("source"))
+
+    def __update_images(
+        self, train_labels: Set[str], val_labels: Set[str]
+    ) -> Tuple[int, int]:
+        """
+        Transfers new or changed images to the splits and removes the ones without labels
+        :param train_labels: Labels of train images
+        :param val_labels: Labels of test images
+        :return: Numbers of train and val images
+        """
+        with self.__step("scan_images"):
+            img_fnames = {
+                img_fname.split(".")[0]: img_fname
+                for img_fname in os.listdir(self.source_img_dir)
+            }
+        splits = [
+            (os.path.join(self.__train_dir, "images"), train_labels),
+            (os.path.join(self.__val_dir, "images"), val_labels),
+        ]
+        # images moved away from the dataset directory by the previous runs
+        recorded = {
+            images_dir: {
+                os.path.basename(path).split(".")[0]: path
+                for path in self.manifest.paths("outputs", images_dir)
+                if os.path.lexists(path)
+            }
+            for images_dir, _ in splits
+        }
+        self.__transferred = []
+        jobs, copies, moves, expected, counters = [], [], [], [], []
+        for (images_dir, labels), (other_dir, other_labels) in zip(
+            splits, splits[::-1]
+        ):
+            split_expected, missing = set(), 0
+            for name in labels:
+                if name in img_fnames:
+                    dst = os.path.normpath(os.path.join(images_dir, img_fnames[name]))
+                    jobs.append(
+                        (os.path.join(self.source_img_dir, img_fnames[name]), dst)
+                    )
+                    split_expected.add(dst)
+                elif name in recorded[images_dir]:
+                    split_expected.add(recorded[images_dir][name])
+                elif name in recorded[other_dir]:
+                    # reassigned from the other split: taken from there before its stale images are removed
+                    src = recorded[other_dir][name]
+                    dst = os.path.normpath(
+                        os.path.join(images_dir, os.path.basename(src))
+                    )
+                    (copies if name in other_labels else moves).append((src, dst))
+                    split_expected.add(dst)
+                else:
+                    missing += 1
+            if missing:
+                logging.warning(
+                    f"{missing} labeled images are missing for {images_dir}"
+                )
+            expected.append(split_expected)
+            counters.append(len(split_expected))
+        with self.__step("update_images"):
+            self.__run(
+                lambda src, dst: self.__relocate_image(src, dst, keep=True),
+                copies,
+                desc="Copying images between splits",
+            )
+            self.__run(
+                self.__relocate_image, moves, desc="Moving images between splits"
+            )
+            self.__run(self.__update_image, jobs, desc="Updating images")
+            for (images_dir, _), split_expected in zip(splits, expected):
+                removed = self.__remove_stale(images_dir, split_expected)
+                if removed:
+                    logging.info(
+                        f"{removed} images without labels removed from {images_dir}"
+                    )
+        logging.info(
+            f"{len(self.__transferred)} images transferred, {len(copies) + len(moves)} taken from the other split"
+        )
+        return counters[0], counters[1]
+
     def prepare_data(self) -> List[Dict[str, Any]]:
         """
         Creates data dict to save into yaml file
@@ -121,7 +436,7 @@ class DataPreprocessor:
         labels = get_labels(self.labels_path)
         data = [
             {
-                "train": self.__train_die,
+                "train": self.__train_dir,
                 "val": self.__val_dir,
                 "nc": len(labels),
                 "names": labels,
@@ -136,3 +451,71 @@ class DataPreprocessor:
         data = self.prepare_data()
         with open(self.data_path, "w+") as f:
             yaml.dump_all(data, f, sort_keys=False)
+
+    def pack(self, data_path: str = None, workers: int = 8) -> Dict[str, Any]:
+        """
+        Packs the preprocessed splits into memory-mapped packs next to them (see `packed_dataset.pack_split`)
+        and saves a yaml file pointing to the packs. Train on it with
+        `model.train(data=data_path, trainer=PackedDetectionTrainer)`
+        :param data_path: Path to the yaml file, `<data_path>.packed.yaml` by default
+        :param workers: Number of threads checking the images
+        :return: Meta information of the train and val packs
+        """
+        from packed_dataset import pack_split
+
+        data_path = data_path or os.path.splitext(self.data_path)[0] + ".packed.yaml"
+        data = self.prepare_data()
+        metas = {}
+        for split in ["train", "val"]:
+            pack_dir = f"{data[0][split]}.pack"
+            with self.__step(f"pack_{split}"):
+                metas[split] = pack_split(
+                    data[0][split], pack_dir, data[0]["nc"], workers=workers
+                )
+            data[0][split] = pack_dir
+        with open(data_path, "w+") as f:
+            yaml.dump_all(data, f, sort_keys=False)
+        logging.info(
+            f"{data_path} file created. Use it as `data` parameter with `trainer=PackedDetectionTrainer`."
+        )
+        return metas
+
+    def letterbox(
+        self, imgsz: int = 640, data_path: str = None, workers: int = 8
+    ) -> Dict[str, Any]:
+        """
+        Letterboxes the preprocessed splits to the training image size once (see `packed_dataset.letterbox_split`),
+        reading the packs of the splits if they are up to date, and saves a yaml file pointing to the caches. Train on it with
+        `model.train(data=data_path, imgsz=imgsz, trainer=PackedDetectionTrainer)`
+        :param imgsz: Training image size
+        :param data_path: Path to the yaml file, `<data_path>.letterbox<imgsz>.yaml` by default
+        :param workers: Number of threads decoding and resizing the images
+        :return: Meta information of the train and val caches
+        """
+        from packed_dataset import is_current_pack, is_pack, letterbox_split
+
+        data_path = (
+            data_path or f"{os.path.splitext(self.data_path)[0]}.letterbox{imgsz}.yaml"
+        )
+        data = self.prepare_data()
+        metas = {}
+        for split in ["train", "val"]:
+            split_dir = data[0][split]
+            pack_dir = f"{split_dir}.pack"
+            source = split_dir
+            if is_current_pack(pack_dir, split_dir):
+                source = pack_dir
+            elif is_pack(pack_dir):
+                logging.info(f"{pack_dir} is stale, letterboxing {split_dir} instead")
+            cache_dir = f"{split_dir}.letterbox{imgsz}"
+            with self.__step(f"letterbox_{split}"):
+                metas[split] = letterbox_split(
+                    source, cache_dir, imgsz, data[0]["nc"], workers=workers
+                )
+            data[0][split] = cache_dir
+        with open(data_path, "w+") as f:
+            yaml.dump_all(data, f, sort_keys=False)
+        logging.info(
+            f"{data_path} file created. Use it as `data` parameter with `imgsz={imgsz}` and `trainer=PackedDetectionTrainer`."
+        )
+        return metas
@@ -0,0 +1,22 @@
+import hashlib
+
+
+def content_hash(data: bytes) -> str:
+    """
+    :param data: Bytes or any other contiguous buffer
+    :return: Hex digest of the data
+    """
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+def file_hash(path: str, chunk_size: int = 1 << 20) -> str:
+    """
+    :param path: Path to the file
+    :param chunk_size: Number of bytes hashed at once
+    :return: Hex digest of the file content, the same as `content_hash` of it
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
@@ -0,0 +1,120 @@
+import json
+import logging
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+SECTIONS = ("inputs", "outputs")
+
+
+class Manifest:
+    def __init__(self, path: str, save_interval: float = 30.0):
+        """
+        Record of the inputs a pipeline consumed and the outputs it produced: size, modification time
+        and content hash of every file. A file whose size and modification time match its entry is
+        taken as unchanged without reading it. The manifest is saved atomically at most every
+        `save_interval` seconds while it changes, so an interrupted run loses only the records of
+        the last seconds and redoes only that work. `state` keeps any other json-serializable data
+        of the pipeline, it is saved together with the entries.
+
+        :param path: Path of the manifest json
+        :param save_interval: Seconds between saves
+        """
+        self.path = path
+        self.save_interval = save_interval
+        self.entries: Dict[str, Dict[str, Dict[str, Any]]] = {
+            section: {} for section in SECTIONS
+        }
+        self.state: Dict[str, Any] = {}
+        self._saved_at = time.monotonic()
+        self._dirty = False
+        self._lock = threading.Lock()
+        if os.path.exists(path):
+            with open(path) as f:
+                data = json.load(f)
+            self.entries.update(data["entries"])
+            self.state = data["state"]
+            logging.info(
+                f"Loaded manifest {path}: "
+                + ", ".join(f"{len(self.entries[s])} {s}" for s in SECTIONS)
+            )
+
+    @staticmethod
+    def _key(path: str) -> str:
+        return os.path.normpath(path)
+
+    def get(self, section: str, path: str) -> Optional[Dict[str, Any]]:
+        return self.entries[section].get(self._key(path))
+
+    def is_current(self, section: str, path: str, stat: os.stat_result = None) -> bool:
+        """
+        :param section: `inputs` or `outputs`
+        :param path: Path to the file
+        :param stat: Stat of the file if it is already known
+        :return: Whether the file exists and its size and modification time match the entry
+        """
+        entry = self.get(section, path)
+        if entry is None:
+            return False
+        if stat is None:
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                return False
+        return entry["size"] == stat.st_size and entry["mtime"] == stat.st_mtime
+
+    def record(
+        self, section: str, path: str, hash: Optional[str] = None, **fields: Any
+    ):
+        """
+        Saves the current size and modification time of a file
+        :param section: `inputs` or `outputs`
+        :param path: Path to the file
+        :param hash: Content hash, None if the file isn't hashed
+        :param fields: Other fields of the entry
+        """
+        stat = os.stat(path)
+        entry = {"size": stat.st_size, "mtime": stat.st_mtime, "hash": hash, **fields}
+        with self._lock:
+            self.entries[section][self._key(path)] = entry
+            self._changed()
+
+    def remove(self, section: str, path: str):
+        with self._lock:
+            if self.entries[section].pop(self._key(path), None) is not None:
+                self._changed()
+
+    def paths(self, section: str, directory: str) -> List[str]:
+        """
+        :return: Paths of the entries inside the directory
+        """
+        prefix = self._key(directory) + os.sep
+        return [path for path in self.entries[section] if path.startswith(prefix)]
+
+    def _changed(self):
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= self.save_interval:
+            self._save()
+
+    def save(self):
+        """
+        Saves the manifest if its entries changed
+        """
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def _save(self):
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"entries": self.entries, "state": self.state}, f)
+        os.replace(tmp_path, self.path)
+        self._saved_at = time.monotonic()
+        self._dirty = False
@@ -0,0 +1,314 @@
+import collections
+import csv
+import gc
+import json
+import logging
+import os
+import threading
+from typing import Any, Callable, Dict, Hashable, List, NamedTuple, Optional, Tuple
+
+from utils.hashing import file_hash
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+RUNS_DIR = os.path.join("runs", "detect")
+MAP50 = "metrics/mAP50(B)"
+MAP50_95 = "metrics/mAP50-95(B)"
+
+
+class CheckpointInfo(NamedTuple):
+    run: str
+    name: str
+    path: str
+    hash: str
+    size: int
+    mtime: float
+    epoch: Optional[int]
+    map50: Optional[float]
+    map50_95: Optional[float]
+
+
+def read_results(csv_path: str) -> List[Dict[str, float]]:
+    """
+    Reads the per-epoch metrics ultralytics saves to `results.csv` of a run
+    :param csv_path: Path to `results.csv`
+    :return: One dict per epoch, column names without the padding
+    """
+    rows = []
+    with open(csv_path, newline="") as f:
+        for row in csv.DictReader(f, skipinitialspace=True):
+            try:
+                rows.append({key.strip(): float(value) for key, value in row.items()})
+            except (TypeError, ValueError):
+                # an epoch being written by a running training
+                continue
+    return rows
+
+
+def _best_epoch(rows: List[Dict[str, float]]) -> Optional[Dict[str, float]]:
+    """
+    :return: Metrics of the epoch `best.pt` is saved at: the first one with the highest fitness
+    """
+    best, best_fitness = None, None
+    for row in rows:
+        if MAP50 not in row or MAP50_95 not in row:
+            continue
+        fitness = 0.1 * row[MAP50] + 0.9 * row[MAP50_95]
+        if best_fitness is None or fitness > best_fitness:
+            best, best_fitness = row, fitness
+    return best
+
+
+class CheckpointRegistry:
+    def __init__(self, runs_dir: str = RUNS_DIR, index_path: str = None):
+        """
+        Index of the checkpoints in the training runs (`runs/detect/<run>/weights/*.pt`) with their
+        content hash, size and the epoch and metrics parsed from the run's `results.csv`.
+        `best.pt` gets the epoch with the highest fitness (0.1 mAP50 + 0.9 mAP50-95, as in
+        ultralytics), other checkpoints get the last epoch. Hashes are kept in `index_path`
+        and recomputed only for checkpoints whose size or modification time changed.
+
+        :param runs_dir: Directory with the training runs
+        :param index_path: Path of the saved index, `registry.json` in `runs_dir` by default
+        """
+        self.runs_dir = runs_dir
+        self.index_path = index_path or os.path.join(runs_dir, "registry.json")
+        self.checkpoints: List[CheckpointInfo] = []
+        self.refresh()
+
+    def _load_index(self) -> Dict[str, CheckpointInfo]:
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path) as f:
+                return {info["path"]: CheckpointInfo(**info) for info in json.load(f)}
+        except (OSError, ValueError, TypeError):
+            return {}
+
+    def _save_index(self):
+        tmp_path = f"{self.index_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump([info._asdict() for info in self.checkpoints], f, indent=2)
+        os.replace(tmp_path, self.index_path)
+
+    def refresh(self) -> List[CheckpointInfo]:
+        """
+        Rescans the runs directory
+        :return: Checkpoints sorted by run and name
+        """
+        if not os.path.isdir(self.runs_dir):
+            self.checkpoints = []
+            return self.checkpoints
+        known = self._load_index()
+        checkpoints = []
+        for run in sorted(os.scandir(self.runs_dir), key=lambda entry: entry.name):
+            weights_dir = os.path.join(run.path, "weights")
+            if not run.is_dir() or not os.path.isdir(weights_dir):
+                continue
+            results_path = os.path.join(run.path, "results.csv")
+            rows = read_results(results_path) if os.path.exists(results_path) else []
+            for entry in sorted(os.scandir(weights_dir), key=lambda entry: entry.name):
+                if not entry.name.endswith(".pt"):
+                    continue
+                stat = entry.stat()
+                name = os.path.splitext(entry.name)[0]
+                row = (
+                    _best_epoch(rows) if name == "best" else rows[-1] if rows else None
+                )
+                cached = known.get(entry.path)
+                if (
+                    cached is not None
+                    and cached.size == stat.st_size
+                    and cached.mtime == stat.st_mtime
+                ):
+                    checkpoint_hash = cached.hash
+                else:
+                    checkpoint_hash = file_hash(entry.path)
+                checkpoints.append(
+                    CheckpointInfo(
+                        run=run.name,
+                        name=name,
+                        path=entry.path,
+                        hash=checkpoint_hash,
+                        size=stat.st_size,
+                        mtime=stat.st_mtime,
+                        epoch=int(row["epoch"]) if row and "epoch" in row else None,
+                        map50=row.get(MAP50) if row else None,
+                        map50_95=row.get(MAP50_95) if row else None,
+                    )
+                )
+        self.checkpoints = checkpoints
+        self._save_index()
+        logging.info(f"Indexed {len(checkpoints)} checkpoints in {self.runs_dir}")
+        return checkpoints
+
+    def find(self, run: str, name: str = "best") -> Optional[CheckpointInfo]:
+        """
+        :param run: Run name (e.g. yolov8m2)
+        :param name: Checkpoint name (`best`, `last` or `epochN`)
+        :return: The checkpoint or None
+        """
+        for info in self.checkpoints:
+            if info.run == run and info.name == name:
+                return info
+        return None
+
+    def by_hash(self, checkpoint_hash: str) -> Optional[CheckpointInfo]:
+        for info in self.checkpoints:
+            if info.hash == checkpoint_hash:
+                return info
+        return None
+
+    def latest(
+        self, model_name: str = None, name: str = "best"
+    ) -> Optional[CheckpointInfo]:
+        """
+        :param model_name: Only runs starting with the model name (e.g. yolov8m)
+        :param name: Checkpoint name
+        :return: The most recently modified checkpoint or None
+        """
+        candidates = [
+            info
+            for info in self.checkpoints
+            if info.name == name
+            and (model_name is None or info.run.startswith(model_name))
+        ]
+        return max(candidates, key=lambda info: info.mtime, default=None)
+
+    def best(
+        self, metric: str = "map50_95", model_name: str = None
+    ) -> Optional[CheckpointInfo]:
+        """
+        :param metric: `map50_95` or `map50`
+        :param model_name: Only runs starting with the model name (e.g. yolov8m)
+        :return: The checkpoint with the highest metric or None
+        """
+        assert metric in ("map50", "map50_95"), f"Unknown metric {metric}"
+        candidates = [
+            info
+            for info in self.checkpoints
+            if getattr(info, metric) is not None
+            and (model_name is None or info.run.startswith(model_name))
+        ]
+        return max(candidates, key=lambda info: getattr(info, metric), default=None)
+
+
+class ModelCache:
+    def __init__(self, max_models: int = None):
+        """
+        Process-wide cache of loaded models keyed by the checkpoint content hash, the device,
+        the backend and the backend options, so that every `get_model` call for the same
+        weights returns the same instance. The instances are shared: changes of their
+        `overrides` are seen by all the users, and a model shouldn't run predictions from
+        several threads at once. Models are evicted explicitly with `evict` or in least
+        recently used order once there are more than `max_models` of them.
+
+        :param max_models: Maximum number of loaded models, unlimited if not provided
+        """
+        self.max_models = max_models
+        self.hits = 0
+        self.misses = 0
+        self._models: "collections.OrderedDict[Tuple, Any]" = collections.OrderedDict()
+        self._hashes: Dict[Tuple[str, int, float], str] = {}
+        self._lock = threading.RLock()
+
+    def checkpoint_hash(self, checkpoint_path: str) -> str:
+        """
+        Content hash of a checkpoint, remembered while its size and modification time stay the
+        same. Checkpoints that don't exist (e.g. pretrained ones ultralytics downloads) are
+        identified by their name.
+        """
+        if not os.path.exists(checkpoint_path):
+            return checkpoint_path
+        stat = os.stat(checkpoint_path)
+        memo_key = (os.path.abspath(checkpoint_path), stat.st_size, stat.st_mtime)
+        with self._lock:
+            if memo_key not in self._hashes:
+                self._hashes[memo_key] = file_hash(checkpoint_path)
+            return self._hashes[memo_key]
+
+    def key(
+        self,
+        checkpoint_path: str,
+        backend: str = "torch",
+        device: str = None,
+        **options: Hashable,
+    ) -> Tuple:
+        return (
+            self.checkpoint_hash(checkpoint_path),
+            str(device) if device is not None else None,
+            backend,
+            tuple(sorted(options.items())),
+        )
+
+    def get(self, key: Tuple, loader: Callable[[], Any]) -> Any:
+        """
+        :param key: Cache key (see `key`)
+        :param loader: Loads the model on a miss
+        :return: The cached or the loaded model
+        """
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key]
+            self.misses += 1
+            # loading under the lock: concurrent first calls load the model once
+            model = loader()
+            self._models[key] = model
+            if self.max_models is not None:
+                while len(self._models) > self.max_models:
+                    self._release([self._models.popitem(last=False)[0]])
+            return model
+
+    def evict(
+        self, checkpoint_path: str = None, device: str = None, backend: str = None
+    ) -> int:
+        """
+        Drops cached models and releases their memory. Models still referenced elsewhere stay
+        alive until those references are gone.
+
+        :param checkpoint_path: Only models of the checkpoint
+        :param device: Only models on the device
+        :param backend: Only models of the backend
+        :return: Number of evicted models
+        """
+        with self._lock:
+            checkpoint_hash = (
+                self.checkpoint_hash(checkpoint_path) if checkpoint_path else None
+            )
+            keys = [
+                key
+                for key in self._models
+                if (checkpoint_hash is None or key[0] == checkpoint_hash)
+                and (device is None or key[1] == str(device))
+                and (backend is None or key[2] == backend)
+            ]
+            for key in keys:
+                del self._models[key]
+            self._release(keys)
+            return len(keys)
+
+    def _release(self, keys: List[Tuple]):
+        if keys:
+            logging.info(f"Evicted {len(keys)} models")
+        gc.collect()
+        try:
+            import torch
+        except ImportError:
+            return
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    def __len__(self) -> int:
+        return len(self._models)
+
+    def __contains__(self, key: Tuple) -> bool:
+        return key in self._models
+
+    def stats(self) -> Dict[str, int]:
+        return {"models": len(self._models), "hits": self.hits, "misses": self.misses}
+
+
+MODEL_CACHE = ModelCache()
@@ -0,0 +1,207 @@
+import logging
+import os
+import random
+from typing import List, Optional, Tuple
+
+import cv2
+import numpy as np
+from ultralytics import YOLO
+from ultralytics.data.augment import LetterBox
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+IMAGE_EXTENSIONS = {".jpg", ".jpeg", ".png", ".bmp"}
+
+
+def export_onnx(checkpoint_path: str, imgsz: int = 640, dynamic: bool = True) -> str:
+    """
+    Exports a checkpoint to ONNX once, the exported model is reused on later calls
+    :param checkpoint_path: Path to the PyTorch checkpoint
+    :param imgsz: Input image size of the exported model
+    :param dynamic: Export with dynamic batch size and image size. A static export only accepts
+        a batch of one image of `imgsz`
+    :return: Path to the ONNX model (next to the checkpoint)
+    """
+    onnx_path = (
+        f"{os.path.splitext(checkpoint_path)[0]}.{imgsz}"
+        f"{'.dynamic' if dynamic else ''}.onnx"
+    )
+    if os.path.exists(onnx_path) and os.path.getmtime(onnx_path) >= os.path.getmtime(
+        checkpoint_path
+    ):
+        return onnx_path
+    exported = YOLO(checkpoint_path).export(
+        format="onnx", imgsz=imgsz, dynamic=dynamic, simplify=True
+    )
+    if os.path.abspath(exported) != os.path.abspath(onnx_path):
+        os.replace(exported, onnx_path)
+    logging.info(f"ONNX model saved to {onnx_path}")
+    return onnx_path
+
+
+class CalibrationReader:
+    def __init__(
+        self,
+        images_dir: str,
+        input_name: str,
+        imgsz: int = 640,
+        num_images: int = 200,
+        seed: int = 0,
+    ):
+        """
+        Feeds a random subset of images preprocessed the same way as at inference
+        (letterbox, RGB, CHW, [0, 1]) to the static quantization calibration
+        :param images_dir: Directory with calibration images (e.g. the converted val split)
+        :param input_name: Name of the model input
+        :param imgsz: Model input size
+        :param num_images: Number of calibration images
+        :param seed: Seed of the subset sampling
+        """
+        fnames = sorted(
+            fname
+            for fname in os.listdir(images_dir)
+            if os.path.splitext(fname)[1].lower() in IMAGE_EXTENSIONS
+        )
+        random.Random(seed).shuffle(fnames)
+        self.paths = [os.path.join(images_dir, fname) for fname in fnames[:num_images]]
+        self.input_name = input_name
+        self.letterbox = LetterBox((imgsz, imgsz), auto=False)
+        self._iter = iter(self.paths)
+
+    def get_next(self):
+        path = next(self._iter, None)
+        if path is None:
+            return None
+        image = self.letterbox(image=cv2.imread(path))
+        image = image[:, :, ::-1].transpose(2, 0, 1)[None]
+        return {self.input_name: np.ascontiguousarray(image, dtype=np.float32) / 255}
+
+    def rewind(self):
+        self._iter = iter(self.paths)
+
+
+def quantize_int8(
+    onnx_path: str,
+    calibration_dir: str,
+    imgsz: int = 640,
+    num_images: int = 200,
+) -> str:
+    """
+    Statically quantizes an ONNX model to INT8, calibrating activations on real images
+    :param onnx_path: Path to the FP32 ONNX model
+    :param calibration_dir: Directory with calibration images (e.g. datasets/val_annotation/images)
+    :param imgsz: Model input size
+    :param num_images: Number of calibration images
+    :return: Path to the INT8 ONNX model
+    """
+    import onnx
+    from onnxruntime.quantization import (
+        CalibrationMethod,
+        QuantFormat,
+        QuantType,
+        quantize_static,
+    )
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+
+    int8_path = os.path.splitext(onnx_path)[0] + ".int8.onnx"
+    if os.path.exists(int8_path) and os.path.getmtime(int8_path) >= os.path.getmtime(
+        onnx_path
+    ):
+        return int8_path
+    fp32_model = onnx.load(onnx_path)
+    input_name = fp32_model.graph.input[0].name
+    prepared_path = os.path.splitext(onnx_path)[0] + ".prep.onnx"
+    # symbolic shape inference can't resolve the dynamic height and width of the export
+    dynamic = any(
+        dim.dim_param for dim in fp32_model.graph.input[0].type.tensor_type.shape.dim
+    )
+    quant_pre_process(onnx_path, prepared_path, skip_symbolic_shape=dynamic)
+    quantize_static(
+        prepared_path,
+        int8_path,
+        CalibrationReader(calibration_dir, input_name, imgsz, num_images),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+        calibrate_method=CalibrationMethod.MinMax,
+    )
+    os.remove(prepared_path)
+    # ultralytics reads class names and stride from the metadata, which quantization drops
+    int8_model = onnx.load(int8_path)
+    del int8_model.metadata_props[:]
+    int8_model.metadata_props.extend(fp32_model.metadata_props)
+    onnx.save(int8_model, int8_path)
+    logging.info(f"INT8 model saved to {int8_path}")
+    return int8_path
+
+
+def get_onnx_model(
+    checkpoint_path: str,
+    imgsz: int = 640,
+    int8: bool = False,
+    calibration_dir: str = None,
+    num_calibration_images: int = 200,
+    dynamic: bool = True,
+) -> YOLO:
+    """
+    Gets a YOLO model running on ONNX Runtime. It returns the same results as the PyTorch model,
+    so it can be used by `Detector` as is. Its default inference size is the export `imgsz`
+    :param checkpoint_path: Path to the PyTorch checkpoint
+    :param imgsz: Input image size of the exported model
+    :param int8: Whether to use the statically quantized INT8 model
+    :param calibration_dir: Directory with calibration images, required for `int8`
+    :param num_calibration_images: Number of calibration images
+    :param dynamic: Export with dynamic batch size and image size, otherwise the model only
+        accepts one image at a time at `imgsz` (see `fixed_input`)
+    :return: YOLO model
+    """
+    onnx_path = export_onnx(checkpoint_path, imgsz, dynamic)
+    if int8:
+        assert calibration_dir, "`calibration_dir` is required for INT8 quantization"
+        onnx_path = quantize_int8(
+            onnx_path, calibration_dir, imgsz, num_calibration_images
+        )
+    if dynamic:
+        model = YOLO(onnx_path, task="detect")
+    else:
+        model = StaticONNXModel(onnx_path, task="detect")
+        model.fixed_input = (1, imgsz)
+    model.overrides["imgsz"] = imgsz
+    return model
+
+
+class StaticONNXModel(YOLO):
+    """
+    YOLO model of a static ONNX export, checks every call with `check_input`
+    """
+
+    def predict(self, source=None, stream=False, predictor=None, **kwargs):
+        check_input(
+            self, len(source) if isinstance(source, list) else 1, kwargs.get("imgsz")
+        )
+        return super().predict(source, stream, predictor, **kwargs)
+
+
+def fixed_input(model: YOLO) -> Tuple[Optional[int], Optional[int]]:
+    """
+    :return: Maximum batch size and the only image size a model accepts, None when not limited
+    """
+    return getattr(model, "fixed_input", (None, None))
+
+
+def check_input(model: YOLO, batch_size: int = 1, imgsz: int = None):
+    """
+    Rejects inputs a statically exported model can't run, before they fail inside ONNX Runtime
+    :param model: YOLO model
+    :param batch_size: Number of images in the model call
+    :param imgsz: Inference size of the call, the model default if not provided
+    """
+    max_batch_size, fixed_imgsz = fixed_input(model)
+    assert (
+        max_batch_size is None or batch_size <= max_batch_size
+    ), f"The model is exported for batches of up to {max_batch_size} images, got {batch_size}. Export it with `dynamic=True`"
+    assert (
+        fixed_imgsz is None or imgsz is None or imgsz == fixed_imgsz
+    ), f"The model is exported for imgsz={fixed_imgsz}, got {imgsz}. Export it with `dynamic=True`"
@@ -0,0 +1,583 @@
+import json
+import logging
+import math
+import os
+import shutil
+from abc import ABC, abstractmethod
+from copy import copy
+from itertools import repeat
+from multiprocessing.pool import ThreadPool
+from typing import Any, Dict, Iterator, List, Tuple
+
+import cv2
+import numpy as np
+from ultralytics.data import YOLODataset
+from ultralytics.data.utils import IMG_FORMATS, img2label_paths, verify_image_label
+from ultralytics.models.yolo.detect import DetectionTrainer, DetectionValidator
+from ultralytics.utils import colorstr
+from ultralytics.utils.torch_utils import de_parallel
+
+from hashing import content_hash
+
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+PACK_VERSION = 1
+INDEX_DTYPE = np.dtype(
+    [("offset", "<i8"), ("size", "<i8"), ("height", "<i4"), ("width", "<i4")]
+)
+LABEL_DTYPE = np.dtype([("image", "<i4"), ("cls", "<i4"), ("xywh", "<f4", (4,))])
+# source hash, source shape, shape of the resized image and the padding above and left of it
+LETTERBOX_INDEX_DTYPE = np.dtype(
+    [
+        ("hash", "S32"),
+        ("height", "<i4"),
+        ("width", "<i4"),
+        ("resized", "<i4", (2,)),
+        ("pad", "<i4", (2,)),
+    ]
+)
+PAD_COLOR = (114, 114, 114)
+
+
+def is_pack(path: str) -> bool:
+    return os.path.isfile(os.path.join(str(path), "meta.json"))
+
+
+def read_meta(pack_dir: str) -> Dict[str, Any]:
+    assert is_pack(pack_dir), f"{pack_dir} is not a pack"
+    with open(os.path.join(pack_dir, "meta.json")) as f:
+        return json.load(f)
+
+
+def split_state(split_dir: str) -> str:
+    """
+    :return: Hash of the names, sizes and modification times of the images and labels of a split
+    """
+    entries = []
+    for folder in ["images", "labels"]:
+        directory = os.path.join(split_dir, folder)
+        if os.path.isdir(directory):
+            for entry in os.scandir(directory):
+                stat = entry.stat()
+                entries.append((folder, entry.name, stat.st_size, stat.st_mtime_ns))
+    return content_hash(repr(sorted(entries)).encode())
+
+
+def is_current_pack(pack_dir: str, split_dir: str) -> bool:
+    """
+    :return: Whether the pack exists and the split hasn't changed since it was packed
+    """
+    if not is_pack(pack_dir):
+        return False
+    return read_meta(pack_dir).get("state") == split_state(split_dir)
+
+
+def _image_files(split_dir: str) -> List[str]:
+    images_dir = os.path.join(split_dir, "images")
+    im_files = sorted(
+        entry.path
+        for entry in os.scandir(images_dir)
+        if entry.name.rsplit(".", 1)[-1].lower() in IMG_FORMATS
+    )
+    assert im_files, f"No images found in {images_dir}"
+    return im_files
+
+
+def _verified(
+    im_files: List[str], num_classes: int, workers: int
+) -> Iterator[Tuple[str, np.ndarray, Tuple[int, int]]]:
+    """
+    Checks images and labels the same way ultralytics checks them
+    :return: Image path, labels (cls, xywh) and shape (h, w) of the valid images in order
+    """
+    msgs = []
+    with ThreadPool(workers) as pool:
+        results = pool.imap(
+            verify_image_label,
+            zip(
+                im_files,
+                img2label_paths(im_files),
+                repeat(""),
+                repeat(False),
+                repeat(num_classes),
+                repeat(0),
+                repeat(0),
+            ),
+        )
+        for im_file, lb, shape, _, _, _, _, _, _, msg in results:
+            if msg:
+                msgs.append(msg)
+            if im_file:
+                yield im_file, lb, shape
+    if msgs:
+        logging.info("\n".join(msgs))
+
+
+def _label_array(image: int, cls: np.ndarray, xywh: np.ndarray) -> np.ndarray:
+    labels = np.zeros(len(cls), dtype=LABEL_DTYPE)
+    labels["image"] = image
+    labels["cls"] = cls
+    labels["xywh"] = xywh
+    return labels
+
+
+def pack_split(
+    split_dir: str, pack_dir: str, num_classes: int, workers: int = 8
+) -> Dict[str, Any]:
+    """
+    Packs a split in the YOLO layout (`images/`, `labels/`) into a directory of memory-mappable files:
+    `images.bin` with the encoded images one after another, `index.npy` with the offset, size and
+    shape of every image, `labels.npy` with all boxes as one structured array (image, cls, xywh)
+    sorted by image, `names.json` with the image file names and `meta.json` with the state of the split
+    (see `is_current_pack`). Images and labels are checked the same way ultralytics checks them,
+    corrupt ones are left out.
+
+    :param split_dir: Split directory (e.g. datasets/train_annotation)
+    :param pack_dir: Output directory, replaced if it exists
+    :param num_classes: Number of classes, labels of other classes are corrupt
+    :param workers: Number of threads checking the images
+    :return: Meta information of the pack
+    """
+    # taken before reading: a split changed while it is packed makes the pack stale
+    state = split_state(split_dir)
+    im_files = _image_files(split_dir)
+    tmp_dir = f"{pack_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    index = np.zeros(len(im_files), dtype=INDEX_DTYPE)
+    names, labels = [], []
+    offset = 0
+    with open(os.path.join(tmp_dir, "images.bin"), "wb") as data:
+        for im_file, lb, shape in _verified(im_files, num_classes, workers):
+            with open(im_file, "rb") as f:
+                encoded = f.read()
+            data.write(encoded)
+            i = len(names)
+            index[i] = (offset, len(encoded), shape[0], shape[1])
+            offset += len(encoded)
+            names.append(os.path.basename(im_file))
+            labels.append(_label_array(i, lb[:, 0], lb[:, 1:5]))
+    np.save(os.path.join(tmp_dir, "index.npy"), index[: len(names)])
+    np.save(
+        os.path.join(tmp_dir, "labels.npy"),
+        np.concatenate(labels) if labels else np.zeros(0, dtype=LABEL_DTYPE),
+    )
+    with open(os.path.join(tmp_dir, "names.json"), "w") as f:
+        json.dump(names, f)
+    meta = {
+        "version": PACK_VERSION,
+        "kind": PackedDataset.kind,
+        "source": os.path.abspath(split_dir),
+        "state": state,
+        "images": len(names),
+        "boxes": int(sum(len(image_labels) for image_labels in labels)),
+        "bytes": offset,
+        "skipped": len(im_files) - len(names),
+    }
+    # written last: a pack without meta.json is not a pack
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(pack_dir, ignore_errors=True)
+    os.replace(tmp_dir, pack_dir)
+    logging.info(
+        f"Packed {meta['images']} images and {meta['boxes']} boxes ({offset / 2**20:.1f} MB) to {pack_dir}"
+    )
+    return meta
+
+
+class PackReader(ABC):
+    kind = ""
+
+    def __init__(self, pack_dir: str):
+        """
+        Base of the pack readers: the index, the labels and the image names of a pack directory.
+        Images and labels are memory-mapped, so opening a pack costs the same for any dataset size
+        and forked data loader workers share the pages.
+
+        :param pack_dir: Pack directory
+        """
+        self.meta = read_meta(pack_dir)
+        assert (
+            self.meta["version"] == PACK_VERSION
+        ), f"Unsupported pack version {self.meta['version']}"
+        kind = self.meta.get("kind", "pack")
+        assert kind == self.kind, f"{pack_dir} is a {kind}, not a {self.kind}"
+        self.pack_dir = pack_dir
+        self.index = np.load(os.path.join(pack_dir, "index.npy"))
+        self.labels = np.load(os.path.join(pack_dir, "labels.npy"), mmap_mode="r")
+        with open(os.path.join(pack_dir, "names.json")) as f:
+            self.names: List[str] = json.load(f)
+        self._open_images()
+        # boxes of image i are labels[label_offsets[i]:label_offsets[i + 1]]
+        self.label_offsets = np.searchsorted(
+            self.labels["image"], np.arange(len(self.index) + 1)
+        )
+
+    @abstractmethod
+    def _open_images(self):
+        """
+        Opens the images of the pack, called once the index is loaded
+        """
+
+    def __len__(self) -> int:
+        return len(self.index)
+
+    @abstractmethod
+    def shape(self, i: int) -> Tuple[int, int]:
+        """
+        :return: Height and width of the image
+        """
+
+    @abstractmethod
+    def image(self, i: int) -> np.ndarray:
+        """
+        :return: BGR image
+        """
+
+    def boxes(self, i: int) -> np.ndarray:
+        """
+        :return: Labels of the image, a view of the memory map
+        """
+        return self.labels[self.label_offsets[i] : self.label_offsets[i + 1]]
+
+    def label(self, i: int) -> Dict[str, Any]:
+        """
+        :return: Labels of the image in the format of ultralytics' YOLODataset
+        """
+        boxes = self.boxes(i)
+        return dict(
+            im_file=os.path.join(self.pack_dir, "images", self.names[i]),
+            shape=self.shape(i),
+            cls=boxes["cls"].astype(np.float32).reshape(-1, 1),
+            bboxes=np.array(boxes["xywh"], dtype=np.float32).reshape(-1, 4),
+            segments=[],
+            keypoints=None,
+            normalized=True,
+            bbox_format="xywh",
+        )
+
+
+class PackedDataset(PackReader):
+    """
+    Reader of a pack written by `pack_split`, images are kept encoded
+    """
+
+    kind = "pack"
+
+    def _open_images(self):
+        self.data = (
+            np.memmap(
+                os.path.join(self.pack_dir, "images.bin"), dtype=np.uint8, mode="r"
+            )
+            if self.meta["bytes"]
+            else np.zeros(0, dtype=np.uint8)
+        )
+
+    def shape(self, i: int) -> Tuple[int, int]:
+        return int(self.index[i]["height"]), int(self.index[i]["width"])
+
+    def image_bytes(self, i: int) -> np.ndarray:
+        """
+        :return: Encoded image, a view of the memory map
+        """
+        offset, size = self.index[i]["offset"], self.index[i]["size"]
+        return self.data[offset : offset + size]
+
+    def image(self, i: int) -> np.ndarray:
+        """
+        :return: Decoded BGR image
+        """
+        return cv2.imdecode(self.image_bytes(i), cv2.IMREAD_COLOR)
+
+
+def letterbox(
+    im: np.ndarray, imgsz: int, out: np.ndarray = None
+) -> Tuple[np.ndarray, Tuple[int, int], Tuple[int, int]]:
+    """
+    Resizes the image so that its long side is `imgsz` and pads it to a square, centered, the same
+    way ultralytics' LetterBox does
+    :param im: BGR image
+    :param imgsz: Side of the square
+    :param out: Array of shape (imgsz, imgsz, 3) to write the result to
+    :return: The letterboxed image, shape (h, w) of the resized image and padding (top, left)
+    """
+    h0, w0 = im.shape[:2]
+    r = min(imgsz / h0, imgsz / w0)
+    h, w = int(round(h0 * r)), int(round(w0 * r))
+    top, left = int(round((imgsz - h) / 2 - 0.1)), int(round((imgsz - w) / 2 - 0.1))
+    if out is None:
+        out = np.empty((imgsz, imgsz, 3), dtype=np.uint8)
+    out[:] = PAD_COLOR
+    if (h, w) != (h0, w0):
+        im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+    out[top : top + h, left : left + w] = im
+    return out, (h, w), (top, left)
+
+
+def letterbox_split(
+    source: str,
+    cache_dir: str,
+    imgsz: int = 640,
+    num_classes: int = None,
+    workers: int = 8,
+) -> Dict[str, Any]:
+    """
+    Letterboxes every image of a split to `imgsz` once and saves them as one uint8 array
+    (`images.npy`, shape (N, imgsz, imgsz, 3)) in a pack-like cache directory, with the labels
+    moved to the letterboxed frame. The cache is read like a pack (see `PackedYOLODataset`), images
+    already have the training size and skip decoding and resizing. Mosaic tiles of training include
+    the padding, as if the letterboxed frames were the dataset. Every image costs imgsz² x 3 bytes
+    of disk (1.2 MB at 640). Rectangular validation batches (the validation during training) stay
+    square: 16:9 frames make imgsz x imgsz inputs instead of imgsz x 0.6 imgsz, so the model
+    spends about 1.7 times more on them. The cache pays off the most in training and in `model.val`.
+
+    Entries are keyed by the hash of the encoded source image and `imgsz`: rebuilding a cache of the
+    same size copies the images it already has instead of decoding them again.
+
+    :param source: Split directory in the YOLO layout or its pack
+    :param cache_dir: Output directory, replaced if it exists
+    :param imgsz: Training image size
+    :param num_classes: Number of classes, required for split directories
+    :param workers: Number of threads decoding and resizing the images
+    :return: Meta information of the cache
+    """
+    if is_pack(source):
+        assert (
+            read_meta(source).get("kind") != LetterboxCache.kind
+        ), f"{source} is already a letterbox cache, use its split or pack as the source"
+        pack = PackedDataset(source)
+        names = pack.names
+        boxes = [pack.boxes(i) for i in range(len(pack))]
+        read = pack.image_bytes
+    else:
+        assert num_classes, "num_classes is required to check the labels of a split"
+        verified = list(_verified(_image_files(source), num_classes, workers))
+        names = [os.path.basename(im_file) for im_file, _, _ in verified]
+        boxes = [
+            _label_array(i, lb[:, 0], lb[:, 1:5])
+            for i, (_, lb, _) in enumerate(verified)
+        ]
+
+        def read(i: int) -> bytes:
+            with open(verified[i][0], "rb") as f:
+                return f.read()
+
+    previous, reusable = None, {}
+    if is_pack(cache_dir) and read_meta(cache_dir).get("imgsz") == imgsz:
+        previous = LetterboxCache(cache_dir)
+        reusable = {key: j for j, key in enumerate(previous.index["hash"])}
+    tmp_dir = f"{cache_dir}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    index = np.zeros(len(names), dtype=LETTERBOX_INDEX_DTYPE)
+    images = np.lib.format.open_memmap(
+        os.path.join(tmp_dir, "images.npy"),
+        mode="w+",
+        dtype=np.uint8,
+        shape=(len(names), imgsz, imgsz, 3),
+    )
+
+    def process(i: int) -> bool:
+        encoded = read(i)
+        key = content_hash(encoded).encode()
+        j = reusable.get(key)
+        if j is not None:
+            images[i] = previous.images[j]
+            index[i] = previous.index[j]
+            return True
+        im = cv2.imdecode(np.frombuffer(encoded, dtype=np.uint8), cv2.IMREAD_COLOR)
+        _, resized, pad = letterbox(im, imgsz, out=images[i])
+        index[i] = (key, im.shape[0], im.shape[1], resized, pad)
+        return False
+
+    # threads write disjoint rows of the memory map
+    with ThreadPool(workers) as pool:
+        reused = sum(pool.imap(process, range(len(names)), chunksize=16))
+    images.flush()
+    del images, previous
+
+    labels = np.concatenate(boxes) if boxes else np.zeros(0, dtype=LABEL_DTYPE)
+    labels = np.array(labels, dtype=LABEL_DTYPE)
+    entries = index[labels["image"]]
+    (h, w), (top, left) = entries["resized"].T, entries["pad"].T
+    xywh = labels["xywh"]
+    xywh[:, 0] = (xywh[:, 0] * w + left) / imgsz
+    xywh[:, 1] = (xywh[:, 1] * h + top) / imgsz
+    xywh[:, 2] *= w / imgsz
+    xywh[:, 3] *= h / imgsz
+    np.save(os.path.join(tmp_dir, "index.npy"), index)
+    np.save(os.path.join(tmp_dir, "labels.npy"), labels)
+    with open(os.path.join(tmp_dir, "names.json"), "w") as f:
+        json.dump(names, f)
+    meta = {
+        "version": PACK_VERSION,
+        "kind": LetterboxCache.kind,
+        "imgsz": imgsz,
+        "source": os.path.abspath(source),
+        "images": len(names),
+        "boxes": len(labels),
+        "reused": int(reused),
+    }
+    # written last: a cache without meta.json is not a cache
+    with open(os.path.join(tmp_dir, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    shutil.rmtree(cache_dir, ignore_errors=True)
+    os.replace(tmp_dir, cache_dir)
+    logging.info(
+        f"Letterboxed {meta['images']} images to {imgsz}x{imgsz} ({reused} reused) in {cache_dir}"
+    )
+    return meta
+
+
+class LetterboxCache(PackReader):
+    """
+    Reader of a cache written by `letterbox_split`, images are (imgsz, imgsz, 3) arrays
+    """
+
+    kind = "letterbox"
+
+    def _open_images(self):
+        self.imgsz = self.meta["imgsz"]
+        self.images = np.load(os.path.join(self.pack_dir, "images.npy"), mmap_mode="r")
+
+    def shape(self, i: int) -> Tuple[int, int]:
+        return self.imgsz, self.imgsz
+
+    def image(self, i: int) -> np.ndarray:
+        """
+        :return: Letterboxed BGR image, a writable copy
+        """
+        return np.array(self.images[i])
+
+
+def open_pack(pack_dir: str) -> PackReader:
+    """
+    :return: Reader of a pack or of a letterbox cache
+    """
+    if read_meta(pack_dir).get("kind") == LetterboxCache.kind:
+        return LetterboxCache(pack_dir)
+    return PackedDataset(pack_dir)
+
+
+class PackedYOLODataset(YOLODataset):
+    def __init__(self, *args, **kwargs):
+        """
+        YOLODataset that reads images and labels from a pack (or a letterbox cache, see
+        `letterbox_split`) instead of loose files. Image caching
+        is off: the pack is memory-mapped, so the page cache already keeps the encoded images in RAM.
+        """
+        kwargs["cache"] = False
+        super().__init__(*args, **kwargs)
+
+    def get_img_files(self, img_path: str) -> List[str]:
+        self.pack = open_pack(str(img_path))
+        if isinstance(self.pack, LetterboxCache) and self.pack.imgsz != self.imgsz:
+            logging.warning(
+                f"{img_path} is letterboxed to {self.pack.imgsz}, images are resized again to {self.imgsz}"
+            )
+        im_files = [
+            os.path.join(self.pack.pack_dir, "images", name) for name in self.pack.names
+        ]
+        if self.fraction < 1:
+            im_files = im_files[: round(len(im_files) * self.fraction)]
+        return im_files
+
+    def get_labels(self) -> List[Dict[str, Any]]:
+        self.label_files = []
+        return [self.pack.label(i) for i in range(len(self.im_files))]
+
+    def load_image(self, i, rect_mode=True):
+        """
+        Same as `BaseDataset.load_image`, but decodes the image from the pack
+        """
+        if self.ims[i] is not None:
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+        im = self.pack.image(i)
+        if im is None:
+            raise FileNotFoundError(f"Image Not Found {self.im_files[i]}")
+        h0, w0 = im.shape[:2]
+        if rect_mode:
+            r = self.imgsz / max(h0, w0)
+            if r != 1:
+                w, h = (
+                    min(math.ceil(w0 * r), self.imgsz),
+                    min(math.ceil(h0 * r), self.imgsz),
+                )
+                im = cv2.resize(im, (w, h), interpolation=cv2.INTER_LINEAR)
+        elif not (h0 == w0 == self.imgsz):
+            im = cv2.resize(
+                im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR
+            )
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, (h0, w0), im.shape[:2]
+
+
+def build_packed_dataset(
+    cfg, img_path, batch, data, mode="train", rect=False, stride=32
+):
+    """
+    `ultralytics.data.build_yolo_dataset` for packs
+    """
+    return PackedYOLODataset(
+        img_path=img_path,
+        imgsz=cfg.imgsz,
+        batch_size=batch,
+        augment=mode == "train",
+        hyp=cfg,
+        rect=cfg.rect or rect,
+        single_cls=cfg.single_cls or False,
+        stride=int(stride),
+        pad=0.0 if mode == "train" else 0.5,
+        prefix=colorstr(f"{mode}: "),
+        classes=cfg.classes,
+        data=data,
+        fraction=cfg.fraction if mode == "train" else 1.0,
+    )
+
+
+class PackedDetectionValidator(DetectionValidator):
+    """
+    DetectionValidator reading packs, other paths are read as usual:
+    `model.val(data="trafic_signs.packed.yaml", validator=PackedDetectionValidator)`
+    """
+
+    def build_dataset(self, img_path, mode="val", batch=None):
+        if not is_pack(img_path):
+            return super().build_dataset(img_path, mode, batch)
+        return build_packed_dataset(
+            self.args, img_path, batch, self.data, mode=mode, stride=self.stride
+        )
+
+
+class PackedDetectionTrainer(DetectionTrainer):
+    """
+    DetectionTrainer reading packs, other paths are read as usual:
+    `model.train(data="trafic_signs.packed.yaml", trainer=PackedDetectionTrainer)`
+    """
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        if not is_pack(img_path):
+            return super().build_dataset(img_path, mode, batch)
+        gs = max(int(de_parallel(self.model).stride.max() if self.model else 0), 32)
+        return build_packed_dataset(
+            self.args,
+            img_path,
+            batch,
+            self.data,
+            mode=mode,
+            rect=mode == "val",
+            stride=gs,
+        )
+
+    def get_validator(self):
+        self.loss_names = "box_loss", "cls_loss", "dfl_loss"
+        return PackedDetectionValidator(
+            self.test_loader, save_dir=self.save_dir, args=copy(self.args)
+        )
@@ -1,39 +1,94 @@
-import gc
 import logging
 import os
-from typing import List
+from typing import TYPE_CHECKING, List
 
-import torch
-
-from ultralytics import YOLO
+if TYPE_CHECKING:
+    from ultralytics import YOLO
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 
-def get_model(version=None, checkpoint_path=None, model_name="yolov8m") -> YOLO:
+def get_model(
+    version=None,
+    checkpoint_path=None,
+    model_name="yolov8m",
+    backend: str = "torch",
+    device: str = None,
+    cache: bool = False,
+    **backend_kwargs,
+) -> "YOLO":
     """
-    Gets YOLO model: from saved checkpoints or pretrained
-    :param version: Last vesrion of the model (number of the most recently changed folder in `runs/detect`)
+    Gets YOLO model: from saved checkpoints or pretrained. Every call loads a new instance unless
+    `cache` is set: then models are cached per process by the checkpoint content hash, the device
+    and the backend, and repeated calls return the same shared instance. Changes of its
+    `overrides` (conf, imgsz) are seen by every holder, and it stays loaded until `evict_models`
+    or `cleanup` releases it
+    :param version: Training run of the model in `runs/detect`: its number (the run `<model_name><version>`),
+        `latest` for the most recently trained one or `best` for the one with the highest mAP50-95
+        (see `utils.model_registry.CheckpointRegistry`)
     :param checkpoint_path: Other path to checkpoints
     :param model_name: Model name (e.g. yolov8m)
+    :param backend: `torch` or `onnx` (ONNX Runtime, see `utils.onnx_backend.get_onnx_model` for `backend_kwargs`)
+    :param device: Device to put the torch model on (e.g. `cpu`, `0`), ultralytics' default if not provided
+    :param cache: Whether to share the instance through the process-wide model cache (see above)
     :return: YOLO model
     """
     if version is not None:
-        checkpoint_path = os.path.join(
-            "runs", "detect", f"{model_name}{version}", "weights", "best.pt"
-        )
+        from utils.model_registry import CheckpointRegistry
+
+        registry = CheckpointRegistry()
+        if version == "latest":
+            info = registry.latest(model_name)
+        elif version == "best":
+            info = registry.best(model_name=model_name)
+        else:
+            info = registry.find(f"{model_name}{version}")
+        assert (
+            info is not None
+        ), f"No checkpoint of {model_name} for version {version!r} in {registry.runs_dir}"
+        checkpoint_path = info.path
     else:
         checkpoint_path = checkpoint_path or f"{model_name}.pt"
-    return YOLO(checkpoint_path)
+    assert backend in ("torch", "onnx"), f"Unknown backend {backend}"
+
+    def load():
+        if backend == "onnx":
+            from utils.onnx_backend import get_onnx_model
+
+            return get_onnx_model(checkpoint_path, **backend_kwargs)
+        from ultralytics import YOLO
+
+        model = YOLO(checkpoint_path)
+        if device is not None:
+            model.to(device)
+            model.overrides["device"] = device
+        return model
+
+    if not cache:
+        return load()
+    from utils.model_registry import MODEL_CACHE
+
+    key = MODEL_CACHE.key(checkpoint_path, backend, device, **backend_kwargs)
+    return MODEL_CACHE.get(key, load)
+
+
+def evict_models(checkpoint_path=None, device=None, backend=None) -> int:
+    """
+    Releases cached models: all of them or only the ones of a checkpoint, device or backend
+    :return: Number of evicted models
+    """
+    from utils.model_registry import MODEL_CACHE
+
+    return MODEL_CACHE.evict(checkpoint_path, device, backend)
 
 
 def cleanup():
     """
-    Releases memory and collect garbage
+    Evicts all cached models (see `get_model(cache=True)`), releases memory and collect garbage.
+    Models still referenced elsewhere are freed once those references are gone
     """
-    gc.collect()
-    torch.cuda.empty_cache()
+    evict_models()
 
 
 def get_labels(path: str) -> List[str]:
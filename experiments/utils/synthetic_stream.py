@@ -0,0 +1,108 @@
+"""
+Synthetic dash-cam stream for testing live sources without a camera.
+
+Usage:
+    python utils/synthetic_stream.py --mode pipe | python ...     # MJPEG on stdout
+    python utils/synthetic_stream.py --mode http --port 8090      # http://127.0.0.1:8090/stream.mjpg
+"""
+
+import argparse
+import sys
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Iterator
+
+import cv2
+import numpy as np
+
+
+def synthetic_frames(
+    width: int = 1280, height: int = 720, fps: float = 30, frames: int = None
+) -> Iterator[np.ndarray]:
+    """
+    Generates frames of a road with a sign-like object moving to the right edge, paced in real time
+    :param width: Frame width
+    :param height: Frame height
+    :param fps: Frames per second
+    :param frames: Number of frames, infinite if not provided
+    :return: Iterator over BGR frames
+    """
+    background = np.full((height, width, 3), 110, dtype=np.uint8)
+    background[height // 2 :] = 70
+    cv2.line(
+        background, (width // 2, height // 2), (width // 4, height), (255, 255, 255), 4
+    )
+    start = time.monotonic()
+    i = 0
+    while frames is None or i < frames:
+        frame = background.copy()
+        t = (i % int(fps * 4)) / (fps * 4)
+        center = (int(width * (0.55 + 0.4 * t)), int(height * (0.4 - 0.2 * t)))
+        radius = int(10 + 50 * t)
+        cv2.circle(frame, center, radius, (0, 0, 220), -1)
+        cv2.circle(frame, center, int(radius * 0.7), (255, 255, 255), -1)
+        cv2.putText(frame, str(i), (20, 40), cv2.FONT_HERSHEY_SIMPLEX, 1, (0, 0, 0), 2)
+        # pace the stream like a real camera
+        delay = start + i / fps - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        yield frame
+        i += 1
+
+
+def encode(frame: np.ndarray, quality: int = 80) -> bytes:
+    return cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, quality])[1].tobytes()
+
+
+def serve_pipe(args: argparse.Namespace):
+    for frame in synthetic_frames(args.width, args.height, args.fps, args.frames):
+        sys.stdout.buffer.write(encode(frame))
+        sys.stdout.buffer.flush()
+
+
+def serve_http(args: argparse.Namespace):
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            self.send_response(200)
+            self.send_header(
+                "Content-Type", "multipart/x-mixed-replace; boundary=frame"
+            )
+            self.end_headers()
+            try:
+                for frame in synthetic_frames(
+                    args.width, args.height, args.fps, args.frames
+                ):
+                    jpeg = encode(frame)
+                    self.wfile.write(
+                        b"--frame\r\nContent-Type: image/jpeg\r\n"
+                        + f"Content-Length: {len(jpeg)}\r\n\r\n".encode()
+                        + jpeg
+                        + b"\r\n"
+                    )
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), Handler)
+    print(f"Streaming on http://127.0.0.1:{args.port}/stream.mjpg", file=sys.stderr)
+    server.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--mode", choices=["pipe", "http"], default="pipe")
+    parser.add_argument("--width", type=int, default=1280)
+    parser.add_argument("--height", type=int, default=720)
+    parser.add_argument("--fps", type=float, default=30)
+    parser.add_argument(
+        "--frames", type=int, help="Number of frames, infinite by default"
+    )
+    parser.add_argument("--port", type=int, default=8090)
+    args = parser.parse_args()
+    if args.mode == "pipe":
+        serve_pipe(args)
+    else:
+        serve_http(args)
+
+
+if __name__ == "__main__":
+    main()